@@ -0,0 +1,184 @@
+"""
+Controle de admissão e descarte de carga por classe de rota.
+
+Cada classe (prioridade, pesada, email, padrao) tem um limite próprio de
+requisições simultâneas e uma fila de espera limitada. Quando a fila está
+cheia, ou a espera passa do timeout, a requisição volta na hora com
+503 + Retry-After em vez de segurar um worker até estourar o tempo.
+"""
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+
+
+LIMITES_PADRAO = {
+    # classe: concorrência máxima, tamanho da fila, espera máxima na fila (s)
+    'prioridade': {'concorrencia': 16, 'fila': 64, 'timeout': 5.0},
+    'pesada': {'concorrencia': 4, 'fila': 8, 'timeout': 2.0},
+    'email': {'concorrencia': 2, 'fila': 4, 'timeout': 2.0},
+    'padrao': {'concorrencia': 16, 'fila': 32, 'timeout': 3.0},
+}
+
+ROTAS_PADRAO = {
+    'health_check': 'prioridade',
+    'api_health_alias': 'prioridade',
+    'metricas_sistema': 'prioridade',
+    'check_auth': 'prioridade',
+    'get_dashboard_stats': 'pesada',
+    'api_contratos_limpar': 'pesada',
+    'api_notificacoes_limpar': 'pesada',
+    'api_sistema_reset': 'pesada',
+    'enviar_notificacao': 'email',
+    'testar_email': 'email',
+    'api_test_email_send': 'email',
+}
+
+
+class Limite:
+    """Semáforo com fila limitada e métricas"""
+
+    def __init__(self, nome, concorrencia, fila, timeout):
+        self.nome = nome
+        self.concorrencia = concorrencia
+        self.max_fila = fila
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._em_execucao = 0
+        self._na_fila = 0
+        self._pico_fila = 0
+        self._admitidos = 0
+        self._rejeitados_fila_cheia = 0
+        self._rejeitados_timeout = 0
+        self._espera_total = 0.0
+
+    def adquirir(self):
+        """Tenta ocupar uma vaga; retorna False se a requisição deve ser descartada"""
+        with self._cond:
+            if self._em_execucao < self.concorrencia and self._na_fila == 0:
+                self._em_execucao += 1
+                self._admitidos += 1
+                return True
+
+            if self._na_fila >= self.max_fila:
+                self._rejeitados_fila_cheia += 1
+                return False
+
+            self._na_fila += 1
+            self._pico_fila = max(self._pico_fila, self._na_fila)
+            inicio = time.monotonic()
+            limite = inicio + self.timeout
+            try:
+                while self._em_execucao >= self.concorrencia:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._rejeitados_timeout += 1
+                        return False
+                    self._cond.wait(restante)
+            finally:
+                self._na_fila -= 1
+                self._espera_total += time.monotonic() - inicio
+
+            self._em_execucao += 1
+            self._admitidos += 1
+            return True
+
+    def liberar(self):
+        with self._cond:
+            self._em_execucao -= 1
+            self._cond.notify()
+
+    def retry_after(self):
+        """Sugestão de espera (s) para o cliente, proporcional ao tamanho da fila"""
+        return max(1, int(self.timeout * (1 + self._na_fila / max(1, self.concorrencia))))
+
+    def metricas(self):
+        with self._cond:
+            return {
+                'concorrencia': self.concorrencia,
+                'max_fila': self.max_fila,
+                'em_execucao': self._em_execucao,
+                'na_fila': self._na_fila,
+                'pico_fila': self._pico_fila,
+                'admitidos': self._admitidos,
+                'rejeitados_fila_cheia': self._rejeitados_fila_cheia,
+                'rejeitados_timeout': self._rejeitados_timeout,
+                'espera_total_s': round(self._espera_total, 3),
+            }
+
+
+class Politica:
+    """Limites e classificação das rotas de uma aplicação (em app.extensions['admissao'])"""
+
+    def __init__(self, limites, rotas):
+        self.limites = {nome: Limite(nome, **params) for nome, params in limites.items()}
+        self.rotas = dict(rotas)
+
+    def classe(self, endpoint, path):
+        # Endpoints de blueprint vêm como 'blueprint.funcao'
+        nome = (endpoint or '').rpartition('.')[2]
+        if nome in self.rotas:
+            return self.rotas[nome]
+        if path.startswith('/api/'):
+            return 'padrao'
+        return None
+
+    def metricas(self):
+        return {nome: limite.metricas() for nome, limite in self.limites.items()}
+
+
+class ControleAdmissao:
+    """
+    Extensão Flask: classifica cada rota /api/ e aplica o limite da classe; a
+    Politica de cada aplicação fica em app.extensions['admissao']
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMISSAO_ATIVA', True)
+        app.config.setdefault('ADMISSAO_LIMITES', LIMITES_PADRAO)
+        app.config.setdefault('ADMISSAO_ROTAS', ROTAS_PADRAO)
+
+        app.extensions['admissao'] = Politica(app.config['ADMISSAO_LIMITES'], app.config['ADMISSAO_ROTAS'])
+
+        # Precisa rodar antes dos outros before_request (log, sessão...)
+        app.before_request_funcs.setdefault(None, []).insert(0, self._admitir)
+        app.teardown_request(self._liberar)
+
+    @staticmethod
+    def atual():
+        return current_app.extensions['admissao']
+
+    def classe(self, endpoint, path):
+        return self.atual().classe(endpoint, path)
+
+    def _admitir(self):
+        if not current_app.config['ADMISSAO_ATIVA']:
+            return None
+
+        limite = self.atual().limites.get(self.classe(request.endpoint, request.path))
+        if limite is None:
+            return None
+
+        if not limite.adquirir():
+            resposta = jsonify({
+                'success': False,
+                'message': 'Servidor sobrecarregado, tente novamente em instantes'
+            })
+            resposta.status_code = 503
+            resposta.headers['Retry-After'] = str(limite.retry_after())
+            return resposta
+
+        g.limite_admissao = limite
+        return None
+
+    def _liberar(self, exc=None):
+        limite = g.pop('limite_admissao', None)
+        if limite is not None:
+            limite.liberar()
+
+    def metricas(self):
+        return self.atual().metricas()
@@ -1,37 +1,57 @@
-from flask import Flask, request, jsonify, session, send_from_directory
+import sys
+
+# `python app.py serve [...]`: servidor de produção (ver servidor.py). Despachado antes
+# dos imports da aplicação: o mestre não carrega nenhum módulo dela, então cada worker
+# importa tudo do disco e o SIGHUP relê app.py e os módulos que ele usa
+if __name__ == '__main__' and sys.argv[1:2] == ['serve']:
+    import servidor
+    servidor.main(sys.argv[2:])
+    sys.exit(0)
+
+from flask import Blueprint, Flask, current_app, request, jsonify, session
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import os
 import smtplib
 import sqlite3
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from functools import wraps
 import logging
-import hashlib
 import json
 
+import senhas
+from admissao import ControleAdmissao
+from coalescencia import Coalescedor
+import metricas
+from rastreador_sql import RastreadorSQL
+from perfilador import Perfilador
+import log_estruturado
+import serializacao
+from estaticos import Estaticos
+from compressao import Compressao
+from escritor import Escritor, EscritorOcupado
+from leitura import PoolLeitura
+from retencao import Retencao, caminho_arquivo, excluir_arquivadas
+from exclusao import Exclusoes
+from idempotencia import Idempotencia
+from vencimento import Vencimentos, reativar_contrato, vencer_contrato
+from armazenamento import Armazenamento, semear_ids, usando
+import backup
+from serializacao import CampoInvalido, Formato
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PUBLIC_DIR = os.path.join(BASE_DIR, 'public')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 
 
-# Configuração do logging
-logging.basicConfig(level=logging.INFO)
+# Logging: o handler (fila + thread de escrita, JSON) é ligado em create_app
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__, static_folder=None)  # HTML puro em /public (sem conflito de rotas)
-CORS(app, supports_credentials=True)
-
-# Configurações de SESSÃO
-app.config['SECRET_KEY'] = 'contrato-mais-secret-key-2024'
-app.config['SESSION_COOKIE_NAME'] = 'contrato_mais_session'
-app.config['SESSION_COOKIE_SECURE'] = False
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)
-
-# Inicializar Session
+# Rotas ficam no blueprint; a aplicação é montada em create_app()
+bp = Blueprint('contrato', __name__)
 
 # Configurações do Email
 EMAIL_CONFIG = {
@@ -42,58 +62,338 @@ EMAIL_CONFIG = {
     'use_tls': True
 }
 
-# Configurações do banco de dados
-DATABASE = os.path.join(DATA_DIR, 'contratos.db')
+# Configuração padrão da aplicação (sobrescrita pelo dict passado a create_app)
+CONFIG_PADRAO = {
+    # Sessão
+    'SECRET_KEY': 'contrato-mais-secret-key-2024',
+    'SESSION_COOKIE_NAME': 'contrato_mais_session',
+    'SESSION_COOKIE_SECURE': False,
+    'SESSION_COOKIE_HTTPONLY': True,
+    'SESSION_COOKIE_SAMESITE': 'Lax',
+    'PERMANENT_SESSION_LIFETIME': timedelta(days=1),
+
+    # Arquivos públicos: só o que está em public/ (nunca a raiz do projeto)
+    'ESTATICOS_DIR': PUBLIC_DIR,
+
+    # Banco de dados e email
+    'DATABASE': os.path.join(DATA_DIR, 'contratos.db'),
+    'EMAIL_CONFIG': EMAIL_CONFIG,
+
+    # Hash de senhas (custo = iterações do PBKDF2 ou expoente do scrypt)
+    'SENHA_ALGORITMO': os.environ.get('SENHA_ALGORITMO', 'pbkdf2-sha256'),
+    'SENHA_CUSTO': int(os.environ.get('SENHA_CUSTO', 0)) or None,
+    'SENHA_POOL_WORKERS': int(os.environ.get('SENHA_POOL_WORKERS', 2)),
+    'SENHA_POOL_FILA': int(os.environ.get('SENHA_POOL_FILA', 32)),
+
+    # Rastreamento de SQL (SQL_TRACE_HEADER_ATIVO libera o header X-Debug-SQL: 1)
+    'SQL_TRACE': os.environ.get('SQL_TRACE') == '1',
+    'SQL_TRACE_HEADER_ATIVO': os.environ.get('SQL_TRACE_HEADER_ATIVO') == '1',
+
+    # Profiler (arquivos .pstats/.folded rotativos em PERFIL_DIR)
+    'PERFIL_DIR': os.path.join(DATA_DIR, 'perfis'),
+    'PERFIL_AMOSTRAGEM': float(os.environ.get('PERFIL_AMOSTRAGEM', 0)),
+
+    # Logging (sucessos amostrados; erros e lentas sempre registrados)
+    'LOG_NIVEL': os.environ.get('LOG_NIVEL', 'INFO'),
+    'LOG_AMOSTRAGEM': float(os.environ.get('LOG_AMOSTRAGEM', 0.1)),
+    'LOG_LENTA_MS': float(os.environ.get('LOG_LENTA_MS', 500)),
+
+    # Listas com mais linhas que isso saem em streaming, um lote por vez
+    'STREAMING_LOTE': int(os.environ.get('STREAMING_LOTE', 500)),
+
+    # Sincronização incremental: tombstones de contratos excluídos ficam esse tempo no log
+    'MUDANCAS_RETENCAO_DIAS': int(os.environ.get('MUDANCAS_RETENCAO_DIAS', 30)),
+
+    # Escritas serializadas numa thread por banco, com group commit (ver escritor.py)
+    'ESCRITA_ATIVA': os.environ.get('ESCRITA_ATIVA', '1') == '1',
+    'ESCRITA_JANELA_MS': float(os.environ.get('ESCRITA_JANELA_MS', 1.0)),
+
+    # GETs leem de um pool de conexões somente leitura (mode=ro, ver leitura.py)
+    'LEITURA_ATIVA': os.environ.get('LEITURA_ATIVA', '1') == '1',
+    'LEITURA_POOL': int(os.environ.get('LEITURA_POOL', 8)),
+
+    # Notificações antigas vão para <banco>-arquivo.db (ver retencao.py); 0 dias = guardar tudo
+    'RETENCAO_ATIVA': os.environ.get('RETENCAO_ATIVA', '1') == '1',
+    'RETENCAO_DIAS': int(os.environ.get('RETENCAO_DIAS', 180)),
+    'RETENCAO_INTERVALO': int(os.environ.get('RETENCAO_INTERVALO', 3600)),
+
+    # Respostas guardadas por Idempotency-Key (ver idempotencia.py)
+    'IDEMPOTENCIA_ATIVA': os.environ.get('IDEMPOTENCIA_ATIVA', '1') == '1',
+    'IDEMPOTENCIA_TTL': int(os.environ.get('IDEMPOTENCIA_TTL', 86400)),
+
+    # Vencimento dos contratos em segundo plano (ver vencimento.py)
+    'VENCIMENTO_ATIVO': os.environ.get('VENCIMENTO_ATIVO', '1') == '1',
+    'VENCIMENTO_INTERVALO': int(os.environ.get('VENCIMENTO_INTERVALO', 3600)),
+
+    # Armazenamento: sqlite (um arquivo), fragmentado (catálogo + N arquivos) ou memoria
+    'ARMAZENAMENTO': os.environ.get('ARMAZENAMENTO', 'sqlite'),
+    'ARMAZENAMENTO_FRAGMENTOS': int(os.environ.get('ARMAZENAMENTO_FRAGMENTOS', 4)),
+
+    # Backup online de todos os bancos em BACKUP_DIR, com rotação (ver backup.py)
+    'BACKUP_ATIVO': os.environ.get('BACKUP_ATIVO') == '1',
+    'BACKUP_DIR': os.environ.get('BACKUP_DIR', os.path.join(DATA_DIR, 'backups')),
+    'BACKUP_INTERVALO': int(os.environ.get('BACKUP_INTERVALO', 86400)),
+    'BACKUP_MANTER': int(os.environ.get('BACKUP_MANTER', 7)),
+
+    # Compressão das respostas da API
+    'COMPRESSAO_MINIMO': int(os.environ.get('COMPRESSAO_MINIMO', 1024)),
+    'COMPRESSAO_NIVEL': int(os.environ.get('COMPRESSAO_NIVEL', 6)),
+}
+
+# Controle de admissão por classe de rota (limites em admissao.LIMITES_PADRAO)
+controle_admissao = ControleAdmissao()
+
+# Coalescência (single-flight) de GETs idênticos do mesmo usuário
+coalescedor = Coalescedor()
+
+# Métricas Prometheus em /metrics (latência por endpoint, SQL, SMTP, caches)
+metricas_http = metricas.Metricas()
+
+# Rastreamento de SQL por requisição (N+1, queries lentas); ver rastreador_sql.py
+rastreador_sql = RastreadorSQL()
+
+# Profiler sob demanda (header X-Profile de admin, rotas fixas ou amostragem)
+perfilador = Perfilador()
 
-def get_db_connection():
-    """Conecta ao banco de dados SQLite"""
-    conn = sqlite3.connect(DATABASE)
+# Log estruturado assíncrono com resumo amostrado das requisições
+log_requisicoes = log_estruturado.LogRequisicoes()
+
+# Páginas e scripts servidos da memória, pré-comprimidos e com ETag
+estaticos = Estaticos()
+
+# Compressão das respostas JSON (gzip/brotli), inclusive em streaming
+compressao = Compressao()
+
+# ========== BANCO DE DADOS ==========
+# Versão do esquema gravada em PRAGMA user_version. Na primeira conexão de cada
+# processo basta ler esse número para saber se o esquema está em dia. O banco
+# fica em WAL: leituras (pool somente leitura) não esperam o escritor.
+SCHEMA_VERSAO = 8
+
+# Valor de PRAGMA auto_vacuum esperado no banco principal (ver retencao.py)
+AUTO_VACUUM_INCREMENTAL = 2
+
+_bancos_prontos = set()
+_bancos_lock = threading.Lock()
+
+# Banco de cada usuário: um arquivo só, fragmentos ou memória (ver armazenamento.py)
+armazenamento = Armazenamento()
+
+def _caminho_banco(catalogo=False):
+    """Banco do usuário logado; sem usuário, ou com catalogo=True (tabela usuario), o catálogo"""
+    return armazenamento.caminho_atual(catalogo)
+
+def _conectar(caminho):
+    conn = sqlite3.connect(caminho, factory=metricas.ConexaoInstrumentada, uri=caminho.startswith('file:'))
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')  # exclusões em cascata (notificações, destinatários)
     return conn
 
+def _conectar_escritor(caminho):
+    # Conexões de escrita enxergam também o banco de arquivo (retenção)
+    return retencao.anexar(_conectar(caminho), caminho)
+
+# Escritor único: transações de escrita passam pela fila (uma thread por banco)
+escritor = Escritor(_conectar_escritor)
+
+def escrever(funcao, *args):
+    """Roda `funcao(conn, *args)` numa transação do escritor único e devolve o resultado"""
+    caminho = _caminho_banco()
+    if caminho not in _bancos_prontos:
+        inicializar_banco(caminho)
+    return escritor.executar(caminho, funcao, *args)
+
+def escrever_catalogo(funcao, *args):
+    """escrever() no catálogo, onde fica a tabela usuario, seja qual for o banco do usuário"""
+    with usando(_caminho_banco(catalogo=True)):
+        return escrever(funcao, *args)
+
+# Retenção: notificações antigas vão em lotes para o banco de arquivo
+retencao = Retencao(escrever)
+
+# Limpezas em massa: jobs em segundo plano, em lotes (ver exclusao.py)
+exclusoes = Exclusoes(escrever)
+
+# Contratos ativos com data_fim no passado passam a 'vencido' (ver vencimento.py)
+vencimentos = Vencimentos(escrever)
+
+# Pool de conexões somente leitura para os GETs
+leitura = PoolLeitura()
+
+# Backups online agendados de todos os bancos (API de backup do SQLite)
+backups = backup.Backups()
+
+def get_db_leitura(snapshot=False, catalogo=False):
+    """
+    Conexão somente leitura (mode=ro, query_only) do pool; close() a devolve.
+    Com snapshot=True as consultas rodam numa única transação de leitura.
+    """
+    caminho = _caminho_banco(catalogo)
+    if caminho not in _bancos_prontos:
+        inicializar_banco(caminho)
+    if not current_app.config['LEITURA_ATIVA']:
+        conn = _conectar(caminho)
+        if snapshot:
+            conn.execute('BEGIN')
+        return conn
+    return leitura.obter(caminho, snapshot)
+
+def get_db_arquivo():
+    """Conexão somente leitura ao banco de arquivo da retenção (None se ainda não existe)"""
+    caminho = caminho_arquivo(_caminho_banco())
+    if not os.path.exists(caminho):
+        return None
+    if not current_app.config['LEITURA_ATIVA']:
+        return _conectar(caminho)
+    return leitura.obter(caminho)
+
+# Idempotency-Key nos POSTs com efeito colateral (criar contrato, notificar)
+idempotencia = Idempotencia(escrever, get_db_leitura)
+
+def _executar_sql(conn, sql, parametros=()):
+    """Tarefa de escrita de um único comando; devolve as linhas afetadas"""
+    return conn.execute(sql, parametros).rowcount
+
+def inicializar_banco(caminho):
+    """Cria o diretório e as tabelas se a versão do esquema estiver desatualizada"""
+    with _bancos_lock:
+        if caminho in _bancos_prontos:
+            return
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        conn = _conectar(caminho)
+        if not conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0]:
+            # Banco novo: INCREMENTAL (a retenção devolve as páginas livres aos poucos)
+            # só vale se vier antes da primeira tabela e da troca para WAL. Bancos
+            # que já existem são convertidos por `python app.py vacuum`.
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        elif conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            logger.warning(f"{caminho} sem auto_vacuum=INCREMENTAL: a retenção não devolve espaço "
+                           f"ao disco; rode `python app.py vacuum` numa janela de manutenção")
+        if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+            try:
+                conn.execute('PRAGMA journal_mode = WAL')  # persistente no arquivo
+            except sqlite3.OperationalError:
+                pass  # outro processo está trocando o modo ao mesmo tempo
+        versao = conn.execute('PRAGMA user_version').fetchone()[0]
+        conn.close()
+        if versao < SCHEMA_VERSAO:
+            criar_tabelas(caminho)
+            conn = _conectar(caminho)
+            versao = conn.execute('PRAGMA user_version').fetchone()[0]
+            conn.close()
+        if versao >= SCHEMA_VERSAO:
+            _bancos_prontos.add(caminho)
+
+def ativar_auto_vacuum(caminho):
+    """
+    Converte um banco existente para auto_vacuum=INCREMENTAL; devolve False se
+    ele já estava. O VACUUM reescreve o arquivo inteiro e segura a trava de
+    escrita até o fim: só pela linha de comando, nunca numa requisição.
+    """
+    conn = _conectar(caminho)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+            return False
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+    finally:
+        conn.close()
+
+def get_db_connection(catalogo=False):
+    """Conecta ao banco de dados SQLite (inicializa o esquema na primeira vez)"""
+    caminho = _caminho_banco(catalogo)
+    if caminho not in _bancos_prontos:
+        inicializar_banco(caminho)
+    return _conectar(caminho)
+
 def verificar_banco_dados():
     """
-    Verifica se o banco de dados existe e cria as tabelas se necessário
+    Verifica se o banco de dados existe e se o esquema está na versão atual.
+    Usa apenas PRAGMA user_version e sqlite_master (sem COUNT(*) nas tabelas).
     """
+    caminho = _caminho_banco()
     print("=" * 60)
     print("VERIFICAÇÃO DO BANCO DE DADOS - CONTRATO+")
     print("=" * 60)
     
-    if not os.path.exists(DATABASE):
-        print(f"📦 Criando banco de dados: {DATABASE}")
-        criar_tabelas()
+    if not os.path.exists(caminho):
+        print(f"📦 Criando banco de dados: {caminho}")
     else:
-        print(f"✅ Banco de dados encontrado: {DATABASE}")
+        print(f"✅ Banco de dados encontrado: {caminho}")
+    
+    try:
+        inicializar_banco(caminho)
+        conn = _conectar(caminho)
+        versao = conn.execute('PRAGMA user_version').fetchone()[0]
+        tabelas = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
+        ).fetchall()
+        conn.close()
         
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
-            tabelas = cursor.fetchall()
-            
-            if tabelas:
-                print("📋 Tabelas encontradas:")
-                for tabela in tabelas:
-                    tabela_nome = tabela[0]
-                    try:
-                        cursor.execute(f"SELECT COUNT(*) as total FROM [{tabela_nome}]")
-                        total = cursor.fetchone()[0]
-                        print(f"   • {tabela_nome}: {total} registros")
-                    except Exception as e:
-                        print(f"   • {tabela_nome}: erro ao acessar - {str(e)}")
-            
-            conn.close()
-            
-        except Exception as e:
-            print(f"⚠️ Erro ao verificar tabelas: {str(e)}")
+        print(f"📌 Versão do esquema: {versao} (esperada: {SCHEMA_VERSAO})")
+        if tabelas:
+            print("📋 Tabelas encontradas: " + ", ".join(t[0] for t in tabelas))
+    except Exception as e:
+        print(f"⚠️ Erro ao verificar tabelas: {str(e)}")
     
     print("=" * 60)
 
-def criar_tabelas():
-    """Cria as tabelas no banco de dados"""
+# Tabelas com chave estrangeira em cascata; {nome} permite recriá-las na migração
+DDL_NOTIFICACAO = '''
+    CREATE TABLE IF NOT EXISTS {nome} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        contrato_id INTEGER NOT NULL,
+        tipo TEXT NOT NULL,
+        assunto TEXT NOT NULL,
+        mensagem TEXT,
+        email_destino TEXT NOT NULL,
+        status TEXT DEFAULT 'pendente',
+        data_envio TIMESTAMP,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (contrato_id) REFERENCES contrato (id) ON DELETE CASCADE
+    )
+'''
+
+DDL_NOTIFICACAO_DESTINATARIO = '''
+    CREATE TABLE IF NOT EXISTS {nome} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        notificacao_id INTEGER NOT NULL,
+        usuario_id INTEGER NOT NULL,
+        email TEXT NOT NULL,
+        status TEXT DEFAULT 'pendente',
+        FOREIGN KEY (notificacao_id) REFERENCES notificacao (id) ON DELETE CASCADE
+    )
+'''
+
+def _recriar_com_cascata(cursor, tabela, ddl):
+    """
+    SQLite não altera chaves estrangeiras: recria `tabela` pelo DDL novo copiando
+    as linhas. Índices e triggers da tabela antiga somem e são recriados depois.
+    O contador do AUTOINCREMENT é preservado: ids já arquivados não voltam a ser usados.
+    """
+    chaves = cursor.execute(f'PRAGMA foreign_key_list({tabela})').fetchall()
+    if not chaves or all(c['on_delete'] == 'CASCADE' for c in chaves):
+        return False
+    colunas = ', '.join(c['name'] for c in cursor.execute(f'PRAGMA table_info({tabela})').fetchall())
+    cursor.executescript(f'''
+        BEGIN;
+        {ddl.format(nome=tabela + '_nova')};
+        INSERT INTO {tabela}_nova ({colunas}) SELECT {colunas} FROM {tabela};
+        UPDATE sqlite_sequence SET seq = (SELECT seq FROM sqlite_sequence WHERE name = '{tabela}')
+            WHERE name = '{tabela}_nova' AND EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = '{tabela}');
+        DROP TABLE {tabela};
+        ALTER TABLE {tabela}_nova RENAME TO {tabela};
+        COMMIT;
+    ''')
+    return True
+
+def criar_tabelas(caminho=None):
+    """Cria as tabelas no banco de dados e grava a versão do esquema"""
     try:
-        conn = get_db_connection()
+        caminho = caminho or _caminho_banco()
+        conn = _conectar(caminho)
+        conn.execute('PRAGMA foreign_keys = OFF')  # recriar tabelas não pode disparar as cascatas
         cursor = conn.cursor()
         
         # Tabela de usuários
@@ -103,7 +403,8 @@ def criar_tabelas():
                 nome_completo TEXT NOT NULL,
                 email TEXT UNIQUE NOT NULL,
                 senha_hash TEXT NOT NULL,
-                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                admin INTEGER NOT NULL DEFAULT 0
             )
         ''')
         
@@ -124,33 +425,187 @@ def criar_tabelas():
         ''')
         
         # Tabela de notificações
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notificacao (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cursor.execute(DDL_NOTIFICACAO.format(nome='notificacao'))
+        
+        # v5: notificações e destinatários antigos são recriados com ON DELETE
+        # CASCADE (antes das etapas abaixo, que recriam os índices)
+        _recriar_com_cascata(cursor, 'notificacao', DDL_NOTIFICACAO)
+        _recriar_com_cascata(cursor, 'notificacao_destinatario', DDL_NOTIFICACAO_DESTINATARIO)
+        
+        # v2: log de mudanças dos contratos para a sincronização incremental
+        # (/api/contratos/changes). Cada contrato guarda só a última operação;
+        # exclusões viram tombstones até a compactação (compactar_mudancas).
+        cursor.executescript('''
+            CREATE TABLE IF NOT EXISTS contrato_mudanca (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_id INTEGER NOT NULL,
                 contrato_id INTEGER NOT NULL,
+                operacao TEXT NOT NULL,
+                registrado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_contrato_mudanca_usuario_seq
+                ON contrato_mudanca (usuario_id, seq);
+            CREATE INDEX IF NOT EXISTS idx_contrato_mudanca_contrato
+                ON contrato_mudanca (contrato_id);
+
+            -- Maior seq já compactado por usuário: cursores abaixo dele exigem carga completa
+            CREATE TABLE IF NOT EXISTS contrato_mudanca_corte (
+                usuario_id INTEGER PRIMARY KEY,
+                seq INTEGER NOT NULL
+            );
+
+            CREATE TRIGGER IF NOT EXISTS trg_contrato_mudanca_insert AFTER INSERT ON contrato
+            BEGIN
+                DELETE FROM contrato_mudanca WHERE contrato_id = NEW.id;
+                INSERT INTO contrato_mudanca (usuario_id, contrato_id, operacao)
+                VALUES (NEW.usuario_id, NEW.id, 'upsert');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_contrato_mudanca_update AFTER UPDATE ON contrato
+            BEGIN
+                DELETE FROM contrato_mudanca WHERE contrato_id = NEW.id;
+                INSERT INTO contrato_mudanca (usuario_id, contrato_id, operacao)
+                VALUES (NEW.usuario_id, NEW.id, 'upsert');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_contrato_mudanca_delete AFTER DELETE ON contrato
+            BEGIN
+                DELETE FROM contrato_mudanca WHERE contrato_id = OLD.id;
+                INSERT INTO contrato_mudanca (usuario_id, contrato_id, operacao)
+                VALUES (OLD.usuario_id, OLD.id, 'delete');
+            END;
+
+            -- Contratos anteriores ao log entram como criados, para que todo
+            -- usuário com contratos tenha um cursor
+            INSERT INTO contrato_mudanca (usuario_id, contrato_id, operacao)
+            SELECT usuario_id, id, 'upsert' FROM contrato
+            WHERE id NOT IN (SELECT contrato_id FROM contrato_mudanca)
+            ORDER BY id;
+        ''')
+
+        # v3: um registro por destinatário de notificação (antes só a lista
+        # email_destino separada por vírgulas). usuario_id é copiado do contrato
+        # para que contagens e buscas por usuário fiquem nos índices.
+        cursor.execute(DDL_NOTIFICACAO_DESTINATARIO.format(nome='notificacao_destinatario'))
+        cursor.executescript('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_notificacao_destinatario_notificacao
+                ON notificacao_destinatario (notificacao_id, email);
+            CREATE INDEX IF NOT EXISTS idx_notificacao_destinatario_usuario_email
+                ON notificacao_destinatario (usuario_id, email, notificacao_id);
+            CREATE INDEX IF NOT EXISTS idx_notificacao_destinatario_email
+                ON notificacao_destinatario (email, notificacao_id);
+            CREATE INDEX IF NOT EXISTS idx_notificacao_contrato
+                ON notificacao (contrato_id);
+
+            -- Notificações antigas: separa email_destino nas vírgulas
+            WITH RECURSIVE partes (notificacao_id, usuario_id, status, email, resto) AS (
+                SELECT n.id, c.usuario_id, n.status, '', n.email_destino || ','
+                FROM notificacao n
+                JOIN contrato c ON n.contrato_id = c.id
+                WHERE n.id NOT IN (SELECT notificacao_id FROM notificacao_destinatario)
+                UNION ALL
+                SELECT notificacao_id, usuario_id, status,
+                       lower(trim(substr(resto, 1, instr(resto, ',') - 1))),
+                       substr(resto, instr(resto, ',') + 1)
+                FROM partes
+                WHERE resto <> ''
+            )
+            INSERT OR IGNORE INTO notificacao_destinatario (notificacao_id, usuario_id, email, status)
+            SELECT notificacao_id, usuario_id, email, status
+            FROM partes
+            WHERE email <> ''
+            ORDER BY notificacao_id;
+        ''')
+
+        # v4: política de retenção por usuário (sem linha = RETENCAO_DIAS; 0 = guardar
+        # tudo) e índice por data para achar as notificações vencidas
+        cursor.executescript('''
+            CREATE TABLE IF NOT EXISTS retencao_politica (
+                usuario_id INTEGER PRIMARY KEY,
+                dias INTEGER NOT NULL,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_notificacao_criado_em
+                ON notificacao (criado_em);
+        ''')
+
+        # v5: jobs de exclusão em lotes (exclusao.py); índice por usuário para
+        # que cada lote ache os contratos sem varrer a tabela
+        cursor.executescript('''
+            DROP TRIGGER IF EXISTS trg_notificacao_destinatario_delete;
+            CREATE INDEX IF NOT EXISTS idx_contrato_usuario
+                ON contrato (usuario_id);
+
+            CREATE TABLE IF NOT EXISTS exclusao_job (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_id INTEGER NOT NULL,
                 tipo TEXT NOT NULL,
-                assunto TEXT NOT NULL,
-                mensagem TEXT,
-                email_destino TEXT NOT NULL,
-                status TEXT DEFAULT 'pendente',
-                data_envio TIMESTAMP,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                total INTEGER NOT NULL DEFAULT 0,
+                removidos INTEGER NOT NULL DEFAULT 0,
+                erro TEXT,
                 criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (contrato_id) REFERENCES contrato (id)
-            )
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                concluido_em TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_exclusao_job_usuario
+                ON exclusao_job (usuario_id, status);
+        ''')
+
+        # v6: primeira resposta de cada Idempotency-Key (idempotencia.py);
+        # criado_em/expira_em em segundos Unix
+        cursor.executescript('''
+            CREATE TABLE IF NOT EXISTS idempotencia (
+                usuario_id INTEGER NOT NULL,
+                chave TEXT NOT NULL,
+                impressao TEXT NOT NULL,
+                status TEXT NOT NULL,
+                codigo INTEGER,
+                headers TEXT,
+                corpo BLOB,
+                criado_em INTEGER NOT NULL,
+                expira_em INTEGER NOT NULL,
+                UNIQUE (usuario_id, chave)
+            );
+            CREATE INDEX IF NOT EXISTS idx_idempotencia_expira_em
+                ON idempotencia (expira_em);
         ''')
+
+        # v7: status 'vencido' mantido em segundo plano (vencimento.py). O UPDATE
+        # do ciclo usa (status, data_fim); o dashboard conta por usuário e status,
+        # e o índice novo cobre também o antigo idx_contrato_usuario
+        cursor.executescript('''
+            CREATE INDEX IF NOT EXISTS idx_contrato_status_data_fim
+                ON contrato (status, data_fim);
+            CREATE INDEX IF NOT EXISTS idx_contrato_usuario_status
+                ON contrato (usuario_id, status, data_fim);
+            DROP INDEX IF EXISTS idx_contrato_usuario;
+        ''')
+        
+        # v8: papel de administrador (backups, profiler) numa coluna em vez do email,
+        # que o próprio usuário pode trocar; na migração o admin é o usuário padrão
+        if 'admin' not in [c['name'] for c in cursor.execute('PRAGMA table_info(usuario)').fetchall()]:
+            cursor.execute('ALTER TABLE usuario ADD COLUMN admin INTEGER NOT NULL DEFAULT 0')
+            cursor.execute("UPDATE usuario SET admin = 1 WHERE email = 'admin@contratomais.com'")
+        
+        # Fragmentos: contadores AUTOINCREMENT na faixa do fragmento; usuários ficam no catálogo
+        inicio_ids = armazenamento.inicio_ids(caminho)
+        if inicio_ids:
+            semear_ids(cursor, inicio_ids)
         
         # Verificar se existe usuário admin
         cursor.execute("SELECT COUNT(*) as total FROM usuario WHERE email = 'admin@contratomais.com'")
         total = cursor.fetchone()[0]
         
-        if total == 0:
-            senha_hash = hashlib.sha256('admin123'.encode()).hexdigest()
+        if total == 0 and not inicio_ids:
+            senha_hash = hash_senha('admin123')
             cursor.execute(
-                'INSERT INTO usuario (nome_completo, email, senha_hash) VALUES (?, ?, ?)',
+                'INSERT INTO usuario (nome_completo, email, senha_hash, admin) VALUES (?, ?, ?, 1)',
                 ('Administrador', 'admin@contratomais.com', senha_hash)
             )
             print("✅ Usuário admin criado: admin@contratomais.com / admin123")
         
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSAO}')
         conn.commit()
         conn.close()
         
@@ -160,12 +615,16 @@ def criar_tabelas():
         print(f"❌ Erro ao criar tabelas: {str(e)}")
 
 def hash_senha(senha):
-    """Gera hash da senha usando SHA-256"""
-    return hashlib.sha256(senha.encode()).hexdigest()
+    """Gera hash da senha com o algoritmo configurado (roda no pool de hash)"""
+    return current_app.extensions['senhas'].gerar_hash(senha)
 
 def verificar_senha(senha, senha_hash):
-    """Verifica se a senha corresponde ao hash"""
-    return hash_senha(senha) == senha_hash
+    """Verifica se a senha corresponde ao hash (aceita todos os formatos conhecidos)"""
+    return current_app.extensions['senhas'].verificar(senha, senha_hash)
+
+def senha_precisa_rehash(senha_hash):
+    """Indica se o hash está num formato ou custo antigo e deve ser regerado"""
+    return current_app.extensions['senhas'].precisa_rehash(senha_hash)
 
 # ========== DECORATORS E HELPERS ==========
 def login_required(f):
@@ -180,7 +639,7 @@ require_login = login_required  # alias compatível
 
 def get_usuario_atual():
     if 'usuario_id' in session:
-        conn = get_db_connection()
+        conn = get_db_leitura(catalogo=True)
         usuario = conn.execute('SELECT * FROM usuario WHERE id = ?', (session['usuario_id'],)).fetchone()
         conn.close()
         return usuario
@@ -492,12 +951,17 @@ def criar_template_email(assunto, titulo, mensagem, tipo_notificacao=None, contr
     
     return html
 
-def enviar_email(destinatarios, assunto, corpo_html, corpo_texto=None):
-    """Envia email usando Gmail SMTP com design moderno"""
+def enviar_email(destinatarios, assunto, corpo_html, corpo_texto=None, recusados=None):
+    """
+    Envia email usando Gmail SMTP com design moderno. Se `recusados` (um set)
+    for passado, recebe os destinatários que o servidor SMTP recusou.
+    """
+    inicio = None
     try:
+        email_config = current_app.config['EMAIL_CONFIG']
         msg = MIMEMultipart('alternative')
         msg['Subject'] = assunto
-        msg['From'] = f'CONTRATO+ <{EMAIL_CONFIG["sender_email"]}>'
+        msg['From'] = f'CONTRATO+ <{email_config["sender_email"]}>'
         
         if isinstance(destinatarios, list):
             msg['To'] = ', '.join(destinatarios)
@@ -513,20 +977,26 @@ def enviar_email(destinatarios, assunto, corpo_html, corpo_texto=None):
         part2 = MIMEText(corpo_html, 'html')
         msg.attach(part2)
         
-        server = smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'])
+        inicio = time.perf_counter()
+        server = smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port'])
         server.ehlo()
         
-        if EMAIL_CONFIG['use_tls']:
+        if email_config['use_tls']:
             server.starttls()
         
-        server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
-        server.send_message(msg)
+        server.login(email_config['sender_email'], email_config['sender_password'])
+        recusas = server.send_message(msg)
         server.quit()
+        if recusados is not None:
+            recusados.update(recusas)
+        metricas.smtp_latencia.observar(time.perf_counter() - inicio, 'enviado')
         
         logger.info(f"Email enviado para {destinatarios}")
         return True
         
     except Exception as e:
+        if inicio is not None:
+            metricas.smtp_latencia.observar(time.perf_counter() - inicio, 'erro')
         logger.error(f"Erro ao enviar email: {str(e)}")
         return False
 
@@ -552,67 +1022,68 @@ PAGINAS_PROTEGIDAS = {
 }
 
 def _serve_public(filename: str):
-    """Serve arquivos da pasta /public. Se a página for protegida, exige sessão."""
-    if filename in PAGINAS_PROTEGIDAS and 'usuario_id' not in session:
+    """Serve arquivos públicos (da memória, ver estaticos.py). Se a página for protegida, exige sessão."""
+    protegida = filename in PAGINAS_PROTEGIDAS
+    if protegida and 'usuario_id' not in session:
         filename = 'index.html'
-    return send_from_directory(PUBLIC_DIR, filename)
+    return estaticos.servir(filename, vary_cookie=protegida)
 
-@app.route('/')
+@bp.route('/')
 def serve_index():
     if 'usuario_id' in session:
-        return send_from_directory(PUBLIC_DIR, 'dashboard.html')
-    return send_from_directory(PUBLIC_DIR, 'index.html')
+        return estaticos.servir('dashboard.html', vary_cookie=True)
+    return estaticos.servir('index.html', vary_cookie=True)
 
 # Rotas explícitas (.html) – evita 404 mesmo se o catch-all falhar
-@app.route('/dashboard.html')
+@bp.route('/dashboard.html')
 def dashboard_html():
     return _serve_public('dashboard.html')
 
-@app.route('/contratos.html')
+@bp.route('/contratos.html')
 def contratos_html():
     return _serve_public('contratos.html')
 
-@app.route('/configuracoes.html')
+@bp.route('/configuracoes.html')
 def configuracoes_html():
     return _serve_public('configuracoes.html')
 
-@app.route('/notificacoes.html')
+@bp.route('/notificacoes.html')
 def notificacoes_html():
     return _serve_public('notificacoes.html')
 
 # Rotas amigáveis (sem .html)
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard_route():
     return _serve_public('dashboard.html')
 
-@app.route('/contratos')
+@bp.route('/contratos')
 def contratos_route():
     return _serve_public('contratos.html')
 
-@app.route('/configuracoes')
+@bp.route('/configuracoes')
 def configuracoes_route():
     return _serve_public('configuracoes.html')
 
-@app.route('/notificacoes')
+@bp.route('/notificacoes')
 def notificacoes_route():
     return _serve_public('notificacoes.html')
 
 # Arquivos JS/CSS (mantém seus paths atuais)
-@app.route('/api.js')
+@bp.route('/api.js')
 def api_js():
-    return send_from_directory(PUBLIC_DIR, 'api.js')
+    return estaticos.servir('api.js')
 
-@app.route('/auth.js')
+@bp.route('/auth.js')
 def auth_js():
-    return send_from_directory(PUBLIC_DIR, 'auth.js')
+    return estaticos.servir('auth.js')
 
 # Fallback para qualquer outro arquivo em /public (ex: imagens, fonts, etc.)
-@app.route('/<path:filename>')
+@bp.route('/<path:filename>')
 def serve_static(filename):
     return _serve_public(filename)
 
 # ========== ROTAS DE AUTENTICAÇÃO ==========
-@app.route('/api/auth/register', methods=['POST'])
+@bp.route('/api/auth/register', methods=['POST'])
 def register():
     try:
         data = request.json
@@ -623,31 +1094,38 @@ def register():
         if not all([nome_completo, email, senha]):
             return jsonify({'success': False, 'message': 'Todos os campos são obrigatórios'}), 400
         
-        conn = get_db_connection()
+        conn = get_db_connection(catalogo=True)
         
         usuario_existente = conn.execute(
             'SELECT id FROM usuario WHERE email = ?', (email,)
         ).fetchone()
         
+        conn.close()
+        
         if usuario_existente:
-            conn.close()
             return jsonify({'success': False, 'message': 'Email já cadastrado'}), 400
         
         senha_hash = hash_senha(senha)
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO usuario (nome_completo, email, senha_hash) VALUES (?, ?, ?)',
-            (nome_completo, email, senha_hash)
-        )
-        usuario_id = cursor.lastrowid
         
-        conn.commit()
-        conn.close()
+        def inserir(conn):
+            # Confere de novo na transação: outro cadastro com o email pode ter entrado no meio
+            if conn.execute('SELECT id FROM usuario WHERE email = ?', (email,)).fetchone():
+                return None
+            return conn.execute(
+                'INSERT INTO usuario (nome_completo, email, senha_hash) VALUES (?, ?, ?)',
+                (nome_completo, email, senha_hash)
+            ).lastrowid
+        
+        usuario_id = escrever_catalogo(inserir)
+        if usuario_id is None:
+            return jsonify({'success': False, 'message': 'Email já cadastrado'}), 400
+        armazenamento.espelhar(usuario_id, escrever)
         
         session.permanent = True
         session['usuario_id'] = usuario_id
         session['usuario_nome'] = nome_completo
         session['usuario_email'] = email
+        session['usuario_admin'] = False
         
         return jsonify({
             'success': True,
@@ -659,11 +1137,13 @@ def register():
             }
         })
         
+    except (senhas.PoolSaturado, EscritorOcupado):
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro no registro: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao criar usuário'}), 500
 
-@app.route('/api/auth/login', methods=['POST'])
+@bp.route('/api/auth/login', methods=['POST'])
 def login():
     try:
         data = request.json
@@ -673,7 +1153,7 @@ def login():
         if not email or not senha:
             return jsonify({'success': False, 'message': 'Email e senha são obrigatórios'}), 400
         
-        conn = get_db_connection()
+        conn = get_db_connection(catalogo=True)
         usuario = conn.execute(
             'SELECT * FROM usuario WHERE email = ?', (email,)
         ).fetchone()
@@ -682,10 +1162,21 @@ def login():
         if not usuario or not verificar_senha(senha, usuario['senha_hash']):
             return jsonify({'success': False, 'message': 'Credenciais inválidas'}), 401
         
+        # Rehash transparente: hashes legados (SHA-256) ou com custo antigo são atualizados
+        if senha_precisa_rehash(usuario['senha_hash']):
+            escrever_catalogo(
+                _executar_sql,
+                'UPDATE usuario SET senha_hash = ? WHERE id = ?',
+                (hash_senha(senha), usuario['id'])
+            )
+        armazenamento.espelhar(usuario['id'], escrever)
+        
         session.permanent = True
         session['usuario_id'] = usuario['id']
         session['usuario_nome'] = usuario['nome_completo']
         session['usuario_email'] = usuario['email']
+        # Papel vem da coluna admin (não do email, que o usuário pode trocar no perfil)
+        session['usuario_admin'] = bool(usuario['admin'])
         
         return jsonify({
             'success': True,
@@ -697,16 +1188,18 @@ def login():
             }
         })
         
+    except (senhas.PoolSaturado, EscritorOcupado):
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro no login: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro no login'}), 500
 
-@app.route('/api/auth/logout', methods=['POST'])
+@bp.route('/api/auth/logout', methods=['POST'])
 def logout():
     session.clear()
     return jsonify({'success': True, 'message': 'Logout realizado com sucesso'})
 
-@app.route('/api/auth/check', methods=['GET'])
+@bp.route('/api/auth/check', methods=['GET'])
 def check_auth():
     usuario = get_usuario_atual()
     if usuario:
@@ -721,53 +1214,41 @@ def check_auth():
     return jsonify({'authenticated': False})
 
 # ========== ROTAS DE CONTRATOS ==========
-@app.route('/api/contratos', methods=['GET'])
+@bp.route('/api/contratos', methods=['GET'])
 @login_required
+@coalescedor.rota
 def listar_contratos():
     try:
         usuario_id = session['usuario_id']
-        conn = get_db_connection()
+        codificador = FORMATO_CONTRATO.para_requisicao()
+        conn = get_db_leitura()
         
-        contratos = conn.execute('''
-            SELECT * FROM contrato 
+        cursor = codificador.consultar(conn, '''
+            SELECT {campos} FROM contrato 
             WHERE usuario_id = ? 
             ORDER BY data_fim
-        ''', (usuario_id,)).fetchall()
-        
-        conn.close()
-        
-        contratos_json = []
-        for contrato in contratos:
-            contratos_json.append({
-                'id': contrato['id'],
-                'nome': contrato['nome'],
-                'descricao': contrato['descricao'],
-                'data_inicio': contrato['data_inicio'],
-                'data_fim': contrato['data_fim'],
-                'status': contrato['status'],
-                'criado_em': contrato['criado_em'],
-                'atualizado_em': contrato['atualizado_em'],
-                'dias_restantes': calcular_dias_restantes(contrato['data_fim'])
-            })
+        ''', (usuario_id,))
         
-        return jsonify({
-            'success': True,
-            'contratos': contratos_json
-        })
+        # Em streaming quando passa de STREAMING_LOTE linhas; a conexão fecha no fim
+        return codificador.responder_lista(cursor, {'success': True}, 'contratos', fechar=conn.close)
         
+    except CampoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         logger.error(f"Erro ao listar contratos: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao listar contratos'}), 500
 
-@app.route('/api/contratos/<int:id>', methods=['GET'])
+@bp.route('/api/contratos/<int:id>', methods=['GET'])
 @login_required
 def obter_contrato(id):
     try:
         usuario_id = session['usuario_id']
-        conn = get_db_connection()
+        codificador = FORMATO_CONTRATO.para_requisicao()
+        conn = get_db_leitura()
         
-        contrato = conn.execute(
-            'SELECT * FROM contrato WHERE id = ? AND usuario_id = ?',
+        contrato = codificador.consultar(
+            conn,
+            'SELECT {campos} FROM contrato WHERE id = ? AND usuario_id = ?',
             (id, usuario_id)
         ).fetchone()
         
@@ -776,27 +1257,20 @@ def obter_contrato(id):
         if not contrato:
             return jsonify({'success': False, 'message': 'Contrato não encontrado'}), 404
         
-        return jsonify({
+        return serializacao.responder({
             'success': True,
-            'contrato': {
-                'id': contrato['id'],
-                'nome': contrato['nome'],
-                'descricao': contrato['descricao'],
-                'data_inicio': contrato['data_inicio'],
-                'data_fim': contrato['data_fim'],
-                'status': contrato['status'],
-                'criado_em': contrato['criado_em'],
-                'atualizado_em': contrato['atualizado_em'],
-                'dias_restantes': calcular_dias_restantes(contrato['data_fim'])
-            }
+            'contrato': codificador.objeto(contrato)
         })
         
+    except CampoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         logger.error(f"Erro ao obter contrato: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao obter contrato'}), 500
 
-@app.route('/api/contratos', methods=['POST'])
+@bp.route('/api/contratos', methods=['POST'])
 @login_required
+@idempotencia.rota
 def criar_contrato():
     try:
         usuario_id = session['usuario_id']
@@ -807,29 +1281,24 @@ def criar_contrato():
             if not data.get(field):
                 return jsonify({'success': False, 'message': f'Campo {field} é obrigatório'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO contrato (nome, descricao, data_inicio, data_fim, status, usuario_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            data['nome'],
-            data.get('descricao', ''),
-            data['data_inicio'],
-            data['data_fim'],
-            data.get('status', 'ativo'),
-            usuario_id
-        ))
-        
-        contrato_id = cursor.lastrowid
-        conn.commit()
+        def inserir(conn):
+            contrato_id = conn.execute('''
+                INSERT INTO contrato (nome, descricao, data_inicio, data_fim, status, usuario_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                data['nome'],
+                data.get('descricao', ''),
+                data['data_inicio'],
+                data['data_fim'],
+                data.get('status', 'ativo'),
+                usuario_id
+            )).lastrowid
+            vencer_contrato(conn, contrato_id, datetime.now().strftime('%Y-%m-%d'))
+            return conn.execute(
+                'SELECT * FROM contrato WHERE id = ?', (contrato_id,)
+            ).fetchone()
         
-        contrato = conn.execute(
-            'SELECT * FROM contrato WHERE id = ?', (contrato_id,)
-        ).fetchone()
-        
-        conn.close()
+        contrato = escrever(inserir)
         
         return jsonify({
             'success': True,
@@ -845,28 +1314,19 @@ def criar_contrato():
             }
         })
         
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro ao criar contrato: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao criar contrato'}), 500
 
-@app.route('/api/contratos/<int:id>', methods=['PUT'])
+@bp.route('/api/contratos/<int:id>', methods=['PUT'])
 @login_required
 def atualizar_contrato(id):
     try:
         usuario_id = session['usuario_id']
         data = request.json
         
-        conn = get_db_connection()
-        
-        contrato = conn.execute(
-            'SELECT * FROM contrato WHERE id = ? AND usuario_id = ?',
-            (id, usuario_id)
-        ).fetchone()
-        
-        if not contrato:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Contrato não encontrado'}), 404
-        
         updates = []
         params = []
         
@@ -877,19 +1337,28 @@ def atualizar_contrato(id):
                 params.append(data[campo])
         
         updates.append('atualizado_em = CURRENT_TIMESTAMP')
+        query = f'UPDATE contrato SET {", ".join(updates)} WHERE id = ? AND usuario_id = ?'
+        params.extend([id, usuario_id])
+        
+        # Renovação: nova data_fim sem outro status (o formulário reenvia 'vencido') reativa o contrato
+        renovar = 'data_fim' in data and data.get('status', 'vencido') == 'vencido'
+        
+        def atualizar(conn):
+            # Sem linha afetada: o contrato não existe ou é de outro usuário
+            if conn.execute(query, params).rowcount == 0:
+                return None
+            hoje = datetime.now().strftime('%Y-%m-%d')
+            if renovar:
+                reativar_contrato(conn, id, hoje)
+            vencer_contrato(conn, id, hoje)
+            return conn.execute(
+                'SELECT * FROM contrato WHERE id = ?', (id,)
+            ).fetchone()
         
-        if updates:
-            query = f'UPDATE contrato SET {", ".join(updates)} WHERE id = ? AND usuario_id = ?'
-            params.extend([id, usuario_id])
-            
-            conn.execute(query, params)
-            conn.commit()
-        
-        contrato = conn.execute(
-            'SELECT * FROM contrato WHERE id = ?', (id,)
-        ).fetchone()
+        contrato = escrever(atualizar)
         
-        conn.close()
+        if not contrato:
+            return jsonify({'success': False, 'message': 'Contrato não encontrado'}), 404
         
         return jsonify({
             'success': True,
@@ -905,86 +1374,208 @@ def atualizar_contrato(id):
             }
         })
         
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro ao atualizar contrato: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao atualizar contrato'}), 500
 
-@app.route('/api/contratos/<int:id>', methods=['DELETE'])
+@bp.route('/api/contratos/<int:id>', methods=['DELETE'])
 @login_required
 def excluir_contrato(id):
     try:
         usuario_id = session['usuario_id']
         
-        conn = get_db_connection()
-        
-        contrato = conn.execute(
-            'SELECT * FROM contrato WHERE id = ? AND usuario_id = ?',
-            (id, usuario_id)
-        ).fetchone()
+        def excluir(conn):
+            # Notificações e destinatários saem em cascata; o arquivo não tem chave estrangeira
+            if not conn.execute('DELETE FROM contrato WHERE id = ? AND usuario_id = ?', (id, usuario_id)).rowcount:
+                return False
+            excluir_arquivadas(conn, usuario_id, id)
+            return True
         
-        if not contrato:
-            conn.close()
+        if not escrever(excluir):
             return jsonify({'success': False, 'message': 'Contrato não encontrado'}), 404
         
-        conn.execute('DELETE FROM notificacao WHERE contrato_id = ?', (id,))
-        conn.execute('DELETE FROM contrato WHERE id = ? AND usuario_id = ?', (id, usuario_id))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({
             'success': True,
             'message': 'Contrato excluído com sucesso'
         })
         
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro ao excluir contrato: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao excluir contrato'}), 500
 
 # ========== ROTAS DE NOTIFICAÇÕES ==========
-@app.route('/api/notificacoes', methods=['GET'])
+@bp.route('/api/notificacoes', methods=['GET'])
 @login_required
+@coalescedor.rota
 def listar_notificacoes():
     try:
         usuario_id = session['usuario_id']
-        conn = get_db_connection()
+        codificador = FORMATO_NOTIFICACAO.para_requisicao()
+        email = (request.args.get('email') or '').strip().lower()
+        conn = get_db_leitura()
+        
+        if email:
+            # Todas as notificações enviadas a um destinatário (índice usuario_id, email)
+            cursor = codificador.consultar(conn, '''
+                SELECT {campos}
+                FROM notificacao_destinatario d
+                JOIN notificacao n ON n.id = d.notificacao_id
+                JOIN contrato c ON n.contrato_id = c.id
+                WHERE d.usuario_id = ? AND d.email = ?
+                ORDER BY n.criado_em DESC
+            ''', (usuario_id, email))
+        else:
+            cursor = codificador.consultar(conn, '''
+                SELECT {campos}
+                FROM notificacao n
+                JOIN contrato c ON n.contrato_id = c.id
+                WHERE c.usuario_id = ?
+                ORDER BY n.criado_em DESC
+            ''', (usuario_id,))
+        
+        return codificador.responder_lista(cursor, {'success': True}, 'notificacoes', fechar=conn.close)
+        
+    except CampoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erro ao listar notificações: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro ao listar notificações'}), 500
+
+@bp.route('/api/notificacoes/destinatarios', methods=['GET'])
+@login_required
+def listar_destinatarios():
+    try:
+        usuario_id = session['usuario_id']
+        conn = get_db_leitura()
         
-        notificacoes = conn.execute('''
-            SELECT n.*, c.nome as contrato_nome
-            FROM notificacao n
-            JOIN contrato c ON n.contrato_id = c.id
-            WHERE c.usuario_id = ?
-            ORDER BY n.criado_em DESC
-        ''', (usuario_id,)).fetchall()
+        # Um item por email, com o total de notificações e quantas falharam
+        cursor = CODIFICADOR_DESTINATARIOS.consultar(conn, '''
+            SELECT {campos}
+            FROM notificacao_destinatario
+            WHERE usuario_id = ?
+            GROUP BY email
+            ORDER BY email
+        ''', (usuario_id,))
+        
+        return CODIFICADOR_DESTINATARIOS.responder_lista(cursor, {'success': True}, 'destinatarios', fechar=conn.close)
         
+    except Exception as e:
+        logger.error(f"Erro ao listar destinatários: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro ao listar destinatários'}), 500
+
+@bp.route('/api/notificacoes/arquivo', methods=['GET'])
+@login_required
+def listar_notificacoes_arquivadas():
+    """
+    Notificações já arquivadas pela retenção, da mais nova para a mais antiga.
+    Página de ?limite= itens; a próxima começa em ?antes=<proximo>.
+    """
+    try:
+        usuario_id = session['usuario_id']
+        codificador = FORMATO_NOTIFICACAO_ARQUIVO.para_requisicao()
+        email = (request.args.get('email') or '').strip().lower()
+        antes = request.args.get('antes', type=int) or sys.maxsize
+        limite = min(max(request.args.get('limite', 100, type=int), 1), 1000)
+        
+        conn = get_db_arquivo()
+        if conn is None:
+            return serializacao.responder({'success': True, 'notificacoes': [], 'proximo': None})
+        
+        if email:
+            rows = codificador.consultar(conn, '''
+                SELECT {campos}
+                FROM notificacao_destinatario d
+                JOIN notificacao n ON n.id = d.notificacao_id
+                WHERE d.usuario_id = ? AND d.email = ? AND d.notificacao_id < ?
+                ORDER BY d.notificacao_id DESC
+                LIMIT ?
+            ''', (usuario_id, email, antes, limite)).fetchall()
+        else:
+            rows = codificador.consultar(conn, '''
+                SELECT {campos}
+                FROM notificacao n
+                WHERE n.usuario_id = ? AND n.id < ?
+                ORDER BY n.id DESC
+                LIMIT ?
+            ''', (usuario_id, antes, limite)).fetchall()
         conn.close()
         
-        notificacoes_json = []
-        for notif in notificacoes:
-            notificacoes_json.append({
-                'id': notif['id'],
-                'contrato_id': notif['contrato_id'],
-                'contrato_nome': notif['contrato_nome'],
-                'tipo': notif['tipo'],
-                'assunto': notif['assunto'],
-                'mensagem': notif['mensagem'],
-                'email_destino': notif['email_destino'],
-                'status': notif['status'],
-                'data_envio': notif['data_envio'],
-                'criado_em': notif['criado_em']
-            })
+        return serializacao.responder({
+            'success': True,
+            'notificacoes': codificador.lista(rows),
+            'proximo': rows[-1][0] if len(rows) == limite else None,
+        })
+        
+    except CampoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erro ao listar notificações arquivadas: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro ao listar notificações arquivadas'}), 500
+
+@bp.route('/api/notificacoes/retencao', methods=['GET'])
+@login_required
+def obter_retencao():
+    try:
+        usuario_id = session['usuario_id']
+        conn = get_db_leitura()
+        politica = conn.execute(
+            'SELECT dias FROM retencao_politica WHERE usuario_id = ?', (usuario_id,)
+        ).fetchone()
+        conn.close()
         
+        padrao = current_app.config['RETENCAO_DIAS']
         return jsonify({
             'success': True,
-            'notificacoes': notificacoes_json
+            'dias': politica['dias'] if politica else None,
+            'padrao': padrao,
+            'efetivo': politica['dias'] if politica else padrao
         })
         
     except Exception as e:
-        logger.error(f"Erro ao listar notificações: {str(e)}")
-        return jsonify({'success': False, 'message': 'Erro ao listar notificações'}), 500
+        logger.error(f"Erro ao obter retenção: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro ao obter retenção'}), 500
+
+@bp.route('/api/notificacoes/retencao', methods=['PUT'])
+@login_required
+def atualizar_retencao():
+    try:
+        usuario_id = session['usuario_id']
+        dias = (request.json or {}).get('dias')
+        
+        # null volta ao padrão global; 0 guarda o histórico para sempre
+        if dias is not None and (not isinstance(dias, int) or isinstance(dias, bool) or dias < 0):
+            return jsonify({'success': False, 'message': 'dias deve ser um inteiro >= 0 ou null'}), 400
+        
+        if dias is None:
+            escrever(_executar_sql, 'DELETE FROM retencao_politica WHERE usuario_id = ?', (usuario_id,))
+        else:
+            escrever(_executar_sql, '''
+                INSERT INTO retencao_politica (usuario_id, dias) VALUES (?, ?)
+                ON CONFLICT (usuario_id) DO UPDATE SET dias = excluded.dias, atualizado_em = CURRENT_TIMESTAMP
+            ''', (usuario_id, dias))
+        
+        padrao = current_app.config['RETENCAO_DIAS']
+        return jsonify({
+            'success': True,
+            'message': 'Política de retenção atualizada',
+            'dias': dias,
+            'padrao': padrao,
+            'efetivo': padrao if dias is None else dias
+        })
+        
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        logger.error(f"Erro ao atualizar retenção: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro ao atualizar retenção'}), 500
 
-@app.route('/api/contratos/<int:contrato_id>/notificar', methods=['POST'])
+@bp.route('/api/contratos/<int:contrato_id>/notificar', methods=['POST'])
 @login_required
+@idempotencia.rota
 def enviar_notificacao(contrato_id):
     try:
         usuario_id = session['usuario_id']
@@ -996,9 +1587,9 @@ def enviar_notificacao(contrato_id):
             SELECT * FROM contrato 
             WHERE id = ? AND usuario_id = ?
         ''', (contrato_id, usuario_id)).fetchone()
+        conn.close()
         
         if not contrato:
-            conn.close()
             return jsonify({'success': False, 'message': 'Contrato não encontrado'}), 404
         
         emails = data.get('emails')
@@ -1007,7 +1598,6 @@ def enviar_notificacao(contrato_id):
         mensagem_customizada = data.get('mensagem_customizada')
         
         if not emails or not tipo:
-            conn.close()
             return jsonify({'success': False, 'message': 'Emails e tipo são obrigatórios'}), 400
         
         if isinstance(emails, str):
@@ -1015,13 +1605,11 @@ def enviar_notificacao(contrato_id):
         elif isinstance(emails, list):
             emails_list = emails
         else:
-            conn.close()
             return jsonify({'success': False, 'message': 'Formato de emails inválido'}), 400
         
         # Validar emails
         for email in emails_list:
             if '@' not in email or '.' not in email:
-                conn.close()
                 return jsonify({'success': False, 'message': f'Email inválido: {email}'}), 400
         
         # Determinar tipo de notificação para design
@@ -1068,25 +1656,37 @@ Esta é uma notificação automática do sistema CONTRATO+.
 Acesse: http://localhost:5000"""
         
         # Enviar email
-        enviado = enviar_email(emails_list, assunto, html_content, texto_simples)
+        recusados = set()
+        enviado = enviar_email(emails_list, assunto, html_content, texto_simples, recusados=recusados)
         
-        # Registrar no banco
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO notificacao (contrato_id, tipo, assunto, mensagem, email_destino, status, data_envio)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            contrato_id,
-            tipo,
-            assunto,
-            mensagem,
-            ','.join(emails_list),
-            'enviado' if enviado else 'erro',
-            datetime.utcnow().isoformat() if enviado else None
-        ))
-        
-        conn.commit()
-        conn.close()
+        # Status por destinatário (um email pode ser aceito e outro recusado)
+        destinatarios = {}
+        for email in emails_list:
+            if not enviado:
+                destinatarios.setdefault(email.strip().lower(), 'erro')
+            else:
+                destinatarios.setdefault(email.strip().lower(), 'recusado' if email in recusados else 'enviado')
+        
+        def registrar(conn):
+            notificacao_id = conn.execute('''
+                INSERT INTO notificacao (contrato_id, tipo, assunto, mensagem, email_destino, status, data_envio)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                contrato_id,
+                tipo,
+                assunto,
+                mensagem,
+                ','.join(emails_list),
+                'enviado' if enviado else 'erro',
+                datetime.utcnow().isoformat() if enviado else None
+            )).lastrowid
+            conn.executemany('''
+                INSERT INTO notificacao_destinatario (notificacao_id, usuario_id, email, status)
+                VALUES (?, ?, ?, ?)
+            ''', [(notificacao_id, usuario_id, email, status) for email, status in destinatarios.items()])
+        
+        # Registrar no banco (o envio acima fica fora da transação de escrita)
+        escrever(registrar)
         
         if enviado:
             return jsonify({
@@ -1100,17 +1700,20 @@ Acesse: http://localhost:5000"""
                 'message': 'Erro ao enviar notificação'
             }), 500
         
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro ao enviar notificação: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro ao enviar notificação: {str(e)}'}), 500
 
 # ========== ROTAS DE DASHBOARD ==========
-@app.route('/api/dashboard/stats', methods=['GET'])
+@bp.route('/api/dashboard/stats', methods=['GET'])
 @login_required
+@coalescedor.rota
 def get_dashboard_stats():
     try:
         usuario_id = session['usuario_id']
-        conn = get_db_connection()
+        conn = get_db_leitura(snapshot=True)
         
         # Total de contratos
         total_contratos = conn.execute(
@@ -1135,18 +1738,15 @@ def get_dashboard_stats():
             AND status = "ativo"
         ''', (usuario_id, hoje, data_limite)).fetchone()['total']
         
-        # Contratos vencidos
-        contratos_vencidos = conn.execute('''
-            SELECT COUNT(*) as total 
-            FROM contrato 
-            WHERE usuario_id = ? 
-            AND data_fim < ?
-            AND status = "ativo"
-        ''', (usuario_id, hoje)).fetchone()['total']
+        # Contratos vencidos (status mantido pelo ciclo de vencimento)
+        contratos_vencidos = conn.execute(
+            'SELECT COUNT(*) as total FROM contrato WHERE usuario_id = ? AND status = "vencido"',
+            (usuario_id,)
+        ).fetchone()['total']
         
         # Últimas notificações
-        ultimas_notificacoes = conn.execute('''
-            SELECT n.*, c.nome as contrato_nome
+        ultimas_notificacoes = CODIFICADOR_ULTIMAS_NOTIFICACOES.consultar(conn, '''
+            SELECT {campos}
             FROM notificacao n
             JOIN contrato c ON n.contrato_id = c.id
             WHERE c.usuario_id = ?
@@ -1155,23 +1755,16 @@ def get_dashboard_stats():
         ''', (usuario_id,)).fetchall()
         
         # Contratos por status
-        status_data = []
-        status_rows = conn.execute('''
-            SELECT status, COUNT(*) as total 
+        status_rows = CODIFICADOR_STATUS.consultar(conn, '''
+            SELECT {campos} 
             FROM contrato 
             WHERE usuario_id = ? 
             GROUP BY status
         ''', (usuario_id,)).fetchall()
         
-        for row in status_rows:
-            status_data.append({
-                'status': row['status'],
-                'total': row['total']
-            })
-        
         # Próximos vencimentos
-        proximos_vencimentos = conn.execute('''
-            SELECT id, nome, data_fim, status
+        proximos_vencimentos = CODIFICADOR_VENCIMENTOS.consultar(conn, '''
+            SELECT {campos}
             FROM contrato
             WHERE usuario_id = ?
             AND status = "ativo"
@@ -1182,39 +1775,16 @@ def get_dashboard_stats():
         
         conn.close()
         
-        # Processar dados
-        notificacoes_json = []
-        for notif in ultimas_notificacoes:
-            notificacoes_json.append({
-                'id': notif['id'],
-                'contrato_nome': notif['contrato_nome'],
-                'tipo': notif['tipo'],
-                'assunto': notif['assunto'],
-                'status': notif['status'],
-                'data_envio': notif['data_envio'],
-                'criado_em': notif['criado_em']
-            })
-        
-        vencimentos_json = []
-        for contrato in proximos_vencimentos:
-            vencimentos_json.append({
-                'id': contrato['id'],
-                'nome': contrato['nome'],
-                'data_fim': contrato['data_fim'],
-                'status': contrato['status'],
-                'dias_restantes': calcular_dias_restantes(contrato['data_fim'])
-            })
-        
-        return jsonify({
+        return serializacao.responder({
             'success': True,
             'stats': {
                 'total_contratos': total_contratos,
                 'contratos_ativos': contratos_ativos,
                 'contratos_proximos': contratos_proximos,
                 'contratos_vencidos': contratos_vencidos,
-                'status_distribuicao': status_data,
-                'ultimas_notificacoes': notificacoes_json,
-                'proximos_vencimentos': vencimentos_json,
+                'status_distribuicao': CODIFICADOR_STATUS.lista(status_rows),
+                'ultimas_notificacoes': CODIFICADOR_ULTIMAS_NOTIFICACOES.lista(ultimas_notificacoes),
+                'proximos_vencimentos': CODIFICADOR_VENCIMENTOS.lista(proximos_vencimentos),
                 'atualizado_em': datetime.now().isoformat()
             }
         })
@@ -1224,7 +1794,7 @@ def get_dashboard_stats():
         return jsonify({'success': False, 'message': 'Erro ao obter estatísticas'}), 500
 
 # ========== ROTAS DE CONFIGURAÇÕES ==========
-@app.route('/api/configuracoes/perfil', methods=['GET'])
+@bp.route('/api/configuracoes/perfil', methods=['GET'])
 @login_required
 def get_perfil():
     try:
@@ -1245,14 +1815,14 @@ def get_perfil():
         logger.error(f"Erro ao obter perfil: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao obter perfil'}), 500
 
-@app.route('/api/configuracoes/perfil', methods=['PUT'])
+@bp.route('/api/configuracoes/perfil', methods=['PUT'])
 @login_required
 def atualizar_perfil():
     try:
         data = request.json
         usuario_id = session['usuario_id']
         
-        conn = get_db_connection()
+        conn = get_db_connection(catalogo=True)
         
         updates = []
         params = []
@@ -1289,12 +1859,13 @@ def atualizar_perfil():
             updates.append('senha_hash = ?')
             params.append(hash_senha(data['nova_senha']))
         
+        conn.close()
+        
         if updates:
             query = f'UPDATE usuario SET {", ".join(updates)} WHERE id = ?'
             params.append(usuario_id)
             
-            conn.execute(query, params)
-            conn.commit()
+            escrever_catalogo(_executar_sql, query, params)
             
             # Atualizar sessão se email mudou
             if 'email' in data:
@@ -1302,19 +1873,19 @@ def atualizar_perfil():
             if 'nome_completo' in data:
                 session['usuario_nome'] = data['nome_completo']
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'message': 'Perfil atualizado com sucesso'
         })
         
+    except (senhas.PoolSaturado, EscritorOcupado):
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro ao atualizar perfil: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao atualizar perfil'}), 500
 
 # ========== ROTAS DE TESTE DE EMAIL ==========
-@app.route('/api/email/test', methods=['POST'])
+@bp.route('/api/email/test', methods=['POST'])
 @login_required
 def testar_email():
     try:
@@ -1362,7 +1933,7 @@ Esta é uma mensagem de teste automática."""
         return jsonify({'success': False, 'message': f'Erro ao testar email: {str(e)}'}), 500
 
 # ========== ROTAS DE UTILITÁRIOS ==========
-@app.route('/api/utils/calcular-dias/<data_fim>', methods=['GET'])
+@bp.route('/api/utils/calcular-dias/<data_fim>', methods=['GET'])
 @login_required
 def calcular_dias_api(data_fim):
     try:
@@ -1391,11 +1962,69 @@ def calcular_dias_restantes(data_fim):
     except:
         return None
 
-@app.route('/api/utils/verificar-email/<email>', methods=['GET'])
+# ========== FORMATOS DE SERIALIZAÇÃO ==========
+# Colunas expostas por cada consulta de lista (campo -> expressão SQL); ver serializacao.py
+FORMATO_CONTRATO = Formato('contrato', {
+    'id': 'id',
+    'nome': 'nome',
+    'descricao': 'descricao',
+    'data_inicio': 'data_inicio',
+    'data_fim': 'data_fim',
+    'status': 'status',
+    'criado_em': 'criado_em',
+    'atualizado_em': 'atualizado_em',
+}, calculados={'dias_restantes': ('data_fim', calcular_dias_restantes)})
+CAMPOS_CONTRATO_SEM_CALCULO = tuple(FORMATO_CONTRATO.colunas)
+
+FORMATO_NOTIFICACAO = Formato('notificacao', {
+    'id': 'n.id',
+    'contrato_id': 'n.contrato_id',
+    'contrato_nome': 'c.nome',
+    'tipo': 'n.tipo',
+    'assunto': 'n.assunto',
+    'mensagem': 'n.mensagem',
+    'email_destino': 'n.email_destino',
+    'status': 'n.status',
+    'data_envio': 'n.data_envio',
+    'criado_em': 'n.criado_em',
+})
+
+# Histórico movido para o banco de arquivo pela retenção (retencao.py)
+FORMATO_NOTIFICACAO_ARQUIVO = Formato('notificacao_arquivo', {
+    'id': 'n.id',
+    'contrato_id': 'n.contrato_id',
+    'contrato_nome': 'n.contrato_nome',
+    'tipo': 'n.tipo',
+    'assunto': 'n.assunto',
+    'mensagem': 'n.mensagem',
+    'email_destino': 'n.email_destino',
+    'status': 'n.status',
+    'data_envio': 'n.data_envio',
+    'criado_em': 'n.criado_em',
+    'arquivado_em': 'n.arquivado_em',
+})
+
+# Listas fixas do dashboard
+CODIFICADOR_ULTIMAS_NOTIFICACOES = FORMATO_NOTIFICACAO.codificador(
+    ('id', 'contrato_nome', 'tipo', 'assunto', 'status', 'data_envio', 'criado_em'))
+CODIFICADOR_VENCIMENTOS = FORMATO_CONTRATO.codificador(
+    ('id', 'nome', 'data_fim', 'status', 'dias_restantes'))
+CODIFICADOR_DESTINATARIOS = Formato('destinatario', {
+    'email': 'email',
+    'notificacoes': 'COUNT(*)',
+    'falhas': "SUM(status <> 'enviado')",
+    'ultima_notificacao_id': 'MAX(notificacao_id)',
+}, obrigatorios=('email',)).codificador()
+CODIFICADOR_STATUS = Formato('status_contrato', {
+    'status': 'status',
+    'total': 'COUNT(*)',
+}).codificador()
+
+@bp.route('/api/utils/verificar-email/<email>', methods=['GET'])
 @login_required
 def verificar_email_disponivel(email):
     try:
-        conn = get_db_connection()
+        conn = get_db_leitura(catalogo=True)
         
         # Verificar se email já está em uso por outro usuário
         usuario = conn.execute(
@@ -1417,19 +2046,21 @@ def verificar_email_disponivel(email):
         return jsonify({'success': False, 'message': 'Erro ao verificar email'}), 500
 
 # ========== ROTA DE VERIFICAÇÃO DO SISTEMA ==========
-@app.route('/api/system/health', methods=['GET'])
+@bp.route('/api/system/health', methods=['GET'])
 def health_check():
     """Verifica a saúde do sistema"""
     try:
-        # Verificar banco de dados
-        if not os.path.exists(DATABASE):
+        # Verificar banco de dados (a primeira conexão cria o esquema se preciso)
+        conn = get_db_leitura(catalogo=True)
+        caminho = _caminho_banco(catalogo=True)
+        if not caminho.startswith('file:') and not os.path.exists(caminho):
+            conn.close()
             return jsonify({
                 'status': 'error',
                 'database': 'not_found',
                 'message': 'Banco de dados não encontrado'
             }), 500
         
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Verificar tabelas
@@ -1438,6 +2069,9 @@ def health_check():
         
         tabelas_esperadas = ['usuario', 'contrato', 'notificacao']
         tabelas_faltando = [t for t in tabelas_esperadas if t not in tabelas]
+        journal = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        # Sem INCREMENTAL a retenção não devolve espaço ao disco (`python app.py vacuum`)
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
         
         conn.close()
         
@@ -1449,7 +2083,10 @@ def health_check():
             'database': {
                 'existe': True,
                 'tabelas': tabelas,
-                'tabelas_faltando': tabelas_faltando
+                'tabelas_faltando': tabelas_faltando,
+                'journal_mode': journal,
+                'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(auto_vacuum, auto_vacuum),
+                'auto_vacuum_incremental': auto_vacuum == AUTO_VACUUM_INCREMENTAL
             },
             'session': {
                 'ativa': sessao_ativa,
@@ -1467,21 +2104,35 @@ def health_check():
             'timestamp': datetime.now().isoformat()
         }), 500
 
-# ========== MIDDLEWARE PARA LOG ==========
-@app.before_request
-def log_request_info():
-    if request.path.startswith('/api/'):
-        logger.info(f"{request.method} {request.path}")
+@metricas_http.subsistemas
+def metricas_subsistemas():
+    """Métricas internas dos subsistemas (pools, filas, contadores)"""
+    return {
+        'senhas': current_app.extensions['senhas'].pool.metricas(),
+        'admissao': controle_admissao.metricas(),
+        'coalescencia': coalescedor.metricas(),
+        'log': log_estruturado.metricas(),
+        'estaticos': estaticos.metricas(),
+        'compressao': compressao.metricas(),
+        'escrita': escritor.metricas(),
+        'leitura': leitura.metricas(),
+        'retencao': retencao.metricas(),
+        'exclusoes': exclusoes.metricas(),
+        'idempotencia': idempotencia.metricas(),
+        'vencimentos': vencimentos.metricas(),
+        'armazenamento': armazenamento.metricas(),
+        'backups': backups.metricas(),
+    }
+
+@bp.route('/api/system/metricas', methods=['GET'])
+def metricas_sistema():
+    return jsonify({
+        **metricas_subsistemas(),
+        'timestamp': datetime.now().isoformat()
+    })
 
 # ========== MAIN ==========
 
-# Garante que o banco e as tabelas existam ao iniciar (não altera design, só faz o sistema funcionar)
-try:
-    os.makedirs(DATA_DIR, exist_ok=True)
-    criar_tabelas()
-except Exception as e:
-    logger.exception('Falha ao inicializar banco: %s', e)
-
 # =========================
 # ALIASES / ROTAS COMPATÍVEIS COM O FRONT (HTML PURO)
 # =========================
@@ -1489,7 +2140,7 @@ except Exception as e:
 # Alguns HTMLs usam endpoints alternativos. Estas rotas apenas redirecionam/duplicam respostas
 # para manter seu design e JS originais funcionando.
 
-@app.route('/api/logout', methods=['POST','GET'])
+@bp.route('/api/logout', methods=['POST','GET'])
 def api_logout_alias():
     # Aceita GET/POST (algumas páginas chamam /logout)
     try:
@@ -1499,14 +2150,15 @@ def api_logout_alias():
         session.clear()
         return jsonify({'success': True})
 
-@app.route('/api/health', methods=['GET'])
+@bp.route('/api/health', methods=['GET'])
 def api_health_alias():
     return health_check()
 
-@app.route('/api/notificacoes/count', methods=['GET'])
+@bp.route('/api/notificacoes/count', methods=['GET'])
 @login_required
+@coalescedor.rota
 def api_notificacoes_count():
-    conn = get_db_connection()
+    conn = get_db_leitura()
     usuario_id = session['usuario_id']
     
     # Correção: contar notificações dos contratos do usuário
@@ -1519,14 +2171,16 @@ def api_notificacoes_count():
     conn.close()
     return jsonify({'success': True, 'count': total})
 
-@app.route('/api/notificacoes/recentes', methods=['GET'])
+@bp.route('/api/notificacoes/recentes', methods=['GET'])
 @login_required
+@coalescedor.rota
 def api_notificacoes_recentes():
     try:
         usuario_id = session['usuario_id']
-        conn = get_db_connection()
-        rows = conn.execute('''
-            SELECT n.*, c.nome as contrato_nome
+        codificador = FORMATO_NOTIFICACAO.para_requisicao()
+        conn = get_db_leitura()
+        rows = codificador.consultar(conn, '''
+            SELECT {campos}
             FROM notificacao n
             JOIN contrato c ON n.contrato_id = c.id
             WHERE c.usuario_id = ?
@@ -1534,122 +2188,214 @@ def api_notificacoes_recentes():
             LIMIT 5
         ''', (usuario_id,)).fetchall()
         conn.close()
-        
-        items = []
-        for r in rows:
-            items.append({
-                'id': r['id'],
-                'contrato_id': r['contrato_id'],
-                'contrato_nome': r['contrato_nome'],
-                'tipo': r['tipo'],
-                'assunto': r['assunto'],
-                'mensagem': r['mensagem'],
-                'email_destino': r['email_destino'],
-                'status': r['status'],
-                'data_envio': r['data_envio'],
-                'criado_em': r['criado_em']
-            })
-        return jsonify({'success': True, 'notificacoes': items})
+        return serializacao.responder({'success': True, 'notificacoes': codificador.lista(rows)})
+    except CampoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         logger.error(f"Erro em notificacoes/recentes: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao carregar notificações'}), 500
 
-@app.route('/api/contratos/recentes', methods=['GET'])
+@bp.route('/api/contratos/recentes', methods=['GET'])
 @login_required
+@coalescedor.rota
 def api_contratos_recentes():
     try:
         usuario_id = session['usuario_id']
-        conn = get_db_connection()
-        rows = conn.execute('''
-            SELECT * FROM contrato
+        codificador = FORMATO_CONTRATO.para_requisicao(padrao=CAMPOS_CONTRATO_SEM_CALCULO)
+        conn = get_db_leitura()
+        rows = codificador.consultar(conn, '''
+            SELECT {campos} FROM contrato
             WHERE usuario_id = ?
             ORDER BY criado_em DESC
             LIMIT 5
         ''', (usuario_id,)).fetchall()
         conn.close()
-        
-        contratos = []
-        for r in rows:
-            contratos.append({
-                'id': r['id'],
-                'nome': r['nome'],
-                'descricao': r['descricao'],
-                'data_inicio': r['data_inicio'],
-                'data_fim': r['data_fim'],
-                'status': r['status'],
-                'criado_em': r['criado_em'],
-                'atualizado_em': r['atualizado_em']
-            })
-        return jsonify({'success': True, 'contratos': contratos})
+        return serializacao.responder({'success': True, 'contratos': codificador.lista(rows)})
+    except CampoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         logger.error(f"Erro em contratos/recentes: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao carregar contratos'}), 500
 
-@app.route('/api/notificacoes/limpar', methods=['POST','DELETE'])
+# ========== SINCRONIZAÇÃO INCREMENTAL ==========
+# Compactação do log de mudanças roda no máximo uma vez por intervalo e por banco
+INTERVALO_COMPACTACAO = 3600
+_ultima_compactacao = {}
+_compactacao_lock = threading.Lock()
+
+def compactar_mudancas(conn, dias):
+    """
+    Remove do log os tombstones mais antigos que `dias` e registra, por usuário,
+    o maior seq removido: cursores anteriores a ele passam a receber carga completa.
+    Tarefa de escrita: roda pelo escritor (quem chama sem ele faz o commit).
+    """
+    limite = f'-{int(dias)} days'
+    conn.execute('''
+        INSERT INTO contrato_mudanca_corte (usuario_id, seq)
+        SELECT usuario_id, MAX(seq) FROM contrato_mudanca
+        WHERE operacao = 'delete' AND registrado_em < datetime('now', ?)
+        GROUP BY usuario_id
+        ON CONFLICT (usuario_id) DO UPDATE SET seq = MAX(seq, excluded.seq)
+    ''', (limite,))
+    removidos = conn.execute('''
+        DELETE FROM contrato_mudanca
+        WHERE operacao = 'delete' AND registrado_em < datetime('now', ?)
+    ''', (limite,)).rowcount
+    return removidos
+
+def _compactar_se_preciso():
+    caminho = _caminho_banco()
+    agora = time.monotonic()
+    with _compactacao_lock:
+        if agora - _ultima_compactacao.get(caminho, float('-inf')) < INTERVALO_COMPACTACAO:
+            return
+        _ultima_compactacao[caminho] = agora
+    removidos = escrever(compactar_mudancas, current_app.config['MUDANCAS_RETENCAO_DIAS'])
+    if removidos:
+        logger.info(f"Log de mudanças compactado: {removidos} tombstones removidos")
+
+@bp.route('/api/contratos/changes', methods=['GET'])
 @login_required
-def api_notificacoes_limpar():
+def api_contratos_changes():
+    """
+    Mudanças nos contratos do usuário desde o cursor `since`: contratos criados ou
+    alterados (linhas completas) e ids excluídos, mais o novo cursor. Sem cursor,
+    ou com um cursor já compactado, devolve a lista inteira com resync=true.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        if since < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Cursor inválido'}), 400
+
     try:
         usuario_id = session['usuario_id']
-        conn = get_db_connection()
-        
-        # Deletar notificações dos contratos do usuário
-        conn.execute('''
-            DELETE FROM notificacao 
-            WHERE contrato_id IN (
-                SELECT id FROM contrato WHERE usuario_id = ?
+        codificador = FORMATO_CONTRATO.para_requisicao()
+        _compactar_se_preciso()
+        conn = get_db_leitura(snapshot=True)
+
+        # Cursor, corte e linhas lidos na mesma transação (mesmo snapshot)
+        cursor_atual, corte = conn.execute('''
+            SELECT
+                (SELECT COALESCE(MAX(seq), 0) FROM contrato_mudanca WHERE usuario_id = ?),
+                (SELECT COALESCE(MAX(seq), 0) FROM contrato_mudanca_corte WHERE usuario_id = ?)
+        ''', (usuario_id, usuario_id)).fetchone()
+        cursor_atual = max(cursor_atual, corte)
+
+        if since == 0 or since < corte or since > cursor_atual:
+            cursor = codificador.consultar(conn, '''
+                SELECT {campos} FROM contrato
+                WHERE usuario_id = ?
+                ORDER BY data_fim
+            ''', (usuario_id,))
+            return codificador.responder_lista(
+                cursor, {'success': True, 'resync': True, 'cursor': cursor_atual},
+                'contratos', fechar=conn.close)
+
+        alterados = codificador.consultar(conn, '''
+            SELECT {campos} FROM contrato
+            WHERE usuario_id = ? AND id IN (
+                SELECT contrato_id FROM contrato_mudanca
+                WHERE usuario_id = ? AND seq > ? AND operacao = 'upsert'
             )
-        ''', (usuario_id,))
-        conn.commit()
+            ORDER BY data_fim
+        ''', (usuario_id, usuario_id, since)).fetchall()
+        removidos = [r[0] for r in conn.execute('''
+            SELECT contrato_id FROM contrato_mudanca
+            WHERE usuario_id = ? AND seq > ? AND operacao = 'delete'
+            ORDER BY seq
+        ''', (usuario_id, since))]
         conn.close()
-        return jsonify({'success': True, 'message': 'Notificações removidas'})
+
+        return serializacao.responder({
+            'success': True,
+            'resync': False,
+            'cursor': cursor_atual,
+            'contratos': codificador.lista(alterados),
+            'removidos': removidos,
+        })
+
+    except CampoInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erro ao sincronizar contratos: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro ao sincronizar contratos'}), 500
+
+def _resposta_job(job_id):
+    conn = get_db_leitura()
+    job = exclusoes.status(conn, session['usuario_id'], job_id)
+    conn.close()
+    return job
+
+@bp.route('/api/notificacoes/limpar', methods=['POST','DELETE'])
+@login_required
+def api_notificacoes_limpar():
+    try:
+        # Job em segundo plano: apaga em lotes (inclusive as arquivadas)
+        job_id = exclusoes.iniciar(session['usuario_id'], 'notificacoes')
+        return jsonify({
+            'success': True,
+            'message': 'Remoção das notificações iniciada',
+            'job': _resposta_job(job_id)
+        }), 202, {'Location': f'/api/exclusoes/{job_id}'}
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro ao limpar notificações: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao limpar notificações'}), 500
 
-@app.route('/api/contratos/limpar', methods=['POST','DELETE'])
+@bp.route('/api/contratos/limpar', methods=['POST','DELETE'])
 @login_required
 def api_contratos_limpar():
     try:
-        usuario_id = session['usuario_id']
-        conn = get_db_connection()
-        
-        # Primeiro deletar notificações dos contratos do usuário
-        conn.execute('''
-            DELETE FROM notificacao 
-            WHERE contrato_id IN (
-                SELECT id FROM contrato WHERE usuario_id = ?
-            )
-        ''', (usuario_id,))
-        
-        # Depois deletar os contratos
-        conn.execute('DELETE FROM contrato WHERE usuario_id = ?', (usuario_id,))
-        
-        conn.commit()
-        conn.close()
-        return jsonify({'success': True, 'message': 'Contratos removidos'})
+        # Job em segundo plano: notificações (e arquivadas) primeiro, depois os contratos
+        job_id = exclusoes.iniciar(session['usuario_id'], 'contratos')
+        return jsonify({
+            'success': True,
+            'message': 'Remoção dos contratos iniciada',
+            'job': _resposta_job(job_id)
+        }), 202, {'Location': f'/api/exclusoes/{job_id}'}
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro ao limpar contratos: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao limpar contratos'}), 500
 
-@app.route('/api/sistema/reset', methods=['POST'])
+@bp.route('/api/exclusoes/<int:job_id>', methods=['GET'])
+@login_required
+def api_exclusao_status(job_id):
+    """Status e progresso de um job de limpeza (status: pendente, executando, concluido, erro)"""
+    try:
+        job = _resposta_job(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Job não encontrado'}), 404
+        return jsonify({'success': True, 'job': job})
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        logger.error(f"Erro ao consultar job de exclusão: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro ao consultar job'}), 500
+
+@bp.route('/api/sistema/reset', methods=['POST'])
 @login_required
 def api_sistema_reset():
     # reset leve: limpa contratos/notificações do usuário
     return api_contratos_limpar()
 
-@app.route('/api/test-email', methods=['GET'])
+@bp.route('/api/test-email', methods=['GET'])
 def api_test_email_alias():
     # compatibilidade: retorna instruções simples
     return jsonify({'success': True, 'message': 'Use POST /api/email/test para enviar e-mail de teste'})
 
-@app.route('/api/test-email/send-test', methods=['POST'])
+@bp.route('/api/test-email/send-test', methods=['POST'])
 @login_required
 def api_test_email_send():
     # compatibilidade: reaproveita /api/email/test
     return testar_email()
 
 # ========== ROTAS ADICIONAIS PARA O DASHBOARD ==========
-@app.route('/api/dashboard/contratos-vencendo', methods=['GET'])
+@bp.route('/api/dashboard/contratos-vencendo', methods=['GET'])
 @login_required
 def get_contratos_vencendo():
     try:
@@ -1657,7 +2403,7 @@ def get_contratos_vencendo():
         hoje = datetime.now().strftime('%Y-%m-%d')
         data_limite = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
         
-        conn = get_db_connection()
+        conn = get_db_leitura()
         total = conn.execute('''
             SELECT COUNT(*) as total 
             FROM contrato 
@@ -1677,20 +2423,19 @@ def get_contratos_vencendo():
         logger.error(f"Erro ao obter contratos vencendo: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao obter contratos vencendo'}), 500
 
-@app.route('/api/dashboard/destinatarios-ativos', methods=['GET'])
+@bp.route('/api/dashboard/destinatarios-ativos', methods=['GET'])
 @login_required
 def get_destinatarios_ativos():
     try:
         usuario_id = session['usuario_id']
         
-        conn = get_db_connection()
+        conn = get_db_leitura()
         
-        # Contar emails únicos de notificações dos contratos do usuário
+        # Emails únicos entre os destinatários do usuário (só o índice usuario_id, email)
         total = conn.execute('''
-            SELECT COUNT(DISTINCT email_destino) as total
-            FROM notificacao n
-            JOIN contrato c ON n.contrato_id = c.id
-            WHERE c.usuario_id = ?
+            SELECT COUNT(DISTINCT email) as total
+            FROM notificacao_destinatario
+            WHERE usuario_id = ?
         ''', (usuario_id,)).fetchone()['total']
         
         conn.close()
@@ -1704,7 +2449,7 @@ def get_destinatarios_ativos():
         logger.error(f"Erro ao obter destinatários ativos: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao obter destinatários ativos'}), 500
 
-@app.route('/api/contratos/<int:id>/status', methods=['PUT'])
+@bp.route('/api/contratos/<int:id>/status', methods=['PUT'])
 @login_required
 def atualizar_status_contrato(id):
     try:
@@ -1715,37 +2460,184 @@ def atualizar_status_contrato(id):
         if not novo_status:
             return jsonify({'success': False, 'message': 'Status é obrigatório'}), 400
         
-        conn = get_db_connection()
+        def atualizar(conn):
+            # Sem linha afetada: o contrato não é do usuário
+            atualizados = conn.execute(
+                'UPDATE contrato SET status = ?, atualizado_em = CURRENT_TIMESTAMP WHERE id = ? AND usuario_id = ?',
+                (novo_status, id, usuario_id)
+            ).rowcount
+            if atualizados:
+                # 'ativo' num contrato com data_fim no passado vence já, como em criar/atualizar
+                vencer_contrato(conn, id, datetime.now().strftime('%Y-%m-%d'))
+            return atualizados
         
-        # Verificar se o contrato pertence ao usuário
-        contrato = conn.execute(
-            'SELECT * FROM contrato WHERE id = ? AND usuario_id = ?',
-            (id, usuario_id)
-        ).fetchone()
+        atualizados = escrever(atualizar)
         
-        if not contrato:
-            conn.close()
+        if not atualizados:
             return jsonify({'success': False, 'message': 'Contrato não encontrado'}), 404
         
-        # Atualizar status
-        conn.execute(
-            'UPDATE contrato SET status = ?, atualizado_em = CURRENT_TIMESTAMP WHERE id = ?',
-            (novo_status, id)
-        )
-        conn.commit()
-        conn.close()
-        
         return jsonify({
             'success': True,
             'message': f'Status do contrato atualizado para {novo_status}'
         })
         
+    except EscritorOcupado:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Erro ao atualizar status: {str(e)}")
         return jsonify({'success': False, 'message': 'Erro ao atualizar status'}), 500
 
+# ========== FÁBRICA DA APLICAÇÃO ==========
+def create_app(config=None):
+    """
+    Monta a aplicação. `config` sobrescreve CONFIG_PADRAO (ex.: DATABASE,
+    EMAIL_CONFIG). Não toca no disco: o banco é inicializado na primeira conexão.
+    """
+    app = Flask(__name__, static_folder=None)  # HTML puro em /public (sem conflito de rotas)
+    app.config.update(CONFIG_PADRAO)
+    
+    config = dict(config or {})
+    if 'EMAIL_CONFIG' in config:
+        config['EMAIL_CONFIG'] = {**EMAIL_CONFIG, **config['EMAIL_CONFIG']}
+    app.config.update(config)
+    
+    CORS(app, supports_credentials=True)
+    
+    app.extensions['senhas'] = senhas.GerenciadorSenhas(
+        algoritmo=app.config['SENHA_ALGORITMO'],
+        custo=app.config['SENHA_CUSTO'],
+        pool=senhas.PoolHash(
+            workers=app.config['SENHA_POOL_WORKERS'],
+            max_fila=app.config['SENHA_POOL_FILA'],
+        ),
+    )
+    controle_admissao.init_app(app)
+    coalescedor.init_app(app)
+    metricas_http.init_app(app)
+    rastreador_sql.init_app(app)
+    perfilador.init_app(app)
+    log_requisicoes.init_app(app)
+    estaticos.init_app(app)
+    compressao.init_app(app)
+    armazenamento.init_app(app)
+    escritor.init_app(app)
+    leitura.init_app(app)
+    retencao.init_app(app)
+    exclusoes.init_app(app)
+    idempotencia.init_app(app)
+    vencimentos.init_app(app)
+    backups.init_app(app)
+    
+    app.register_blueprint(bp)
+    return app
+
+def __getattr__(nome):
+    # `from app import app` (servidor WSGI, scripts) cria a aplicação padrão só quando pedida
+    if nome == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
 if __name__ == '__main__':
-    verificar_banco_dados()
+    # `python app.py rebalancear [banco]`: leva os dados de cada usuário ao banco dono
+    # dele (ARMAZENAMENTO/ARMAZENAMENTO_FRAGMENTOS do ambiente); rode com o serviço parado
+    if sys.argv[1:2] == ['rebalancear']:
+        config = {'RETENCAO_ATIVA': False, 'VENCIMENTO_ATIVO': False}
+        if sys.argv[2:3]:
+            config['DATABASE'] = os.path.abspath(sys.argv[2])
+        app = create_app(config)
+        
+        def _conectar_preparado(caminho):
+            inicializar_banco(caminho)
+            return _conectar(caminho)
+        
+        with app.app_context():
+            movidos = armazenamento.rebalancear(_conectar_preparado, caminho_arquivo)
+        print(f"✅ {len(movidos)} usuário(s) movido(s)")
+        for usuario_id, (origem, destino) in sorted(movidos.items()):
+            print(f"   {usuario_id}: {origem} -> {destino}")
+        sys.exit(0)
+    
+    # `python app.py vacuum [banco]`: passa os bancos existentes para auto_vacuum=INCREMENTAL;
+    # o VACUUM bloqueia as escritas enquanto reescreve cada arquivo, rode numa janela de manutenção
+    if sys.argv[1:2] == ['vacuum']:
+        config = {'RETENCAO_ATIVA': False, 'VENCIMENTO_ATIVO': False}
+        if sys.argv[2:3]:
+            config['DATABASE'] = os.path.abspath(sys.argv[2])
+        app = create_app(config)
+        with app.app_context():
+            caminhos = app.extensions['armazenamento'].backend.caminhos_em_disco()
+        for caminho in caminhos:
+            inicio = time.time()
+            try:
+                convertido = ativar_auto_vacuum(caminho)
+            except sqlite3.OperationalError as e:
+                print(f"❌ {caminho}: {e}")
+                sys.exit(1)
+            if convertido:
+                print(f"✅ {caminho}: auto_vacuum=INCREMENTAL ({time.time() - inicio:.1f}s)")
+            else:
+                print(f"   {caminho}: já estava em auto_vacuum=INCREMENTAL")
+        sys.exit(0)
+    
+    # `python app.py backup [banco]`: backup online em BACKUP_DIR (pode rodar com o serviço no ar)
+    # `python app.py snapshot <destino> [banco]`: cópia consistente para análise, fora da rotação
+    if sys.argv[1:2] in (['backup'], ['snapshot']):
+        snapshot = sys.argv[1] == 'snapshot'
+        if snapshot and not sys.argv[2:3]:
+            print("uso: python app.py snapshot <destino> [banco]")
+            sys.exit(2)
+        banco = sys.argv[3:4] if snapshot else sys.argv[2:3]
+        config = {'RETENCAO_ATIVA': False, 'VENCIMENTO_ATIVO': False}
+        if banco:
+            config['DATABASE'] = os.path.abspath(banco[0])
+        app = create_app(config)
+        with app.app_context():
+            try:
+                if snapshot:
+                    destino = os.path.abspath(sys.argv[2])
+                    manifesto = backup.fazer_backup(
+                        app.extensions['armazenamento'].catalogo, backup.bancos(), destino,
+                        app.config['BACKUP_PAGINAS'], app.config['BACKUP_PAUSA'])
+                else:
+                    manifesto = backups.backup()
+                    destino = os.path.join(app.config['BACKUP_DIR'], manifesto['nome'])
+            except backup.BackupEmAndamento:
+                print("⚠️ Já existe um backup em andamento")
+                sys.exit(1)
+        print(f"✅ {'Snapshot' if snapshot else 'Backup'} em {destino} ({manifesto['duracao']:.1f}s)")
+        for item in manifesto['arquivos']:
+            print(f"   {item['nome']}: {item['tamanho']} bytes, sha256 {item['sha256'][:16]}")
+        sys.exit(0)
+    
+    # `python app.py verificar-backup <diretório>`: confere as cópias com o manifesto
+    if sys.argv[1:2] == ['verificar-backup'] and sys.argv[2:3]:
+        try:
+            problemas = backup.verificar(sys.argv[2])
+        except backup.BackupInvalido as e:
+            problemas = [str(e)]
+        for problema in problemas:
+            print(f"❌ {problema}")
+        print("✅ Backup íntegro" if not problemas else f"❌ {len(problemas)} problema(s)")
+        sys.exit(1 if problemas else 0)
+    
+    # `python app.py restaurar <diretório> [banco]`: recoloca um backup no lugar; rode com o serviço parado
+    if sys.argv[1:2] == ['restaurar'] and sys.argv[2:3]:
+        banco = os.path.abspath(sys.argv[3]) if sys.argv[3:4] else CONFIG_PADRAO['DATABASE']
+        try:
+            restaurados = backup.restaurar(sys.argv[2], banco)
+        except backup.BackupInvalido as e:
+            print(f"❌ Backup inválido: {e}")
+            sys.exit(1)
+        print(f"✅ {len(restaurados)} banco(s) restaurado(s)")
+        for caminho in restaurados:
+            print(f"   {caminho}")
+        sys.exit(0)
+    
+    app = create_app()
+    with app.app_context():
+        verificar_banco_dados()
     
     print("=" * 60)
     print("CONTRATO+ - Sistema de Gerenciamento de Contratos")
@@ -1767,12 +2659,17 @@ if __name__ == '__main__':
     print("    PUT    /api/contratos/{id}")
     print("    DELETE /api/contratos/{id}")
     print("    PUT    /api/contratos/{id}/status")
+    print("    GET    /api/contratos/changes")
     print("")
     print("  🔔 Notificações:")
     print("    GET    /api/notificacoes")
     print("    POST   /api/contratos/{id}/notificar")
     print("    GET    /api/notificacoes/recentes")
     print("    GET    /api/notificacoes/count")
+    print("    GET    /api/notificacoes/destinatarios")
+    print("    GET    /api/notificacoes/arquivo")
+    print("    GET    /api/notificacoes/retencao")
+    print("    PUT    /api/notificacoes/retencao")
     print("")
     print("  📊 Dashboard:")
     print("    GET    /api/dashboard/stats")
@@ -1780,6 +2677,12 @@ if __name__ == '__main__':
     print("    GET    /api/dashboard/contratos-vencendo")
     print("    GET    /api/dashboard/destinatarios-ativos")
     print("")
+    print("  🧹 Limpeza (jobs em segundo plano):")
+    print("    DELETE /api/notificacoes/limpar")
+    print("    DELETE /api/contratos/limpar")
+    print("    POST   /api/sistema/reset")
+    print("    GET    /api/exclusoes/{id}")
+    print("")
     print("  ⚙️ Configurações:")
     print("    GET    /api/configuracoes/perfil")
     print("    PUT    /api/configuracoes/perfil")
@@ -1787,6 +2690,10 @@ if __name__ == '__main__':
     print("  🧪 Testes:")
     print("    POST   /api/email/test")
     print("    GET    /api/system/health")
+    print("    GET    /api/system/metricas")
+    print("    GET    /api/system/backups")
+    print("    POST   /api/system/backups")
+    print("    GET    /metrics")
     print("=" * 60)
     
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
\ No newline at end of file
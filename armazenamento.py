@@ -0,0 +1,364 @@
+"""
+Onde ficam os dados de cada usuário.
+
+Os handlers não abrem arquivos: pedem conexões a escrever()/get_db_leitura()/
+get_db_connection(), que perguntam aqui qual banco usar. O catálogo (o arquivo
+de DATABASE) guarda a tabela usuario; contratos, notificações e o resto dos
+dados de um usuário ficam no banco dele:
+
+    sqlite        um arquivo só, catálogo e dados juntos (o padrão)
+    fragmentado   ARMAZENAMENTO_FRAGMENTOS arquivos <banco>-fNN.db; cada
+                  usuario_id vai para um deles por hash consistente
+    memoria       um banco em memória (cache compartilhado), para testes
+
+Cada banco tem o seu escritor e o seu pool de leitura, então as escritas de
+um usuário pesado só disputam o lock com os usuários do mesmo fragmento.
+
+Os contadores AUTOINCREMENT de cada fragmento começam em faixas separadas
+(fragmento N: N << 40), então um id nunca se repete entre bancos e
+rebalancear() move linhas sem renumerar. No fragmento, a tabela usuario tem
+só uma linha mínima por usuário, para a chave estrangeira de contrato.
+
+rebalancear() (python app.py rebalancear) leva os dados de cada usuário para
+o banco dono dele na configuração atual: depois de mudar o número de
+fragmentos (com hash consistente só ~1/N dos usuários muda de lugar), ao
+passar de sqlite para fragmentado ou de volta. Rode com o serviço parado;
+interrompido, basta rodar de novo.
+"""
+import bisect
+import contextlib
+import contextvars
+import glob
+import hashlib
+import itertools
+import logging
+import os
+import re
+import sqlite3
+
+from flask import current_app, has_app_context, has_request_context, session
+
+from retencao import ESQUEMA_ARQUIVO
+
+logger = logging.getLogger('contrato.armazenamento')
+
+REPLICAS = 64  # pontos de cada fragmento no anel
+BITS_FAIXA = 40  # ids do fragmento N começam em N << 40 (abaixo de 2**53, seguro no JavaScript)
+TABELAS_AUTOINCREMENT = ('contrato', 'notificacao', 'notificacao_destinatario', 'contrato_mudanca', 'exclusao_job')
+
+# Banco escolhido explicitamente (threads em segundo plano, operações no catálogo)
+_banco_atual = contextvars.ContextVar('banco_atual', default=None)
+
+
+@contextlib.contextmanager
+def usando(caminho):
+    """Dentro do bloco, escrever()/get_db_*() usam `caminho`"""
+    token = _banco_atual.set(caminho)
+    try:
+        yield caminho
+    finally:
+        _banco_atual.reset(token)
+
+
+def _hash(texto):
+    return int.from_bytes(hashlib.blake2b(texto.encode(), digest_size=8).digest(), 'big')
+
+
+class AnelConsistente:
+    """Hash consistente com REPLICAS pontos por nó"""
+
+    def __init__(self, nos, replicas=REPLICAS):
+        pontos = sorted((_hash(f'{no}#{i}'), no) for no in nos for i in range(replicas))
+        self._hashes = [h for h, _ in pontos]
+        self._nos = [no for _, no in pontos]
+
+    def no(self, chave):
+        i = bisect.bisect(self._hashes, _hash(str(chave)))
+        return self._nos[i % len(self._nos)]
+
+
+# ========== BACKENDS ==========
+class SQLiteUnico:
+    """Um arquivo para o catálogo e para os dados de todos os usuários"""
+
+    nome = 'sqlite'
+
+    def __init__(self, caminho):
+        self.catalogo = caminho
+
+    def caminho(self, usuario_id):
+        return self.catalogo
+
+    def caminhos(self):
+        return [self.catalogo]
+
+    def inicio_ids(self, caminho):
+        return 0
+
+    def caminhos_em_disco(self):
+        """Catálogo e fragmentos que já existem (inclusive de uma configuração anterior)"""
+        base, extensao = os.path.splitext(self.catalogo)
+        padrao = re.compile(re.escape(base) + r'-f\d+' + re.escape(extensao or '.db') + '$')
+        fragmentos = sorted(c for c in glob.glob(f'{glob.escape(base)}-f*') if padrao.match(c))
+        return [c for c in [self.catalogo] + fragmentos if os.path.exists(c)]
+
+
+class SQLiteFragmentado(SQLiteUnico):
+    """Catálogo num arquivo e dados dos usuários em N fragmentos, por hash consistente"""
+
+    nome = 'fragmentado'
+
+    def __init__(self, caminho, fragmentos):
+        super().__init__(caminho)
+        if fragmentos < 1:
+            raise ValueError('ARMAZENAMENTO_FRAGMENTOS deve ser pelo menos 1')
+        base, extensao = os.path.splitext(caminho)
+        self.fragmentos = [f'{base}-f{i:02d}{extensao or ".db"}' for i in range(fragmentos)]
+        # Os nós do anel são os índices, não os caminhos: mover a pasta não muda a distribuição
+        self._anel = AnelConsistente(range(fragmentos))
+
+    def caminho(self, usuario_id):
+        return self.fragmentos[self._anel.no(usuario_id)]
+
+    def caminhos(self):
+        return [self.catalogo] + self.fragmentos
+
+    def inicio_ids(self, caminho):
+        try:
+            return (self.fragmentos.index(caminho) + 1) << BITS_FAIXA
+        except ValueError:
+            return 0
+
+
+class Memoria(SQLiteUnico):
+    """Banco em memória com cache compartilhado; some quando o processo termina"""
+
+    nome = 'memoria'
+    _sequencia = itertools.count(1)
+
+    def __init__(self):
+        super().__init__(f'file:contratos-memoria-{os.getpid()}-{next(self._sequencia)}?mode=memory&cache=shared')
+        # O banco existe enquanto houver uma conexão aberta
+        self._ancora = sqlite3.connect(self.catalogo, uri=True, check_same_thread=False)
+
+    def caminhos_em_disco(self):
+        return [self.catalogo]
+
+
+def criar_backend(config):
+    tipo = config['ARMAZENAMENTO']
+    if tipo == 'sqlite':
+        return SQLiteUnico(config['DATABASE'])
+    if tipo == 'fragmentado':
+        return SQLiteFragmentado(config['DATABASE'], config['ARMAZENAMENTO_FRAGMENTOS'])
+    if tipo == 'memoria':
+        return Memoria()
+    raise ValueError(f'ARMAZENAMENTO desconhecido: {tipo}')
+
+
+# ========== TAREFAS ==========
+def semear_ids(conn, inicio):
+    """Contadores AUTOINCREMENT de um banco novo começam em `inicio` (só os que ainda não existem)"""
+    for tabela in TABELAS_AUTOINCREMENT:
+        conn.execute('''
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+        ''', (tabela, inicio, tabela))
+
+
+def espelhar_usuario(conn, usuario_id, esquema='main'):
+    """Tarefa do escritor: linha mínima do usuário no fragmento (nome, email e senha ficam no catálogo)"""
+    conn.execute(f'''
+        INSERT OR IGNORE INTO {esquema}.usuario (id, nome_completo, email, senha_hash)
+        VALUES (?, '', ?, '!')
+    ''', (usuario_id, f'{usuario_id}@fragmento'))
+
+
+class Bancos:
+    """Bancos de uma aplicação: o backend escolhido e o banco de cada requisição"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._espelhados = set()
+
+    @property
+    def catalogo(self):
+        return self.backend.catalogo
+
+    def caminho(self, usuario_id):
+        return self.backend.caminho(usuario_id)
+
+    def caminhos(self):
+        return self.backend.caminhos()
+
+    def inicio_ids(self, caminho):
+        return self.backend.inicio_ids(caminho)
+
+    def caminho_atual(self, catalogo=False):
+        """Banco escolhido com usando(), senão o do usuário logado; sem usuário (ou catalogo=True), o catálogo"""
+        caminho = _banco_atual.get()
+        if caminho is not None:
+            return caminho
+        if not catalogo and has_request_context() and 'usuario_id' in session:
+            return self.backend.caminho(session['usuario_id'])
+        return self.backend.catalogo
+
+    def em_cada_banco(self):
+        """Itera pelos bancos; em cada volta escrever()/get_db_*() usam o banco da vez"""
+        for caminho in self.caminhos():
+            with usando(caminho):
+                yield caminho
+
+    def espelhar(self, usuario_id, escrever):
+        """Garante a linha do usuário no fragmento dele (uma vez por processo)"""
+        caminho = self.backend.caminho(usuario_id)
+        if caminho == self.backend.catalogo or (caminho, usuario_id) in self._espelhados:
+            return
+        with usando(caminho):
+            escrever(espelhar_usuario, usuario_id)
+        self._espelhados.add((caminho, usuario_id))
+
+    def metricas(self):
+        return {
+            'backend': self.backend.nome,
+            'bancos': len(self.caminhos()),
+        }
+
+    # ========== REBALANCEAMENTO ==========
+    def rebalancear(self, conectar, caminho_arquivo):
+        """
+        Move os dados de cada usuário para o banco dono dele. `conectar(caminho)`
+        abre uma conexão (esquema já criado); devolve {usuario_id: (origem, destino)}
+        """
+        movidos = {}
+        for origem in self.backend.caminhos_em_disco():
+            conn = conectar(origem)
+            try:
+                conn.isolation_level = None
+                conn.execute('PRAGMA foreign_keys = ON')
+                conn.execute('ATTACH DATABASE ? AS arquivo', (caminho_arquivo(origem),))
+                conn.executescript(ESQUEMA_ARQUIVO)
+                usuarios = [r[0] for r in conn.execute(USUARIOS_COM_DADOS)]
+                anexado = None
+                for usuario_id in usuarios:
+                    destino = self.backend.caminho(usuario_id)
+                    if destino == origem:
+                        continue
+                    if anexado != destino:
+                        if anexado is not None:
+                            conn.execute('DETACH DATABASE destino')
+                            conn.execute('DETACH DATABASE destino_arquivo')
+                        conectar(destino).close()  # cria o esquema e semeia os ids
+                        conn.execute('ATTACH DATABASE ? AS destino', (destino,))
+                        conn.execute('ATTACH DATABASE ? AS destino_arquivo', (caminho_arquivo(destino),))
+                        conn.executescript(_esquema_arquivo('destino_arquivo'))
+                        anexado = destino
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        _mover_usuario(conn, usuario_id, remover_usuario=origem != self.backend.catalogo)
+                        conn.execute('COMMIT')
+                    except Exception:
+                        conn.execute('ROLLBACK')
+                        raise
+                    movidos[usuario_id] = (origem, destino)
+                    logger.info(f'Usuário {usuario_id}: {origem} -> {destino}')
+            finally:
+                conn.close()
+        return movidos
+
+
+class Armazenamento:
+    """
+    Extensão Flask: cada aplicação guarda os seus Bancos em
+    app.extensions['armazenamento']; os métodos daqui resolvem pelo current_app
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ARMAZENAMENTO', 'sqlite')
+        app.config.setdefault('ARMAZENAMENTO_FRAGMENTOS', 4)
+        app.extensions['armazenamento'] = Bancos(criar_backend(app.config))
+
+    @staticmethod
+    def atual():
+        return current_app.extensions['armazenamento']
+
+    def caminho_atual(self, catalogo=False):
+        return self.atual().caminho_atual(catalogo)
+
+    def inicio_ids(self, caminho):
+        # Fora de uma aplicação (criar_tabelas avulso) o banco é tratado como arquivo único
+        return self.atual().inicio_ids(caminho) if has_app_context() else 0
+
+    def espelhar(self, usuario_id, escrever):
+        return self.atual().espelhar(usuario_id, escrever)
+
+    def rebalancear(self, conectar, caminho_arquivo):
+        return self.atual().rebalancear(conectar, caminho_arquivo)
+
+    def metricas(self):
+        return self.atual().metricas()
+
+
+# Usuários com alguma linha no banco (main) ou no arquivo dele (arquivo)
+USUARIOS_COM_DADOS = '''
+    SELECT usuario_id FROM main.contrato
+    UNION SELECT usuario_id FROM main.notificacao_destinatario
+    UNION SELECT usuario_id FROM main.contrato_mudanca
+    UNION SELECT usuario_id FROM main.contrato_mudanca_corte
+    UNION SELECT usuario_id FROM main.retencao_politica
+    UNION SELECT usuario_id FROM main.exclusao_job
+    UNION SELECT usuario_id FROM main.idempotencia
+    UNION SELECT usuario_id FROM arquivo.notificacao
+'''
+
+
+def _esquema_arquivo(esquema):
+    return ESQUEMA_ARQUIVO.replace('arquivo.', f'{esquema}.')
+
+
+def _colunas(conn, esquema, tabela):
+    return ', '.join(r[1] for r in conn.execute(f'PRAGMA {esquema}.table_info({tabela})'))
+
+
+def _copiar(conn, origem, destino, tabela, filtro, parametros, conflito='IGNORE'):
+    colunas = _colunas(conn, origem, tabela)
+    conn.execute(f'''
+        INSERT OR {conflito} INTO {destino}.{tabela} ({colunas})
+        SELECT {colunas} FROM {origem}.{tabela} WHERE {filtro}
+    ''', parametros)
+
+
+def _mover_usuario(conn, usuario_id, remover_usuario):
+    """Copia as linhas do usuário de main/arquivo para destino/destino_arquivo e apaga da origem"""
+    p = (usuario_id,)
+    espelhar_usuario(conn, usuario_id, 'destino')
+    # O trigger de INSERT do destino registra cada contrato no log de mudanças de lá
+    _copiar(conn, 'main', 'destino', 'contrato', 'usuario_id = ?', p)
+    _copiar(conn, 'main', 'destino', 'notificacao',
+            'contrato_id IN (SELECT id FROM main.contrato WHERE usuario_id = ?)', p)
+    _copiar(conn, 'main', 'destino', 'notificacao_destinatario', 'usuario_id = ?', p)
+    _copiar(conn, 'main', 'destino', 'retencao_politica', 'usuario_id = ?', p, conflito='REPLACE')
+    _copiar(conn, 'main', 'destino', 'exclusao_job', 'usuario_id = ?', p)
+    _copiar(conn, 'main', 'destino', 'idempotencia', 'usuario_id = ?', p)
+    _copiar(conn, 'arquivo', 'destino_arquivo', 'notificacao', 'usuario_id = ?', p)
+    _copiar(conn, 'arquivo', 'destino_arquivo', 'notificacao_destinatario', 'usuario_id = ?', p)
+    # Cursores de sincronização da origem não valem no destino: corte no seq atual força carga completa
+    conn.execute('''
+        INSERT INTO destino.contrato_mudanca_corte (usuario_id, seq)
+        SELECT ?, COALESCE(MAX(seq), 0) FROM destino.contrato_mudanca WHERE usuario_id = ?
+        ON CONFLICT (usuario_id) DO UPDATE SET seq = MAX(seq, excluded.seq)
+    ''', (usuario_id, usuario_id))
+
+    # Notificações e destinatários saem em cascata com os contratos
+    conn.execute('DELETE FROM main.contrato WHERE usuario_id = ?', p)
+    for tabela in ('contrato_mudanca', 'contrato_mudanca_corte', 'retencao_politica',
+                   'exclusao_job', 'idempotencia', 'notificacao_destinatario'):
+        conn.execute(f'DELETE FROM main.{tabela} WHERE usuario_id = ?', p)
+    conn.execute('DELETE FROM arquivo.notificacao_destinatario WHERE usuario_id = ?', p)
+    conn.execute('DELETE FROM arquivo.notificacao WHERE usuario_id = ?', p)
+    if remover_usuario:
+        conn.execute('DELETE FROM main.usuario WHERE id = ?', p)
@@ -0,0 +1,468 @@
+"""
+Backup online dos bancos, pela API de backup do SQLite.
+
+A cópia anda em passos de BACKUP_PAGINAS páginas com BACKUP_PAUSA segundos
+entre eles: cada passo só lê o banco, então o escritor e o pool de leitura
+seguem trabalhando (WAL). Antes do primeiro passo cada origem abre uma
+transação de leitura e fica nela até o fim; a cópia é o banco naquele
+instante, sem recomeçar a cada commit. Todos os bancos do armazenamento
+(catálogo, fragmentos e os bancos de arquivo da retenção) são fixados antes
+de copiar o primeiro, então o backup é um ponto no tempo para o conjunto
+(entre arquivos, com a mesma ressalva da retenção: não é atômico).
+
+Cada backup é um diretório BACKUP_DIR/AAAAMMDD-HHMMSS com as cópias (em
+journal_mode=DELETE, um arquivo por banco) e manifesto.json com tamanho e
+sha256 de cada uma. O diretório só ganha o nome final depois de copiado e
+conferido (quick_check); ficam os BACKUP_MANTER mais recentes.
+
+Com BACKUP_ATIVO, cada processo agenda uma thread que faz um backup quando o
+último tem mais de BACKUP_INTERVALO segundos; uma trava de arquivo em
+BACKUP_DIR garante um backup por vez entre os workers.
+
+Linha de comando (ver app.py): backup, verificar-backup, restaurar (com o
+serviço parado) e snapshot (cópia para análise fora do banco de produção).
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, jsonify, session
+
+import metricas
+from armazenamento import SQLiteUnico
+from retencao import caminho_arquivo
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem fork, um processo só, a trava em memória basta
+    fcntl = None
+
+logger = logging.getLogger('contrato.backup')
+
+MANIFESTO = 'manifesto.json'
+FORMATO_NOME = '%Y%m%d-%H%M%S'
+SUFIXO_PARCIAL = '.parcial'
+
+backups_feitos = metricas.REGISTRO.contador(
+    'contrato_backups_total', 'Backups online por resultado', ('resultado',))
+bytes_copiados = metricas.REGISTRO.contador(
+    'contrato_backup_bytes_total', 'Bytes gravados pelos backups online', ())
+
+
+class BackupEmAndamento(Exception):
+    """Outro backup (deste ou de outro processo) está rodando"""
+
+
+class BackupInvalido(Exception):
+    """Manifesto ausente ou cópia que não confere com ele"""
+
+
+# ========== ARQUIVOS ==========
+def _base(catalogo):
+    """Prefixo comum dos arquivos do banco: data/contratos.db -> data/contratos"""
+    if catalogo.startswith('file:'):
+        return catalogo.partition('?')[0]
+    return os.path.splitext(catalogo)[0]
+
+
+def _sufixo(catalogo, caminho):
+    """Parte do nome que identifica o banco: '.db', '-f01.db', '-f01-arquivo.db'"""
+    nome = caminho.partition('?')[0] if caminho.startswith('file:') else caminho
+    sufixo = nome[len(_base(catalogo)):]
+    return sufixo if sufixo.endswith('.db') else sufixo + '.db'
+
+
+def bancos():
+    """Bancos da aplicação atual que entram no backup: catálogo, fragmentos em disco e os arquivos deles"""
+    caminhos = []
+    for caminho in current_app.extensions['armazenamento'].backend.caminhos_em_disco():
+        caminhos.append(caminho)
+        arquivo = caminho_arquivo(caminho)
+        if arquivo.startswith('file:') or os.path.exists(arquivo):
+            caminhos.append(arquivo)
+    return caminhos
+
+
+def sha256(caminho):
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def _abrir_origem(caminho):
+    """Conexão somente leitura já numa transação de leitura (fixa o instante da cópia)"""
+    if caminho.startswith('file:'):
+        # Memória com cache compartilhado: a transação travaria as tabelas dos outros
+        return sqlite3.connect(caminho, uri=True, check_same_thread=False)
+    conn = sqlite3.connect(f'file:{caminho}?mode=ro', uri=True, isolation_level=None, check_same_thread=False)
+    conn.execute('BEGIN')
+    conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+    return conn
+
+
+def copiar(origem, destino, paginas=256, pausa=0.01):
+    """
+    Copia a conexão `origem` para o arquivo `destino` em passos de `paginas`
+    páginas; devolve o número de páginas. A cópia fica em journal_mode=DELETE.
+    """
+    copia = sqlite3.connect(destino)
+    total = 0
+    try:
+        def progresso(status, restantes, paginas_total):
+            nonlocal total
+            total = paginas_total
+            if restantes and pausa:
+                time.sleep(pausa)
+
+        origem.backup(copia, pages=paginas, progress=progresso)
+        # O cabeçalho vem da origem (WAL); a cópia vira um arquivo só, que não muda ao ser lido
+        copia.execute('PRAGMA journal_mode = DELETE')
+        if copia.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+            raise BackupInvalido(f'{destino}: quick_check falhou')
+    finally:
+        copia.close()
+    return total
+
+
+def fazer_backup(catalogo, caminhos, destino, paginas=256, pausa=0.01):
+    """
+    Copia `caminhos` (o primeiro é o catálogo) para o diretório `destino`,
+    que não pode existir; devolve o manifesto
+    """
+    inicio = time.time()
+    parcial = destino + SUFIXO_PARCIAL
+    shutil.rmtree(parcial, ignore_errors=True)
+    os.makedirs(parcial)
+    nome_base = 'memoria' if catalogo.startswith('file:') else os.path.basename(_base(catalogo))
+    origens = []
+    try:
+        # Fixa todos os bancos antes de copiar o primeiro: um instante só para o conjunto
+        for caminho in caminhos:
+            origens.append((caminho, _abrir_origem(caminho)))
+        arquivos = []
+        for caminho, conn in origens:
+            sufixo = _sufixo(catalogo, caminho)
+            nome = nome_base + sufixo
+            copiadas = copiar(conn, os.path.join(parcial, nome), paginas, pausa)
+            versao = conn.execute('PRAGMA user_version').fetchone()[0]
+            conn.close()
+            arquivos.append({
+                'nome': nome,
+                'sufixo': sufixo,
+                'origem': caminho,
+                'paginas': copiadas,
+                'user_version': versao,
+                'tamanho': os.path.getsize(os.path.join(parcial, nome)),
+                'sha256': sha256(os.path.join(parcial, nome)),
+            })
+    except BaseException:
+        for _, conn in origens:
+            conn.close()
+        shutil.rmtree(parcial, ignore_errors=True)
+        raise
+
+    manifesto = {
+        'criado_em': datetime.fromtimestamp(inicio).isoformat(timespec='seconds'),
+        'catalogo': catalogo,
+        'duracao': round(time.time() - inicio, 3),
+        'arquivos': arquivos,
+    }
+    with open(os.path.join(parcial, MANIFESTO), 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, indent=2, ensure_ascii=False)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.rename(parcial, destino)
+    return manifesto
+
+
+def ler_manifesto(diretorio):
+    try:
+        with open(os.path.join(diretorio, MANIFESTO), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError) as e:
+        raise BackupInvalido(f'{diretorio}: manifesto ilegível ({e})')
+
+
+def verificar(diretorio):
+    """Confere tamanho e sha256 de cada cópia com o manifesto; devolve a lista de problemas"""
+    manifesto = ler_manifesto(diretorio)
+    problemas = []
+    for item in manifesto['arquivos']:
+        caminho = os.path.join(diretorio, item['nome'])
+        if not os.path.exists(caminho):
+            problemas.append(f"{item['nome']}: ausente")
+        elif os.path.getsize(caminho) != item['tamanho']:
+            problemas.append(f"{item['nome']}: tamanho {os.path.getsize(caminho)}, esperado {item['tamanho']}")
+        elif sha256(caminho) != item['sha256']:
+            problemas.append(f"{item['nome']}: sha256 não confere")
+    return problemas
+
+
+def restaurar(diretorio, catalogo):
+    """
+    Recoloca o backup no lugar do banco `catalogo` (e dos fragmentos e arquivos
+    dele); bancos em disco que não estão no backup são renomeados para
+    <banco>.antes-<backup>. Rode com o serviço parado. Devolve os caminhos restaurados.
+    """
+    problemas = verificar(diretorio)
+    if problemas:
+        raise BackupInvalido('; '.join(problemas))
+    manifesto = ler_manifesto(diretorio)
+    base = _base(catalogo)
+    destinos = {base + item['sufixo']: item for item in manifesto['arquivos']}
+
+    # Sobras de depois do backup (um fragmento novo, um arquivo de retenção) sairiam misturadas
+    atuais = SQLiteUnico(catalogo).caminhos_em_disco()
+    atuais += [caminho_arquivo(c) for c in atuais if os.path.exists(caminho_arquivo(c))]
+    for caminho in atuais:
+        if caminho not in destinos:
+            _descartar(caminho, f'{caminho}.antes-{os.path.basename(os.path.normpath(diretorio))}')
+
+    os.makedirs(os.path.dirname(catalogo) or '.', exist_ok=True)
+    for destino, item in destinos.items():
+        temporario = destino + '.restaurando'
+        shutil.copyfile(os.path.join(diretorio, item['nome']), temporario)
+        if sha256(temporario) != item['sha256']:
+            os.remove(temporario)
+            raise BackupInvalido(f"{item['nome']}: cópia restaurada não confere")
+        conn = sqlite3.connect(temporario)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.close()
+        # O WAL do banco antigo não pode ser aplicado sobre o restaurado
+        for sobra in (destino + '-wal', destino + '-shm'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(sobra)
+        os.replace(temporario, destino)
+    return sorted(destinos)
+
+
+def _descartar(caminho, novo_nome):
+    """Leva o conteúdo do WAL para o arquivo e o tira do caminho"""
+    conn = sqlite3.connect(caminho)
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    os.replace(caminho, novo_nome)
+    for sobra in (caminho + '-wal', caminho + '-shm'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(sobra)
+
+
+class Backups:
+    """Extensão Flask: backups online agendados, com rotação, e endpoints de admin"""
+
+    def __init__(self, app=None):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._executando = {}
+        self._threads = {}
+        self._em_andamento = None
+        self._contadores = {'backups': 0, 'erros': 0, 'paginas': 0, 'bytes': 0, 'removidos': 0}
+        self._ultimo = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BACKUP_ATIVO', False)
+        app.config.setdefault('BACKUP_DIR', os.path.join(app.root_path, 'data', 'backups'))
+        app.config.setdefault('BACKUP_INTERVALO', 86400)
+        app.config.setdefault('BACKUP_MANTER', 7)
+        app.config.setdefault('BACKUP_PAGINAS', 256)
+        app.config.setdefault('BACKUP_PAUSA', 0.01)
+        app.before_request(self._agendar)
+        app.add_url_rule('/api/system/backups', 'backups_listar', self.listar, methods=['GET'])
+        app.add_url_rule('/api/system/backups', 'backups_criar', self.criar, methods=['POST'])
+        app.add_url_rule('/api/system/backups/<nome>/verificar', 'backups_verificar',
+                         self.verificar_endpoint, methods=['GET'])
+        app.extensions['backups'] = self
+
+    # ========== BACKUP ==========
+    @contextlib.contextmanager
+    def _trava(self):
+        """Um backup por vez: no processo pelo lock, entre os workers por flock em BACKUP_DIR"""
+        diretorio = current_app.config['BACKUP_DIR']
+        executando = self._trava_local(diretorio)
+        if not executando.acquire(blocking=False):
+            raise BackupEmAndamento()
+        try:
+            os.makedirs(diretorio, exist_ok=True)
+            with open(os.path.join(diretorio, '.trava'), 'w') as trava:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        raise BackupEmAndamento()
+                yield
+        finally:
+            executando.release()
+
+    def _trava_local(self, diretorio):
+        with self._lock:
+            return self._executando.setdefault(diretorio, threading.Lock())
+
+    def backup(self, so_se_vencido=False):
+        """Faz um backup de todos os bancos e roda a rotação; precisa do app context"""
+        with self._trava():
+            if so_se_vencido and not self._vencido():
+                return None
+            armazenamento = current_app.extensions['armazenamento']
+            nome = datetime.now().strftime(FORMATO_NOME)
+            self._em_andamento = nome
+            try:
+                manifesto = fazer_backup(
+                    armazenamento.catalogo, bancos(),
+                    os.path.join(current_app.config['BACKUP_DIR'], nome),
+                    current_app.config['BACKUP_PAGINAS'], current_app.config['BACKUP_PAUSA']
+                )
+            except Exception:
+                backups_feitos.inc('erro')
+                self._contar(erros=1)
+                raise
+            finally:
+                self._em_andamento = None
+            tamanho = sum(item['tamanho'] for item in manifesto['arquivos'])
+            backups_feitos.inc('ok')
+            bytes_copiados.inc(valor=tamanho)
+            self._contar(backups=1, bytes=tamanho,
+                         paginas=sum(item['paginas'] for item in manifesto['arquivos']),
+                         removidos=self._rotacionar())
+            self._ultimo = {'nome': nome, 'duracao': manifesto['duracao'], 'tamanho': tamanho}
+            return {'nome': nome, **manifesto}
+
+    def concluidos(self):
+        """Nomes dos backups completos, do mais antigo para o mais novo"""
+        diretorio = current_app.config['BACKUP_DIR']
+        if not os.path.isdir(diretorio):
+            return []
+        return sorted(nome for nome in os.listdir(diretorio)
+                      if os.path.isfile(os.path.join(diretorio, nome, MANIFESTO)))
+
+    def _vencido(self):
+        concluidos = self.concluidos()
+        if not concluidos:
+            return True
+        ultimo = os.path.getmtime(os.path.join(current_app.config['BACKUP_DIR'], concluidos[-1], MANIFESTO))
+        return time.time() - ultimo >= current_app.config['BACKUP_INTERVALO']
+
+    def _rotacionar(self):
+        diretorio = current_app.config['BACKUP_DIR']
+        removidos = 0
+        for antigo in self.concluidos()[:-current_app.config['BACKUP_MANTER']]:
+            shutil.rmtree(os.path.join(diretorio, antigo), ignore_errors=True)
+            removidos += 1
+        # Parciais de um processo que morreu no meio (com a trava, ninguém mais está copiando)
+        for nome in os.listdir(diretorio):
+            if nome.endswith(SUFIXO_PARCIAL):
+                shutil.rmtree(os.path.join(diretorio, nome), ignore_errors=True)
+        return removidos
+
+    def _contar(self, **valores):
+        with self._lock:
+            for chave, valor in valores.items():
+                self._contadores[chave] += valor
+
+    # ========== AGENDAMENTO ==========
+    def _agendar(self):
+        if not current_app.config['BACKUP_ATIVO']:
+            return
+        caminho = current_app.config['DATABASE']
+        if caminho in self._threads and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads não sobrevivem ao fork: cada worker agenda a sua
+                self._threads = {}
+                self._pid = os.getpid()
+            if caminho in self._threads:
+                return
+            thread = threading.Thread(target=self._rodar, args=(current_app._get_current_object(),),
+                                      name='backup', daemon=True)
+            self._threads[caminho] = thread
+        thread.start()
+
+    def _rodar(self, app):
+        # Espera inicial aleatória: os workers não tentam a trava ao mesmo tempo
+        time.sleep(random.uniform(1, 60))
+        while True:
+            with app.app_context():
+                try:
+                    resultado = self.backup(so_se_vencido=True)
+                    if resultado:
+                        logger.info('Backup %(nome)s concluído em %(duracao).1fs', resultado)
+                except BackupEmAndamento:
+                    pass
+                except Exception as e:
+                    logger.error(f'Erro no backup: {e}')
+            time.sleep(max(60, min(app.config['BACKUP_INTERVALO'], 3600)) * random.uniform(0.9, 1.1))
+
+    def metricas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+        dados['em_andamento'] = self._em_andamento
+        dados['ultimo'] = self._ultimo
+        return dados
+
+    # ========== ENDPOINTS ==========
+    @staticmethod
+    def eh_admin():
+        # Coluna usuario.admin, gravada na sessão no login (o email o usuário pode trocar)
+        return bool(session.get('usuario_admin'))
+
+    def listar(self):
+        if not self.eh_admin():
+            return jsonify({'success': False, 'message': 'Acesso restrito a administradores'}), 403
+        backups = []
+        for nome in reversed(self.concluidos()):
+            try:
+                manifesto = ler_manifesto(os.path.join(current_app.config['BACKUP_DIR'], nome))
+            except BackupInvalido:
+                continue
+            backups.append({
+                'nome': nome,
+                'criado_em': manifesto['criado_em'],
+                'duracao': manifesto['duracao'],
+                'tamanho': sum(item['tamanho'] for item in manifesto['arquivos']),
+                'arquivos': [item['nome'] for item in manifesto['arquivos']],
+            })
+        return jsonify({'success': True, 'backups': backups, 'em_andamento': self._em_andamento})
+
+    def criar(self):
+        if not self.eh_admin():
+            return jsonify({'success': False, 'message': 'Acesso restrito a administradores'}), 403
+        if self._trava_local(current_app.config['BACKUP_DIR']).locked():
+            return jsonify({'success': False, 'message': 'Já existe um backup em andamento'}), 409, {'Retry-After': '1'}
+        app = current_app._get_current_object()
+
+        def executar():
+            with app.app_context():
+                try:
+                    self.backup()
+                except BackupEmAndamento:
+                    pass
+                except Exception as e:
+                    logger.error(f'Erro no backup: {e}')
+
+        threading.Thread(target=executar, name='backup-manual', daemon=True).start()
+        return jsonify({'success': True, 'message': 'Backup iniciado'}), 202
+
+    def verificar_endpoint(self, nome):
+        if not self.eh_admin():
+            return jsonify({'success': False, 'message': 'Acesso restrito a administradores'}), 403
+        if nome not in self.concluidos():
+            return jsonify({'success': False, 'message': 'Backup não encontrado'}), 404
+        try:
+            problemas = verificar(os.path.join(current_app.config['BACKUP_DIR'], nome))
+        except BackupInvalido as e:
+            problemas = [str(e)]
+        return jsonify({'success': not problemas, 'backup': nome, 'problemas': problemas})
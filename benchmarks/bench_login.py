@@ -0,0 +1,132 @@
+"""
+Benchmark de login: logins/s e latência (p50/p99) para diferentes custos de hash.
+
+Uso:
+    python benchmarks/bench_login.py
+    python benchmarks/bench_login.py --algoritmo scrypt --custos 12 14 15
+    python benchmarks/bench_login.py --custos 100000 260000 600000 --threads 16 --duracao 10
+
+Enquanto os logins rodam, uma thread sonda /api/system/health para mostrar
+se o hash está tirando capacidade das outras rotas.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as contrato_app  # noqa: E402
+import senhas  # noqa: E402
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def preparar_usuarios(app, total, hasher, custo):
+    with app.app_context():
+        conn = contrato_app.get_db_connection()
+        conn.execute("DELETE FROM usuario WHERE email LIKE 'bench%@contratomais.com'")
+        senha_hash = hasher.gerar('senha-bench', custo)
+        conn.executemany(
+            'INSERT INTO usuario (nome_completo, email, senha_hash) VALUES (?, ?, ?)',
+            [(f'Bench {i}', f'bench{i}@contratomais.com', senha_hash) for i in range(total)]
+        )
+        conn.commit()
+        conn.close()
+
+
+def rodar(app, algoritmo, custo, args):
+    pool = senhas.PoolHash(workers=args.workers, max_fila=args.fila)
+    app.extensions['senhas'] = senhas.GerenciadorSenhas(algoritmo, custo, pool)
+    preparar_usuarios(app, args.usuarios, app.extensions['senhas'].hasher, custo)
+
+    latencias = []
+    sonda = []
+    rejeitados = [0]
+    lock = threading.Lock()
+    fim = time.perf_counter() + args.duracao
+
+    def cliente(indice):
+        client = app.test_client()
+        email = f'bench{indice % args.usuarios}@contratomais.com'
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            resp = client.post('/api/auth/login', json={'email': email, 'senha': 'senha-bench'})
+            decorrido = time.perf_counter() - inicio
+            with lock:
+                if resp.status_code == 200:
+                    latencias.append(decorrido)
+                else:
+                    rejeitados[0] += 1
+
+    def sondar():
+        client = app.test_client()
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            client.get('/api/system/health')
+            sonda.append(time.perf_counter() - inicio)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(args.threads)]
+    threads.append(threading.Thread(target=sondar))
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - inicio
+    metricas = pool.metricas()
+    pool.encerrar()
+
+    return {
+        'algoritmo': algoritmo,
+        'custo': custo,
+        'logins_s': len(latencias) / total,
+        'p50_ms': percentil(latencias, 50) * 1000,
+        'p99_ms': percentil(latencias, 99) * 1000,
+        'rejeitados': rejeitados[0],
+        'espera_media_ms': metricas['espera_media_ms'],
+        'health_p99_ms': percentil(sonda, 99) * 1000,
+        'health_media_ms': (statistics.mean(sonda) * 1000) if sonda else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--algoritmo', default='pbkdf2-sha256', choices=sorted(n for n in senhas.HASHERS if n != 'sha256'))
+    parser.add_argument('--custos', type=int, nargs='+')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2, help='workers do pool de hash')
+    parser.add_argument('--fila', type=int, default=32, help='tamanho da fila do pool de hash')
+    parser.add_argument('--usuarios', type=int, default=50)
+    parser.add_argument('--duracao', type=float, default=5.0, help='segundos por custo')
+    args = parser.parse_args()
+
+    custos = args.custos or {
+        'pbkdf2-sha256': [50000, 150000, 260000, 600000],
+        'scrypt': [12, 14, 15],
+    }[args.algoritmo]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = contrato_app.create_app({'DATABASE': os.path.join(tmp, 'bench.db')})
+
+        print(f"{'algoritmo':<15}{'custo':>9}{'logins/s':>11}{'p50 ms':>10}{'p99 ms':>10}"
+              f"{'rejeit.':>9}{'fila ms':>10}{'health p99':>12}")
+        for custo in custos:
+            r = rodar(app, args.algoritmo, custo, args)
+            print(f"{r['algoritmo']:<15}{r['custo']:>9}{r['logins_s']:>11.1f}{r['p50_ms']:>10.1f}"
+                  f"{r['p99_ms']:>10.1f}{r['rejeitados']:>9}{r['espera_media_ms']:>10.1f}"
+                  f"{r['health_p99_ms']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark de carga: servidor de desenvolvimento do Flask x `python app.py serve`.
+
+Cada cliente abre uma conexão keep-alive, faz login com o admin padrão e
+depois repete GETs de /api/auth/check, /api/contratos e /api/dashboard/stats.
+
+Uso:
+    python benchmarks/bench_servidor.py
+    python benchmarks/bench_servidor.py --clientes 32 --duracao 15 --workers 4 --threads 8
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROTAS = ['/api/auth/check', '/api/contratos', '/api/dashboard/stats']
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def esperar_porta(porta, timeout=20):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', porta, timeout=1)
+            conn.request('GET', '/api/system/health')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Servidor não respondeu na porta {porta}')
+
+
+def iniciar(modo, porta, args):
+    if modo == 'dev':
+        cmd = [sys.executable, '-c',
+               f'import app; app.app.run(host="127.0.0.1", port={porta}, threaded=True)']
+    else:
+        cmd = [sys.executable, 'app.py', 'serve', '--host', '127.0.0.1', '--port', str(porta),
+               '--workers', str(args.workers), '--threads', str(args.threads)]
+    proc = subprocess.Popen(cmd, cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    esperar_porta(porta)
+    return proc
+
+
+def carga(porta, args):
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    fim = time.perf_counter() + args.duracao
+
+    def cliente(indice):
+        conn = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+        conn.request('POST', '/api/auth/login',
+                     body=json.dumps({'email': 'admin@contratomais.com', 'senha': 'admin123'}),
+                     headers={'Content-Type': 'application/json'})
+        resp = conn.getresponse()
+        resp.read()
+        cookie = (resp.getheader('Set-Cookie') or '').split(';')[0]
+        i = indice
+        while time.perf_counter() < fim:
+            rota = ROTAS[i % len(ROTAS)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                conn.request('GET', rota, headers={'Cookie': cookie})
+                resp = conn.getresponse()
+                resp.read()
+                ok = resp.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+            decorrido = time.perf_counter() - inicio
+            with lock:
+                if ok:
+                    latencias.append(decorrido)
+                else:
+                    erros[0] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(args.clientes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - inicio
+
+    return {
+        'req_s': len(latencias) / total,
+        'p50_ms': percentil(latencias, 50) * 1000,
+        'p95_ms': percentil(latencias, 95) * 1000,
+        'p99_ms': percentil(latencias, 99) * 1000,
+        'erros': erros[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--duracao', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--porta', type=int, default=5099)
+    parser.add_argument('--modos', nargs='+', default=['dev', 'serve'], choices=['dev', 'serve'])
+    args = parser.parse_args()
+
+    print(f"{'servidor':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erros':>8}")
+    for modo in args.modos:
+        proc = iniciar(modo, args.porta, args)
+        try:
+            r = carga(args.porta, args)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=40)
+        print(f"{modo:<10}{r['req_s']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['erros']:>8}")
+
+
+if __name__ == '__main__':
+    main()
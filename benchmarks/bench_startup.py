@@ -0,0 +1,93 @@
+"""
+Mede o cold start do CONTRATO+ em processos novos.
+
+Etapas medidas (mediana de N execuções):
+    import        `import app` (sem efeitos colaterais de I/O)
+    create_app    montagem da aplicação
+    1a conexão    inicialização preguiçosa do banco (leitura do PRAGMA user_version)
+    1a requisição GET /api/system/health completo
+    verificacao   verificar_banco_dados() (versão do esquema, sem COUNT(*))
+    counts        o que a verificação antiga fazia: COUNT(*) em cada tabela
+
+Uso:
+    python benchmarks/bench_startup.py --linhas 200000 --repeticoes 7
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SONDA = r'''
+import io, json, sqlite3, sys, time, contextlib
+t0 = time.perf_counter()
+import app as m
+t1 = time.perf_counter()
+a = m.create_app({'DATABASE': sys.argv[1]})
+t2 = time.perf_counter()
+with a.app_context():
+    m.get_db_connection().close()
+t3 = time.perf_counter()
+a.test_client().get('/api/system/health')
+t4 = time.perf_counter()
+with a.app_context(), contextlib.redirect_stdout(io.StringIO()):
+    m.verificar_banco_dados()
+t5 = time.perf_counter()
+conn = sqlite3.connect(sys.argv[1])
+for (nome,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+    conn.execute(f'SELECT COUNT(*) FROM [{nome}]').fetchone()
+conn.close()
+t6 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, '1a conexão': t3 - t2,
+                  '1a requisição': t4 - t3, 'verificacao': t5 - t4, 'counts': t6 - t5}))
+'''
+
+
+def popular(caminho, linhas):
+    """Cria um banco com `linhas` contratos e notificações para pesar os COUNT(*)"""
+    sys.path.insert(0, RAIZ)
+    import app as m
+    with m.create_app({'DATABASE': caminho}).app_context():
+        m.get_db_connection().close()
+    conn = sqlite3.connect(caminho)
+    conn.executemany(
+        'INSERT INTO contrato (nome, descricao, data_inicio, data_fim, usuario_id) VALUES (?, ?, ?, ?, 1)',
+        ((f'Contrato {i}', 'x' * 200, '2025-01-01', '2027-01-01') for i in range(linhas))
+    )
+    conn.executemany(
+        'INSERT INTO notificacao (contrato_id, tipo, assunto, mensagem, email_destino) VALUES (?, ?, ?, ?, ?)',
+        ((i + 1, 'lembrete_mensal', 'Assunto', 'y' * 300, 'a@b.com') for i in range(linhas))
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=100000)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, 'startup.db')
+        popular(caminho, args.linhas)
+
+        medidas = {}
+        for _ in range(args.repeticoes):
+            saida = subprocess.run([sys.executable, '-c', SONDA, caminho], cwd=RAIZ,
+                                   capture_output=True, text=True, check=True).stdout
+            for etapa, valor in json.loads(saida.strip().splitlines()[-1]).items():
+                medidas.setdefault(etapa, []).append(valor)
+
+    print(f'Cold start ({args.linhas} contratos/notificações, mediana de {args.repeticoes})')
+    for etapa, valores in medidas.items():
+        print(f'  {etapa:<15}{statistics.median(valores) * 1000:>10.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
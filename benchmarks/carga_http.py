@@ -0,0 +1,431 @@
+"""
+Teste de carga HTTP com o mix de páginas real do front-end.
+
+Cada cliente virtual loga como um usuário sintético (ver gerar_dados.py),
+mantém uma conexão keep-alive e sorteia operações com os pesos de MIX:
+checagem de sessão, stats do dashboard, polling da lista de contratos e do
+contador de notificações, criação de contrato, troca de status e envio de
+notificação. O SMTP aponta para um sumidouro local, então o envio de
+notificação exercita o caminho completo sem sair da máquina.
+
+Sem --url o script gera a base (ou completa uma existente com os usuários
+que faltam até --usuarios) e sobe `python app.py serve`
+com a fábrica criar_app_carga deste módulo. Os resultados (vazão e
+p50/p95/p99 por operação) vão para a saída e, com --saida, para um JSON que
+pode ser comparado com outra execução via --comparar.
+
+Uso:
+    python benchmarks/carga_http.py --usuarios 100 --contratos 50 --clientes 32 --duracao 30
+    python benchmarks/carga_http.py --saida antes.json
+    python benchmarks/carga_http.py --saida depois.json --comparar antes.json
+    python benchmarks/carga_http.py --escrita direta --mix criar_contrato=40,atualizar_status=40
+    python benchmarks/carga_http.py --fragmentos 4 --mix criar_contrato=40,atualizar_status=40
+    python benchmarks/carga_http.py --url http://127.0.0.1:5000 --clientes 8
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.gerar_dados import email_usuario, gerar  # noqa: E402
+
+# Pesos aproximados das chamadas que as páginas fazem
+MIX = {
+    'auth_check': 20,
+    'dashboard_stats': 15,
+    'listar_contratos': 30,
+    'notificacoes_count': 15,
+    'criar_contrato': 8,
+    'atualizar_status': 8,
+    'notificar': 4,
+}
+STATUS = ['ativo', 'inativo', 'concluido', 'pendente']
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+# ========== SERVIDOR SOB TESTE ==========
+class _SessaoSMTP(socketserver.StreamRequestHandler):
+    """Aceita qualquer mensagem e descarta (só o necessário para o smtplib)"""
+
+    def _responder(self, linha):
+        self.wfile.write(linha.encode() + b'\r\n')
+
+    def handle(self):
+        self._responder('220 sumidouro')
+        em_dados = False
+        for linha in self.rfile:
+            comando = linha.strip().upper()
+            if em_dados:
+                if comando == b'.':
+                    em_dados = False
+                    self._responder('250 ok')
+                continue
+            if comando.startswith((b'EHLO', b'HELO')):
+                self._responder('250-sumidouro')
+                self._responder('250 AUTH PLAIN LOGIN')
+            elif comando.startswith(b'AUTH'):
+                self._responder('235 ok')
+            elif comando == b'DATA':
+                em_dados = True
+                self._responder('354 fim com .')
+            elif comando == b'QUIT':
+                self._responder('221 tchau')
+                return
+            else:
+                self._responder('250 ok')
+
+
+class SumidouroSMTP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, porta=0):
+        super().__init__(('127.0.0.1', porta), _SessaoSMTP)
+        self.porta = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+def criar_app_carga():
+    """Fábrica usada pelo `app.py serve` no teste: banco e SMTP vêm do ambiente"""
+    import app as aplicacao
+    return aplicacao.create_app({
+        'DATABASE': os.environ['CARGA_DB'],
+        'EMAIL_CONFIG': {
+            'smtp_server': '127.0.0.1',
+            'smtp_port': int(os.environ['CARGA_SMTP_PORTA']),
+            'use_tls': False,
+        },
+        'LOG_AMOSTRAGEM': 0.0,
+        'ESCRITA_ATIVA': os.environ.get('CARGA_ESCRITA', 'fila') == 'fila',
+    })
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def esperar_porta(host, porta, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            conn = http.client.HTTPConnection(host, porta, timeout=1)
+            conn.request('GET', '/api/system/health')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Servidor não respondeu em {host}:{porta}')
+
+
+def iniciar_servidor(args, smtp):
+    porta = _porta_livre()
+    env = dict(os.environ, CARGA_DB=os.path.abspath(args.db), CARGA_SMTP_PORTA=str(smtp.porta),
+               CARGA_ESCRITA=args.escrita)
+    if args.fragmentos:
+        env.update(ARMAZENAMENTO='fragmentado', ARMAZENAMENTO_FRAGMENTOS=str(args.fragmentos))
+    else:
+        env['ARMAZENAMENTO'] = 'sqlite'
+    # Distribui os usuários entre os fragmentos (ou junta de volta num arquivo) antes de subir
+    subprocess.run([sys.executable, 'app.py', 'rebalancear', os.path.abspath(args.db)],
+                   cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    cmd = [sys.executable, 'app.py', 'serve', '--app', 'benchmarks.carga_http:criar_app_carga',
+           '--host', '127.0.0.1', '--port', str(porta),
+           '--workers', str(args.workers), '--threads', str(args.threads)]
+    proc = subprocess.Popen(cmd, cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    esperar_porta('127.0.0.1', porta)
+    return proc, '127.0.0.1', porta
+
+
+# ========== CLIENTE ==========
+class Cliente:
+    def __init__(self, host, porta, email, senha, rng):
+        self.conn = http.client.HTTPConnection(host, porta, timeout=30)
+        self.rng = rng
+        self.cookie = ''
+        self.contratos = []
+        status, corpo = self.chamar('POST', '/api/auth/login', {'email': email, 'senha': senha})
+        if status != 200:
+            raise RuntimeError(f'Login de {email} falhou ({status})')
+        status, corpo = self.chamar('GET', '/api/contratos')
+        self.contratos = [c['id'] for c in json.loads(corpo).get('contratos', [])]
+
+    def chamar(self, metodo, rota, dados=None):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        corpo = None
+        if dados is not None:
+            corpo = json.dumps(dados)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(metodo, rota, body=corpo, headers=headers)
+            resposta = self.conn.getresponse()
+            conteudo = resposta.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+        cookie = resposta.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';')[0]
+        return resposta.status, conteudo
+
+    def operacao(self, nome):
+        rng = self.rng
+        if nome == 'auth_check':
+            return self.chamar('GET', '/api/auth/check')
+        if nome == 'dashboard_stats':
+            return self.chamar('GET', '/api/dashboard/stats')
+        if nome == 'listar_contratos':
+            return self.chamar('GET', '/api/contratos')
+        if nome == 'notificacoes_count':
+            return self.chamar('GET', '/api/notificacoes/count')
+        if nome == 'criar_contrato':
+            inicio = date.today() - timedelta(days=rng.randrange(60))
+            status, corpo = self.chamar('POST', '/api/contratos', {
+                'nome': f'Contrato de carga {rng.randrange(100000)}',
+                'descricao': 'criado pelo teste de carga',
+                'data_inicio': inicio.isoformat(),
+                'data_fim': (inicio + timedelta(days=365)).isoformat(),
+            })
+            if status == 200:
+                self.contratos.append(json.loads(corpo)['contrato']['id'])
+            return status, corpo
+        if not self.contratos:
+            return self.operacao('listar_contratos')
+        contrato_id = rng.choice(self.contratos)
+        if nome == 'atualizar_status':
+            return self.chamar('PUT', f'/api/contratos/{contrato_id}/status', {'status': rng.choice(STATUS)})
+        if nome == 'notificar':
+            return self.chamar('POST', f'/api/contratos/{contrato_id}/notificar', {
+                'emails': 'contato@cliente.local', 'tipo': 'lembrete_mensal',
+            })
+        raise ValueError(f'Operação desconhecida: {nome}')
+
+
+def carga(host, porta, args, mix):
+    nomes = list(mix)
+    pesos = [mix[n] for n in nomes]
+    amostras = {n: [] for n in nomes}
+    contagem = {n: {'erros': 0, 'rejeitadas': 0} for n in nomes}
+    lock = threading.Lock()
+    marcos = {}
+    falhas = []
+
+    def marcar():
+        # Roda uma vez, quando todos os clientes já logaram, antes de liberar a barreira
+        marcos['medir'] = time.perf_counter() + args.aquecimento
+        marcos['fim'] = marcos['medir'] + args.duracao
+
+    barreira = threading.Barrier(args.clientes + 1, action=marcar)
+
+    def rodar(indice):
+        rng = random.Random(args.seed + indice)
+        email = email_usuario(indice % args.usuarios + 1)
+        cliente = None
+        try:
+            cliente = Cliente(host, porta, email, args.senha, rng)
+        except (RuntimeError, OSError, http.client.HTTPException) as e:
+            with lock:
+                falhas.append(str(e))
+        finally:
+            barreira.wait()
+        if cliente is None:
+            return
+        local = {n: [] for n in nomes}
+        erros = {n: [0, 0] for n in nomes}
+        while time.perf_counter() < marcos['fim']:
+            nome = rng.choices(nomes, pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                status, _ = cliente.operacao(nome)
+            except (OSError, http.client.HTTPException):
+                status = 0
+            decorrido = time.perf_counter() - inicio
+            if inicio < marcos['medir']:
+                continue
+            if status == 503:
+                erros[nome][1] += 1
+            elif not 200 <= status < 400:
+                erros[nome][0] += 1
+            else:
+                local[nome].append(decorrido * 1000)
+        with lock:
+            for n in nomes:
+                amostras[n].extend(local[n])
+                contagem[n]['erros'] += erros[n][0]
+                contagem[n]['rejeitadas'] += erros[n][1]
+
+    threads = [threading.Thread(target=rodar, args=(i,)) for i in range(args.clientes)]
+    for t in threads:
+        t.start()
+    barreira.wait()
+    if falhas:
+        # Sem login não há carga a medir: encerra os outros clientes e para antes de medir
+        marcos['fim'] = 0
+    for t in threads:
+        t.join()
+    if falhas:
+        raise SystemExit(f'{len(falhas)} de {args.clientes} clientes não fizeram login ({falhas[0]}); '
+                         f'a base precisa de carga1..carga{args.usuarios} com a senha --senha')
+
+    resultado = {}
+    for n in nomes:
+        lat = amostras[n]
+        resultado[n] = {
+            'requisicoes': len(lat),
+            'rps': round(len(lat) / args.duracao, 1),
+            'p50_ms': round(percentil(lat, 50), 2),
+            'p95_ms': round(percentil(lat, 95), 2),
+            'p99_ms': round(percentil(lat, 99), 2),
+            'max_ms': round(max(lat), 2) if lat else 0.0,
+            **contagem[n],
+        }
+    todas = [v for n in nomes for v in amostras[n]]
+    resultado['total'] = {
+        'requisicoes': len(todas),
+        'rps': round(len(todas) / args.duracao, 1),
+        'p50_ms': round(percentil(todas, 50), 2),
+        'p95_ms': round(percentil(todas, 95), 2),
+        'p99_ms': round(percentil(todas, 99), 2),
+        'max_ms': round(max(todas), 2) if todas else 0.0,
+        'erros': sum(c['erros'] for c in contagem.values()),
+        'rejeitadas': sum(c['rejeitadas'] for c in contagem.values()),
+    }
+    return resultado
+
+
+# ========== RELATÓRIO ==========
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def imprimir(resultado):
+    print(f"{'operação':<20}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'erros':>7}{'503':>6}")
+    for nome, r in resultado.items():
+        print(f"{nome:<20}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['max_ms']:>9.2f}{r['erros']:>7}{r['rejeitadas']:>6}")
+
+
+def comparar(atual, anterior):
+    print(f"\ncomparação com {anterior['meta'].get('commit') or 'execução anterior'} "
+          f"({anterior['meta']['data']}):")
+    print(f"{'operação':<20}{'req/s':>16}{'p95 (ms)':>20}{'p99 (ms)':>20}")
+    for nome, r in atual['resultados'].items():
+        base = anterior['resultados'].get(nome)
+        if not base:
+            continue
+
+        def delta(chave):
+            if not base[chave]:
+                return f"{r[chave]:>9.1f}       "
+            return f"{r[chave]:>9.1f} {100 * (r[chave] - base[chave]) / base[chave]:>+5.0f}%"
+        print(f"{nome:<20}{delta('rps'):>16}{delta('p95_ms'):>20}{delta('p99_ms'):>20}")
+
+
+def _ler_mix(texto):
+    mix = dict(MIX)
+    if texto:
+        for par in texto.split(','):
+            nome, _, peso = par.partition('=')
+            if nome.strip() not in MIX:
+                raise SystemExit(f'Operação desconhecida no --mix: {nome}')
+            mix[nome.strip()] = float(peso)
+    return {n: p for n, p in mix.items() if p > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga HTTP do CONTRATO+')
+    parser.add_argument('--url', help='servidor já rodando (sem isso, sobe um `app.py serve`)')
+    parser.add_argument('--db', default=os.path.join(RAIZ, 'data', 'carga.db'))
+    parser.add_argument('--usuarios', type=int, default=100)
+    parser.add_argument('--contratos', type=int, default=50, help='contratos por usuário (geração)')
+    parser.add_argument('--notificacoes', type=int, default=3, help='notificações por contrato (geração)')
+    parser.add_argument('--senha', default='carga123')
+    parser.add_argument('--clientes', type=int, default=16, help='clientes concorrentes')
+    parser.add_argument('--duracao', type=float, default=20.0, help='segundos medidos')
+    parser.add_argument('--aquecimento', type=float, default=3.0, help='segundos descartados')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--escrita', choices=('fila', 'direta'), default='fila',
+                        help='escritas pelo escritor único (fila) ou direto na requisição (direta)')
+    parser.add_argument('--fragmentos', type=int, default=0,
+                        help='usuários distribuídos em N bancos SQLite (0 = um arquivo só)')
+    parser.add_argument('--mix', help='pesos, ex.: listar_contratos=50,notificar=0')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--saida', help='arquivo JSON com os resultados')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior')
+    args = parser.parse_args()
+    mix = _ler_mix(args.mix)
+
+    proc = None
+    if args.url:
+        partes = urlsplit(args.url)
+        host, porta = partes.hostname, partes.port or 80
+    else:
+        # Cria a base, ou completa uma existente com os usuários que faltam até --usuarios
+        totais = gerar(args.db, args.usuarios, args.contratos, args.notificacoes, senha=args.senha)
+        if totais['usuarios']:
+            print(f"base gerada: {totais['usuarios']} usuários, {totais['contratos']} contratos, "
+                  f"{totais['notificacoes']} notificações ({totais['destinatarios']} destinatários)")
+        smtp = SumidouroSMTP()
+        proc, host, porta = iniciar_servidor(args, smtp)
+
+    try:
+        print(f'{args.clientes} clientes, {args.duracao:.0f}s (+{args.aquecimento:.0f}s de aquecimento) '
+              f'contra {host}:{porta}\n')
+        resultados = carga(host, porta, args, mix)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    imprimir(resultados)
+    execucao = {
+        'meta': {
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit_atual(),
+            'url': args.url,
+            'clientes': args.clientes,
+            'duracao': args.duracao,
+            'workers': None if args.url else args.workers,
+            'threads': None if args.url else args.threads,
+            'escrita': None if args.url else args.escrita,
+            'fragmentos': None if args.url else args.fragmentos,
+            'usuarios': args.usuarios,
+            'mix': mix,
+        },
+        'resultados': resultados,
+    }
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            comparar(execucao, json.load(arquivo))
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(execucao, arquivo, ensure_ascii=False, indent=2)
+        print(f'\nresultados em {args.saida}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Gera uma base sintética para testes de carga: N usuários × M contratos × K notificações.
+
+Distribuições:
+    data_inicio   uniforme nos últimos --anos anos
+    duração       6/12/24/36 meses (pesos 20/45/25/10)
+    status        vigentes: ativo 80%, pendente 15%, inativo 5%
+                  já vencidos: concluido 60%, inativo 20%, ativo 20% (esquecidos)
+    notificações  tipos do front-end; enviadas 90% / erro 10%; 1 a 3 destinatários
+                  (também em notificacao_destinatario, normalizados como no envio);
+                  data_envio entre o início do contrato e hoje
+
+Os usuários são carga1@contratomais.local .. cargaN@contratomais.local, todos
+com a mesma senha (--senha); o hash é calculado uma vez com o algoritmo
+configurado da aplicação. Usuários já existentes são pulados.
+
+Uso:
+    python benchmarks/gerar_dados.py --db /tmp/carga.db --usuarios 200 --contratos 50 --notificacoes 4
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+DURACOES_MESES = ([6, 12, 24, 36], [20, 45, 25, 10])
+STATUS_VIGENTE = (['ativo', 'pendente', 'inativo'], [80, 15, 5])
+STATUS_VENCIDO = (['concluido', 'inativo', 'ativo'], [60, 20, 20])
+TIPOS_NOTIFICACAO = (
+    ['lembrete_mensal', 'lembrete_semanal', 'lembrete_diario', 'confirmacao_ativação', 'customizado'],
+    [35, 30, 20, 10, 5],
+)
+PREFIXOS = ['Locação', 'Manutenção', 'Licença', 'Prestação de serviços', 'Fornecimento', 'Consultoria']
+OBJETOS = ['sala comercial', 'ar-condicionado', 'software ERP', 'limpeza', 'internet', 'segurança', 'frota']
+BATCH = 5000
+
+
+def email_usuario(indice):
+    return f'carga{indice}@contratomais.local'
+
+
+def _escolher(rng, opcoes):
+    valores, pesos = opcoes
+    return rng.choices(valores, pesos)[0]
+
+
+def _contrato(rng, usuario_id, hoje, anos):
+    inicio = hoje - timedelta(days=rng.randrange(anos * 365))
+    fim = inicio + timedelta(days=30 * _escolher(rng, DURACOES_MESES))
+    status = _escolher(rng, STATUS_VENCIDO if fim < hoje else STATUS_VIGENTE)
+    nome = f'{rng.choice(PREFIXOS)} - {rng.choice(OBJETOS)} #{rng.randrange(1, 10000)}'
+    criado = datetime.combine(inicio, datetime.min.time()) - timedelta(days=rng.randrange(30))
+    return (nome, f'Contrato gerado para teste de carga ({nome.lower()})',
+            inicio.isoformat(), fim.isoformat(), status,
+            criado.strftime('%Y-%m-%d %H:%M:%S'), criado.strftime('%Y-%m-%d %H:%M:%S'), usuario_id)
+
+
+def _notificacao(rng, contrato_id, inicio, hoje):
+    """Linha de notificacao e os destinatários dela: [(email, status)]"""
+    envio = inicio + timedelta(days=rng.randrange(max(1, (hoje - inicio).days)))
+    momento = datetime.combine(envio, datetime.min.time()) + timedelta(seconds=rng.randrange(86400))
+    tipo = _escolher(rng, TIPOS_NOTIFICACAO)
+    emails = [f'contato{rng.randrange(100000)}@cliente.local' for _ in range(rng.randint(1, 3))]
+    status = 'enviado' if rng.random() < 0.9 else 'erro'
+    carimbo = momento.strftime('%Y-%m-%d %H:%M:%S')
+    # Mesma normalização de enviar_notificacao: minúsculas, sem espaços, um registro por email
+    destinatarios = {}
+    for email in emails:
+        destinatarios.setdefault(email.strip().lower(), status)
+    linha = (contrato_id, tipo, f'Notificação de Contrato - {tipo}', '<p>mensagem de carga</p>',
+             ','.join(emails), status, carimbo, carimbo)
+    return linha, list(destinatarios.items())
+
+
+def gerar(caminho, usuarios, contratos, notificacoes, senha='carga123', anos=3, seed=42):
+    """Preenche o banco em `caminho` (criando o esquema) e retorna os totais inseridos"""
+    import app as aplicacao
+
+    flask_app = aplicacao.create_app({'DATABASE': caminho})
+    with flask_app.app_context():
+        aplicacao.get_db_connection().close()
+        senha_hash = aplicacao.hash_senha(senha)
+
+    rng = random.Random(seed)
+    hoje = date.today()
+    conn = sqlite3.connect(caminho)
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    totais = {'usuarios': 0, 'contratos': 0, 'notificacoes': 0, 'destinatarios': 0}
+    try:
+        pendentes = 0
+        for indice in range(1, usuarios + 1):
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO usuario (nome_completo, email, senha_hash) VALUES (?, ?, ?)',
+                (f'Usuário de Carga {indice}', email_usuario(indice), senha_hash))
+            if not cursor.rowcount:
+                continue
+            usuario_id = cursor.lastrowid
+            totais['usuarios'] += 1
+
+            lote_notificacoes = []
+            for _ in range(contratos):
+                linha = _contrato(rng, usuario_id, hoje, anos)
+                contrato_id = conn.execute('''
+                    INSERT INTO contrato (nome, descricao, data_inicio, data_fim, status,
+                                          criado_em, atualizado_em, usuario_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', linha).lastrowid
+                totais['contratos'] += 1
+                data_inicio = date.fromisoformat(linha[2])
+                for _ in range(notificacoes):
+                    lote_notificacoes.append(_notificacao(rng, contrato_id, data_inicio, hoje))
+
+            lote_destinatarios = []
+            for linha, destinatarios in lote_notificacoes:
+                notificacao_id = conn.execute('''
+                    INSERT INTO notificacao (contrato_id, tipo, assunto, mensagem, email_destino,
+                                             status, data_envio, criado_em)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', linha).lastrowid
+                lote_destinatarios.extend(
+                    (notificacao_id, usuario_id, email, status) for email, status in destinatarios)
+            conn.executemany('''
+                INSERT INTO notificacao_destinatario (notificacao_id, usuario_id, email, status)
+                VALUES (?, ?, ?, ?)
+            ''', lote_destinatarios)
+            totais['notificacoes'] += len(lote_notificacoes)
+            totais['destinatarios'] += len(lote_destinatarios)
+            pendentes += contratos + len(lote_notificacoes) + len(lote_destinatarios)
+            if pendentes >= BATCH:
+                conn.commit()
+                pendentes = 0
+        conn.commit()
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return totais
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos para testes de carga')
+    parser.add_argument('--db', default=os.path.join(RAIZ, 'data', 'carga.db'))
+    parser.add_argument('--usuarios', type=int, default=100)
+    parser.add_argument('--contratos', type=int, default=50, help='contratos por usuário')
+    parser.add_argument('--notificacoes', type=int, default=3, help='notificações por contrato')
+    parser.add_argument('--senha', default='carga123')
+    parser.add_argument('--anos', type=int, default=3, help='janela de datas de início')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--recriar', action='store_true', help='apaga o banco antes de gerar')
+    args = parser.parse_args()
+
+    if args.recriar and os.path.exists(args.db):
+        os.remove(args.db)
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+
+    inicio = time.perf_counter()
+    totais = gerar(args.db, args.usuarios, args.contratos, args.notificacoes,
+                   senha=args.senha, anos=args.anos, seed=args.seed)
+    duracao = time.perf_counter() - inicio
+    print(f"{args.db}: {totais['usuarios']} usuários, {totais['contratos']} contratos, "
+          f"{totais['notificacoes']} notificações ({totais['destinatarios']} destinatários) em {duracao:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Micro-benchmarks dos helpers quentes, com baseline versionada e modo de verificação.
+
+Cobre o que roda por linha/mensagem: calcular_dias_restantes(),
+formatar_data_brasil(), criar_template_email(), as views listar_contratos()
+e listar_notificacoes() (consulta + conversão das linhas + JSON) e a
+serialização JSON de payloads típicos (json do Flask e a camada de
+serializacao.py).
+
+Os tempos são normalizados por um laço de calibração em Python puro, então a
+baseline gravada numa máquina continua útil em outra: a verificação compara
+a razão tempo/calibração, não o tempo absoluto.
+
+Uso:
+    python benchmarks/micro.py                   # roda e compara com a baseline
+    python benchmarks/micro.py --salvar          # regrava benchmarks/baseline_micro.json
+    python benchmarks/micro.py --verificar       # sai com 1 se algo regrediu além da tolerância
+    python benchmarks/micro.py --verificar --tolerancia 0.15 -k contratos
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+BASELINE = os.path.join(RAIZ, 'benchmarks', 'baseline_micro.json')
+TOLERANCIA_PADRAO = 0.25
+CONTRATOS = 500
+NOTIFICACOES_POR_CONTRATO = 3
+
+BENCHMARKS = {}
+
+
+def benchmark(nome, tolerancia=None):
+    """Registra `funcao(ctx)` que devolve a chamada a ser medida"""
+    def registrar(funcao):
+        BENCHMARKS[nome] = (funcao, tolerancia)
+        return funcao
+    return registrar
+
+
+def medir(chamada, repeticoes, tempo_minimo=0.2):
+    """Melhor tempo por operação (ns) entre `repeticoes` rodadas de pelo menos `tempo_minimo`"""
+    gc.collect()
+    gc.disable()  # como o timeit: coletas no meio da rodada só adicionam ruído
+    try:
+        return _medir(chamada, repeticoes, tempo_minimo)
+    finally:
+        gc.enable()
+
+
+def _medir(chamada, repeticoes, tempo_minimo):
+    lacos = 1
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(lacos):
+            chamada()
+        decorrido = time.perf_counter() - inicio
+        if decorrido >= tempo_minimo:
+            break
+        lacos *= 2 if decorrido * 4 > tempo_minimo else 10
+    melhor = decorrido / lacos
+    for _ in range(repeticoes - 1):
+        inicio = time.perf_counter()
+        for _ in range(lacos):
+            chamada()
+        melhor = min(melhor, (time.perf_counter() - inicio) / lacos)
+    return melhor * 1e9
+
+
+def _calibracao():
+    total = 0
+    for i in range(1000):
+        total += i * i % 7
+    return total
+
+
+# ========== CONTEXTO ==========
+class Contexto:
+    """Aplicação com banco temporário e dados típicos de um usuário"""
+
+    def __init__(self):
+        import app as aplicacao
+        from benchmarks.gerar_dados import email_usuario, gerar
+
+        self.aplicacao = aplicacao
+        self._dir = tempfile.TemporaryDirectory()
+        caminho = os.path.join(self._dir.name, 'micro.db')
+        gerar(caminho, 1, CONTRATOS, NOTIFICACOES_POR_CONTRATO, seed=7)
+        self.app = aplicacao.create_app({
+            'DATABASE': caminho,
+            'COALESCENCIA_ATIVA': False,
+            'LOG_ASSINCRONO': False,
+        })
+        with self.app.app_context():
+            conn = aplicacao.get_db_connection()
+            usuario = conn.execute('SELECT id FROM usuario WHERE email = ?', (email_usuario(1),)).fetchone()
+            self.usuario_id = usuario['id']
+            self.contratos = [dict(c) for c in conn.execute(
+                'SELECT * FROM contrato WHERE usuario_id = ? ORDER BY data_fim', (self.usuario_id,))]
+            conn.close()
+
+    def view(self, funcao):
+        """Chama a view num contexto de requisição com o usuário logado"""
+        from flask import session
+
+        def chamar():
+            with self.app.test_request_context():
+                session['usuario_id'] = self.usuario_id
+                return funcao().get_data()
+        return chamar
+
+    def fechar(self):
+        self._dir.cleanup()
+
+
+# ========== BENCHMARKS ==========
+@benchmark('calcular_dias_restantes')
+def _dias(ctx):
+    datas = [c['data_fim'] for c in ctx.contratos[:100]]
+    calcular = ctx.aplicacao.calcular_dias_restantes
+    return lambda: [calcular(d) for d in datas]
+
+
+@benchmark('formatar_data_brasil')
+def _formatar(ctx):
+    datas = [c['data_inicio'] for c in ctx.contratos[:100]]
+    formatar = ctx.aplicacao.formatar_data_brasil
+    return lambda: [formatar(d) for d in datas]
+
+
+@benchmark('criar_template_email')
+def _template(ctx):
+    contrato = ctx.contratos[0]
+    criar = ctx.aplicacao.criar_template_email
+    return lambda: criar('Notificação de Contrato - CONTRATO+', '📋 Lembrete de Contrato',
+                         f"O contrato <strong>{contrato['nome']}</strong> vencerá em breve.",
+                         'info', contrato)
+
+
+@benchmark('listar_contratos', tolerancia=0.3)
+def _listar_contratos(ctx):
+    return ctx.view(ctx.aplicacao.listar_contratos)
+
+
+@benchmark('listar_notificacoes', tolerancia=0.3)
+def _listar_notificacoes(ctx):
+    return ctx.view(ctx.aplicacao.listar_notificacoes)
+
+
+@benchmark('json_lista_contratos')
+def _json_contratos(ctx):
+    calcular = ctx.aplicacao.calcular_dias_restantes
+    payload = {'success': True, 'contratos': [
+        {**c, 'dias_restantes': calcular(c['data_fim'])} for c in ctx.contratos]}
+    with ctx.app.app_context():
+        dumps = ctx.app.json.dumps
+    return lambda: dumps(payload)
+
+
+@benchmark('serializacao_lista_contratos')
+def _serializacao_contratos(ctx):
+    codificador = ctx.aplicacao.FORMATO_CONTRATO.codificador()
+    linhas = [tuple(c[campo] for campo in ctx.aplicacao.FORMATO_CONTRATO.colunas) for c in ctx.contratos]
+    serializar = ctx.aplicacao.serializacao.serializar
+    return lambda: serializar({'success': True, 'contratos': codificador.lista(linhas)})
+
+
+@benchmark('json_dashboard')
+def _json_dashboard(ctx):
+    payload = {'success': True, 'stats': {
+        'total_contratos': CONTRATOS, 'contratos_ativos': 400, 'contratos_proximos': 12,
+        'contratos_vencidos': 30, 'total_notificacoes': 1500, 'notificacoes_enviadas': 1350,
+        'contratos_recentes': [
+            {'id': c['id'], 'nome': c['nome'], 'data_fim': c['data_fim'], 'status': c['status']}
+            for c in ctx.contratos[:5]],
+        'atualizado_em': (datetime.now() - timedelta(seconds=5)).isoformat(),
+    }}
+    with ctx.app.app_context():
+        dumps = ctx.app.json.dumps
+    return lambda: dumps(payload)
+
+
+# ========== EXECUÇÃO ==========
+def rodar(nomes, repeticoes):
+    calibracao = medir(_calibracao, repeticoes)
+    ctx = Contexto()
+    resultados = {}
+    try:
+        for nome in nomes:
+            preparar = BENCHMARKS[nome][0]
+            ns = medir(preparar(ctx), repeticoes)
+            resultados[nome] = {'ns_op': round(ns, 1), 'relativo': round(ns / calibracao, 4)}
+    finally:
+        ctx.fechar()
+    return calibracao, resultados
+
+
+def comparar(resultados, baseline, tolerancia):
+    """Retorna [(nome, atual, base, variacao, limite)] e a lista de regressões"""
+    linhas, regressoes = [], []
+    base = baseline.get('resultados', {})
+    for nome, r in resultados.items():
+        if nome not in base:
+            linhas.append((nome, r, None, None, None))
+            continue
+        limite = BENCHMARKS[nome][1] or tolerancia
+        variacao = r['relativo'] / base[nome]['relativo'] - 1
+        linhas.append((nome, r, base[nome], variacao, limite))
+        if variacao > limite:
+            regressoes.append(nome)
+    return linhas, regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks dos helpers quentes')
+    parser.add_argument('--salvar', action='store_true', help='grava os resultados como baseline')
+    parser.add_argument('--verificar', action='store_true', help='falha se houver regressão')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO,
+                        help='regressão máxima aceita (0.25 = 25%%)')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('-k', dest='filtro', help='roda só benchmarks cujo nome contém o texto')
+    args = parser.parse_args()
+
+    nomes = [nome for nome in BENCHMARKS if not args.filtro or args.filtro in nome]
+    calibracao, resultados = rodar(nomes, args.repeticoes)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.salvar:
+        with open(args.baseline, encoding='utf-8') as arquivo:
+            baseline = json.load(arquivo)
+
+    print(f'calibração: {calibracao / 1000:.1f} µs\n')
+    print(f"{'benchmark':<30}{'µs/op':>12}{'relativo':>10}{'baseline':>10}{'variação':>10}")
+    regressoes = []
+    if baseline:
+        linhas, regressoes = comparar(resultados, baseline, args.tolerancia)
+        if regressoes:
+            # Confirma antes de acusar: remede só os suspeitos, com o dobro de rodadas
+            _, remedidos = rodar(regressoes, args.repeticoes * 2)
+            for nome, r in remedidos.items():
+                if r['relativo'] < resultados[nome]['relativo']:
+                    resultados[nome] = r
+            linhas, regressoes = comparar(resultados, baseline, args.tolerancia)
+    else:
+        linhas = [(nome, r, None, None, None) for nome, r in resultados.items()]
+    for nome, r, base, variacao, limite in linhas:
+        texto_base = f"{base['relativo']:>10.3f}" if base else f"{'-':>10}"
+        texto_var = f'{variacao:>+9.0%}' if variacao is not None else f"{'nova':>9}"
+        marca = ' !' if nome in regressoes else ''
+        print(f"{nome:<30}{r['ns_op'] / 1000:>12.2f}{r['relativo']:>10.3f}{texto_base}{texto_var}{marca}")
+
+    if args.salvar:
+        with open(args.baseline, 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'meta': {
+                    'data': datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'maquina': platform.machine(),
+                    'calibracao_ns': round(calibracao, 1),
+                },
+                'resultados': resultados,
+            }, arquivo, ensure_ascii=False, indent=2)
+            arquivo.write('\n')
+        print(f'\nbaseline gravada em {args.baseline}')
+
+    if regressoes:
+        print(f"\nregressões além da tolerância: {', '.join(regressoes)}")
+        if args.verificar:
+            sys.exit(1)
+    elif args.verificar and baseline is None:
+        print('\nsem baseline para verificar (rode com --salvar)')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Coalescência de leituras idênticas (single-flight).
+
+Quando várias abas do mesmo usuário pedem o mesmo GET ao mesmo tempo, só a
+primeira requisição executa a view; as demais esperam o resultado em voo e
+recebem uma cópia da resposta já serializada.
+"""
+import threading
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request, session
+
+from metricas import cache as metrica_cache
+
+
+class _EmVoo:
+    __slots__ = ('evento', 'resultado', 'erro', 'seguidores')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.seguidores = 0
+
+
+class SingleFlight:
+    """Executa no máximo uma chamada por chave ao mesmo tempo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_voo = {}
+        self._contadores = {'executadas': 0, 'coalescidas': 0, 'erros': 0, 'timeouts': 0}
+
+    def executar(self, chave, funcao, timeout):
+        """Retorna (resultado, compartilhado). Erros do líder são repassados a quem espera."""
+        with self._lock:
+            voo = self._em_voo.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._em_voo[chave] = _EmVoo()
+                self._contadores['executadas'] += 1
+                metrica_cache.inc('coalescencia', 'miss')
+            else:
+                voo.seguidores += 1
+                self._contadores['coalescidas'] += 1
+                metrica_cache.inc('coalescencia', 'hit')
+
+        if not lider:
+            if not voo.evento.wait(timeout):
+                with self._lock:
+                    self._contadores['timeouts'] += 1
+                raise TimeoutError(f'Tempo esgotado aguardando {chave!r}')
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado, True
+
+        try:
+            voo.resultado = funcao()
+            return voo.resultado, False
+        except Exception as e:
+            voo.erro = e
+            with self._lock:
+                self._contadores['erros'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._em_voo.pop(chave, None)
+            voo.evento.set()
+
+    def metricas(self):
+        with self._lock:
+            return {**self._contadores, 'em_voo': len(self._em_voo)}
+
+
+class Coalescedor:
+    """Extensão Flask: decorador `rota` para views GET coalescíveis"""
+
+    def __init__(self, app=None):
+        self.voos = SingleFlight()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COALESCENCIA_ATIVA', True)
+        app.config.setdefault('COALESCENCIA_TIMEOUT', 10.0)
+        app.extensions['coalescencia'] = self
+
+    def rota(self, view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or not current_app.config['COALESCENCIA_ATIVA']:
+                return view(*args, **kwargs)
+
+            chave = (
+                session.get('usuario_id'),
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+            )
+
+            def executar():
+                resposta = make_response(view(*args, **kwargs))
+                # Respostas em streaming não têm corpo para compartilhar
+                if resposta.is_streamed:
+                    return resposta
+                return resposta.get_data(), resposta.status_code, list(resposta.headers.items())
+
+            try:
+                resultado, compartilhado = self.voos.executar(
+                    chave, executar, current_app.config['COALESCENCIA_TIMEOUT']
+                )
+            except TimeoutError:
+                return jsonify({'success': False, 'message': 'Tempo esgotado'}), 504
+
+            if not isinstance(resultado, tuple):
+                if compartilhado:
+                    return view(*args, **kwargs)
+                return resultado
+
+            corpo, status, headers = resultado
+            resposta = current_app.response_class(corpo, status=status, headers=headers)
+            if compartilhado:
+                resposta.headers['X-Coalesced'] = '1'
+            return resposta
+        return decorated_function
+
+    def metricas(self):
+        return self.voos.metricas()
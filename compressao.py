@@ -0,0 +1,176 @@
+"""
+Compressão transparente das respostas da API (gzip, ou brotli quando instalado).
+
+Roda por último no after_request: respostas com mimetype comprimível, acima
+de COMPRESSAO_MINIMO bytes e sem Content-Encoding são comprimidas com o
+algoritmo preferido entre os aceitos pelo cliente. Respostas em streaming
+são comprimidas pedaço a pedaço com flush de sincronização, então cada lote
+chega ao cliente sem esperar o fim do corpo.
+
+As métricas (bytes antes/depois e tempo de CPU gasto) vão para /metrics e
+para /api/system/metricas.
+"""
+import threading
+import time
+import zlib
+
+from flask import current_app, request
+
+from estaticos import aceitas
+import metricas
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele só gzip
+    brotli = None
+
+TIPOS_PADRAO = ('application/json', 'text/plain', 'text/csv')
+
+bytes_compressao = metricas.REGISTRO.contador(
+    'contrato_compressao_bytes_total', 'Bytes das respostas comprimidas, antes e depois',
+    ('codificacao', 'etapa'))
+cpu_compressao = metricas.REGISTRO.contador(
+    'contrato_compressao_cpu_segundos_total', 'Tempo de CPU gasto comprimindo respostas',
+    ('codificacao',))
+
+
+class _Gzip:
+    def __init__(self, nivel):
+        self._obj = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+
+    def parcial(self, dados):
+        return self._obj.compress(dados) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def final(self):
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, nivel):
+        self._obj = brotli.Compressor(quality=nivel)
+
+    def parcial(self, dados):
+        return self._obj.process(dados) + self._obj.flush()
+
+    def final(self):
+        return self._obj.finish()
+
+
+class Compressao:
+    """Extensão Flask de compressão das respostas"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._contadores = {'respostas': 0, 'streaming': 0, 'bytes_originais': 0,
+                            'bytes_comprimidos': 0, 'cpu_ms': 0.0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESSAO_ATIVA', True)
+        app.config.setdefault('COMPRESSAO_MINIMO', 1024)
+        app.config.setdefault('COMPRESSAO_NIVEL', 6)
+        app.config.setdefault('COMPRESSAO_NIVEL_BROTLI', 4)
+        app.config.setdefault('COMPRESSAO_TIPOS', TIPOS_PADRAO)
+        # after_request roda em ordem inversa: na posição 0 esta é a última a rodar
+        app.after_request_funcs.setdefault(None, []).insert(0, self._comprimir)
+        app.extensions['compressao'] = self
+
+    def _escolher(self):
+        codificacoes = aceitas(request.headers.get('Accept-Encoding'))
+        if brotli is not None and 'br' in codificacoes:
+            return 'br'
+        if 'gzip' in codificacoes:
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def _compressor(codificacao, config):
+        if codificacao == 'br':
+            return _Brotli(config['COMPRESSAO_NIVEL_BROTLI'])
+        return _Gzip(config['COMPRESSAO_NIVEL'])
+
+    def _registrar(self, codificacao, original, comprimido, cpu, streaming=False):
+        bytes_compressao.inc(codificacao, 'original', valor=original)
+        bytes_compressao.inc(codificacao, 'comprimido', valor=comprimido)
+        cpu_compressao.inc(codificacao, valor=cpu)
+        with self._lock:
+            self._contadores['respostas'] += 1
+            self._contadores['streaming'] += streaming
+            self._contadores['bytes_originais'] += original
+            self._contadores['bytes_comprimidos'] += comprimido
+            self._contadores['cpu_ms'] += cpu * 1000
+
+    def _comprimir(self, resposta):
+        config = current_app.config
+        if (not config['COMPRESSAO_ATIVA']
+                or request.method == 'HEAD'
+                or resposta.status_code < 200 or resposta.status_code in (204, 304)
+                or resposta.direct_passthrough
+                or 'Content-Encoding' in resposta.headers
+                or resposta.mimetype not in config['COMPRESSAO_TIPOS']
+                or 'no-transform' in (resposta.headers.get('Cache-Control') or '')):
+            return resposta
+
+        resposta.vary.add('Accept-Encoding')
+        codificacao = self._escolher()
+        if codificacao is None:
+            return resposta
+
+        if resposta.is_streamed:
+            # O compressor sai daqui: o gerador roda depois, fora do contexto da aplicação
+            resposta.response = self._stream(resposta.response, codificacao, self._compressor(codificacao, config))
+            resposta.headers.pop('Content-Length', None)
+            self._cabecalhos(resposta, codificacao)
+            return resposta
+
+        corpo = resposta.get_data()
+        if len(corpo) < config['COMPRESSAO_MINIMO']:
+            return resposta
+        inicio = time.thread_time()
+        compressor = self._compressor(codificacao, config)
+        comprimido = compressor.parcial(corpo) + compressor.final()
+        self._registrar(codificacao, len(corpo), len(comprimido), time.thread_time() - inicio)
+        resposta.set_data(comprimido)
+        self._cabecalhos(resposta, codificacao)
+        return resposta
+
+    @staticmethod
+    def _cabecalhos(resposta, codificacao):
+        resposta.headers['Content-Encoding'] = codificacao
+        etag, fraco = resposta.get_etag()
+        if etag:
+            resposta.set_etag(f'{etag}-{codificacao}', weak=fraco)
+
+    def _stream(self, iteravel, codificacao, compressor):
+        original = comprimido = 0
+        cpu = 0.0
+        try:
+            for pedaco in iteravel:
+                if isinstance(pedaco, str):
+                    pedaco = pedaco.encode()
+                if not pedaco:
+                    continue
+                inicio = time.thread_time()
+                saida = compressor.parcial(pedaco)
+                cpu += time.thread_time() - inicio
+                original += len(pedaco)
+                comprimido += len(saida)
+                yield saida
+            inicio = time.thread_time()
+            saida = compressor.final()
+            cpu += time.thread_time() - inicio
+            comprimido += len(saida)
+            yield saida
+        finally:
+            if hasattr(iteravel, 'close'):
+                iteravel.close()
+            self._registrar(codificacao, original, comprimido, cpu, streaming=True)
+
+    def metricas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+        dados['cpu_ms'] = round(dados['cpu_ms'], 3)
+        dados['bytes_economizados'] = dados['bytes_originais'] - dados['bytes_comprimidos']
+        dados['razao'] = round(dados['bytes_originais'] / dados['bytes_comprimidos'], 2) if dados['bytes_comprimidos'] else 0
+        return dados
@@ -0,0 +1,289 @@
+"""
+Escritor único: as transações de escrita do processo passam por uma fila.
+
+Cada banco tem uma thread escritora com conexão própria. Os handlers entregam
+`funcao(conn, *args)` e recebem o resultado por um Future. A thread pega a
+primeira tarefa da fila e junta as que chegarem em até ESCRITA_JANELA_MS (no
+máximo ESCRITA_LOTE): o lote roda numa única transação (BEGIN IMMEDIATE ...
+COMMIT), com um SAVEPOINT por tarefa, então o erro de uma tarefa desfaz só as
+escritas dela. Os Futures são resolvidos depois do COMMIT. Uma tarefa que não
+entrou numa transação em ESCRITA_TIMEOUT segundos é cancelada (EscritorOcupado,
+o handler responde 503); uma que já entrou é esperada até o fim.
+
+A função roda fora do contexto da requisição: não deve usar request/session
+nem chamar commit/rollback, e trabalho lento (hash de senha, SMTP) fica do
+lado de fora, antes ou depois da escrita. Os comandos dela são coletados na
+thread do escritor e somados à requisição que a submeteu (db_queries, db_ms
+e o rastreamento de SQL); BEGIN/COMMIT do lote, compartilhados, não entram.
+
+Com ESCRITA_ATIVA=False cada escrita roda na thread da requisição, numa
+conexão própria (o comportamento anterior), medida pelas mesmas métricas:
+latência das escritas e erros "database is locked". A configuração vem da
+aplicação atual (current_app); a thread de cada banco guarda a da aplicação
+que a criou.
+"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from flask import current_app
+
+import metricas
+
+latencia_escrita = metricas.REGISTRO.histograma(
+    'contrato_escrita_segundos', 'Latência das escritas, da submissão ao commit', ('modo',))
+tamanho_lote = metricas.REGISTRO.histograma(
+    'contrato_escrita_lote_tarefas', 'Tarefas por transação do escritor', (),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+erros_lock = metricas.REGISTRO.contador(
+    'contrato_escrita_erros_lock_total', 'Escritas que falharam com o banco bloqueado', ('modo',))
+
+AMOSTRAS_LATENCIA = 2000
+
+
+class EscritorOcupado(Exception):
+    """Fila de escrita cheia, ou a escrita não começou dentro de ESCRITA_TIMEOUT"""
+
+
+def _erro_de_lock(erro):
+    texto = str(erro).lower()
+    return isinstance(erro, sqlite3.OperationalError) and ('locked' in texto or 'busy' in texto)
+
+
+class _Tarefa:
+    __slots__ = ('funcao', 'args', 'futuro', 'submetida_em', 'coleta')
+
+    def __init__(self, funcao, args, coleta=None):
+        self.funcao = funcao
+        self.args = args
+        self.futuro = Future()
+        self.submetida_em = time.perf_counter()
+        self.coleta = coleta
+
+
+class _Fila:
+    """Thread escritora de um banco (com a configuração da aplicação que a criou)"""
+
+    def __init__(self, escritor, caminho, app):
+        self.escritor = escritor
+        self.caminho = caminho
+        self.app = app
+        config = app.config
+        self.janela = config['ESCRITA_JANELA_MS'] / 1000
+        self.lote = config['ESCRITA_LOTE']
+        self.busy_timeout_ms = int(config['ESCRITA_BUSY_TIMEOUT_MS'])
+        self.fila = queue.Queue(maxsize=config['ESCRITA_FILA'])
+        self.conn = None
+        self.thread = threading.Thread(target=self._rodar, name='escritor-sqlite', daemon=True)
+        self.thread.start()
+
+    def _conectar(self):
+        with self.app.app_context():  # a conexão pode depender da configuração (ATTACH da retenção)
+            conn = self.escritor.conectar(self.caminho)
+        conn.isolation_level = None  # transações controladas aqui (BEGIN/SAVEPOINT/COMMIT)
+        conn.execute(f'PRAGMA busy_timeout = {self.busy_timeout_ms}')
+        return conn
+
+    def _rodar(self):
+        try:
+            while True:
+                tarefa = self.fila.get()
+                if tarefa is None:
+                    return
+                lote = [tarefa]
+                parar = self._completar(lote)
+                self._executar(lote)
+                if parar:
+                    return
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+
+    def _completar(self, lote):
+        """Junta ao lote as tarefas que chegarem dentro da janela; True se recebeu o aviso de parada"""
+        prazo = time.perf_counter() + self.janela
+        while len(lote) < self.lote:
+            restante = prazo - time.perf_counter()
+            try:
+                tarefa = self.fila.get(timeout=restante) if restante > 0 else self.fila.get_nowait()
+            except queue.Empty:
+                return False
+            if tarefa is None:
+                return True
+            lote.append(tarefa)
+        return False
+
+    def _executar(self, lote):
+        lote = [t for t in lote if t.futuro.set_running_or_notify_cancel()]
+        if not lote:
+            return
+        resultados = []
+        conn = self.conn
+        try:
+            if conn is None:
+                conn = self.conn = self._conectar()
+            conn.execute('BEGIN IMMEDIATE')
+            for tarefa in lote:
+                conn.execute('SAVEPOINT tarefa')
+                try:
+                    with metricas.coletando(tarefa.coleta):
+                        resultado = tarefa.funcao(conn, *tarefa.args)
+                    resultados.append((tarefa, resultado, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO tarefa')
+                    resultados.append((tarefa, None, e))
+                conn.execute('RELEASE tarefa')
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            self.escritor._concluir_lote(lote, [(t, None, e) for t in lote])
+            return
+        self.escritor._concluir_lote(lote, resultados)
+
+    def enfileirar(self, tarefa):
+        try:
+            self.fila.put_nowait(tarefa)
+        except queue.Full:
+            raise EscritorOcupado('Fila de escrita cheia') from None
+
+    def encerrar(self, timeout):
+        try:
+            self.fila.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+
+class Escritor:
+    """Extensão Flask: serializa as transações de escrita numa thread por banco"""
+
+    def __init__(self, conectar, app=None):
+        self.conectar = conectar
+        self._filas = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._latencias = {'fila': deque(maxlen=AMOSTRAS_LATENCIA), 'direta': deque(maxlen=AMOSTRAS_LATENCIA)}
+        self._contadores = {'escritas': 0, 'falhas': 0, 'erros_lock': 0, 'lotes': 0,
+                            'tarefas_em_lote': 0, 'rejeitadas': 0, 'timeouts': 0}
+        atexit.register(self.encerrar)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ESCRITA_ATIVA', True)
+        app.config.setdefault('ESCRITA_JANELA_MS', 1.0)
+        app.config.setdefault('ESCRITA_LOTE', 64)
+        app.config.setdefault('ESCRITA_FILA', 1024)
+        app.config.setdefault('ESCRITA_TIMEOUT', 10.0)
+        app.config.setdefault('ESCRITA_BUSY_TIMEOUT_MS', 5000)
+        app.extensions['escritor'] = self
+
+    # ========== API ==========
+    def executar(self, caminho, funcao, *args):
+        """Roda `funcao(conn, *args)` numa transação de escrita e devolve o resultado"""
+        config = current_app.config
+        if not config['ESCRITA_ATIVA']:
+            return self._direto(caminho, funcao, args)
+        timeout = config['ESCRITA_TIMEOUT']
+        tarefa = _Tarefa(funcao, args, metricas.nova_coleta())
+        try:
+            self._fila(caminho).enfileirar(tarefa)
+        except EscritorOcupado:
+            with self._lock:
+                self._contadores['rejeitadas'] += 1
+            raise
+        try:
+            return tarefa.futuro.result(timeout=timeout)
+        except TimeoutError:
+            if not tarefa.futuro.cancel():
+                # Já está na transação: o commit vem aí, e desistir agora faria o cliente repetir uma escrita feita
+                return tarefa.futuro.result()
+            with self._lock:
+                self._contadores['timeouts'] += 1
+            raise EscritorOcupado('Escrita não começou no prazo') from None
+        finally:
+            # Comandos da tarefa contam na requisição que a submeteu (db_queries, db_ms, rastro de SQL)
+            metricas.somar_coleta(tarefa.coleta)
+
+    def _fila(self, caminho):
+        fila = self._filas.get(caminho)
+        if fila is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Threads não sobrevivem ao fork: o processo filho começa do zero
+                    self._filas = {}
+                    self._pid = os.getpid()
+                fila = self._filas.get(caminho)
+                if fila is None:
+                    fila = self._filas[caminho] = _Fila(self, caminho, current_app._get_current_object())
+        return fila
+
+    def _direto(self, caminho, funcao, args):
+        inicio = time.perf_counter()
+        conn = self.conectar(caminho)
+        try:
+            resultado = funcao(conn, *args)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self._registrar('direta', inicio, e)
+            raise
+        finally:
+            conn.close()
+        self._registrar('direta', inicio)
+        return resultado
+
+    # ========== MÉTRICAS ==========
+    def _registrar(self, modo, inicio, erro=None):
+        decorrido = time.perf_counter() - inicio
+        latencia_escrita.observar(decorrido, modo)
+        lock = erro is not None and _erro_de_lock(erro)
+        if lock:
+            erros_lock.inc(modo)
+        with self._lock:
+            self._latencias[modo].append(decorrido)
+            self._contadores['escritas'] += 1
+            self._contadores['falhas'] += erro is not None
+            self._contadores['erros_lock'] += lock
+
+    def _concluir_lote(self, lote, resultados):
+        tamanho_lote.observar(len(lote))
+        with self._lock:
+            self._contadores['lotes'] += 1
+            self._contadores['tarefas_em_lote'] += len(lote)
+        for tarefa, resultado, erro in resultados:
+            self._registrar('fila', tarefa.submetida_em, erro)
+            if erro is not None:
+                tarefa.futuro.set_exception(erro)
+            else:
+                tarefa.futuro.set_result(resultado)
+
+    def metricas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            latencias = {modo: sorted(valores) for modo, valores in self._latencias.items()}
+            filas = list(self._filas.values()) if self._pid == os.getpid() else []
+        dados['modo'] = 'fila' if current_app.config['ESCRITA_ATIVA'] else 'direta'
+        dados['na_fila'] = sum(f.fila.qsize() for f in filas)
+        dados['tarefas_por_lote'] = round(dados.pop('tarefas_em_lote') / dados['lotes'], 2) if dados['lotes'] else 0
+        for modo, valores in latencias.items():
+            if valores:
+                dados[f'{modo}_p50_ms'] = round(valores[len(valores) // 2] * 1000, 3)
+                dados[f'{modo}_p99_ms'] = round(valores[min(len(valores) - 1, int(len(valores) * 0.99))] * 1000, 3)
+        return dados
+
+    def encerrar(self, timeout=5.0):
+        """Processa o que já está na fila e para as threads escritoras"""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            filas = list(self._filas.values())
+            self._filas = {}
+        for fila in filas:
+            fila.encerrar(timeout)
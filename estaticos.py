@@ -0,0 +1,208 @@
+"""
+Pipeline de arquivos estáticos: carregados e pré-comprimidos na subida.
+
+Na inicialização cada arquivo público (extensões de ESTATICOS_EXTENSOES) é lido
+para a memória, recebe um ETag forte (hash do conteúdo) e, se for texto,
+versões gzip e brotli (esta só com o pacote `brotli` instalado). Cada
+requisição só negocia o Accept-Encoding e devolve os bytes prontos, com 304
+para If-None-Match.
+
+Referências a .js/.css locais no HTML são reescritas para URLs com hash
+(api.js -> api.3f2a1b4c.js), servidas com cache imutável de um ano; o nome
+original continua respondendo, com revalidação (no-cache + ETag), assim como
+as páginas HTML.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import abort, current_app, request
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele só há gzip
+    brotli = None
+
+EXTENSOES_PADRAO = ('.html', '.js', '.css', '.svg', '.png', '.jpg', '.jpeg', '.gif',
+                    '.webp', '.ico', '.woff', '.woff2')
+COMPRIMIVEIS = ('.html', '.js', '.css', '.svg', '.txt')
+IGNORAR_DIRS = {'__pycache__', 'data', 'benchmarks', 'node_modules', 'venv', 'env', 'virtualenv', 'site-packages'}
+COM_HASH = ('.js', '.css')
+TAMANHO_MINIMO_COMPRESSAO = 1024
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'no-cache'
+
+_REFERENCIA = re.compile(r'''(\b(?:src|href)\s*=\s*["'])([^"':?#]+\.(?:js|css))(["'])''')
+
+
+class Arquivo:
+    __slots__ = ('nome', 'mimetype', 'versoes', 'hash', 'imutavel', 'mtime', 'caminho')
+
+    def __init__(self, nome, caminho, conteudo, mtime, imutavel=False):
+        self.nome = nome
+        self.caminho = caminho
+        self.mtime = mtime
+        self.imutavel = imutavel
+        self.hash = hashlib.sha256(conteudo).hexdigest()[:16]
+        self.mimetype = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+        if self.mimetype.startswith('text/') or self.mimetype in ('application/javascript', 'image/svg+xml'):
+            self.mimetype += '; charset=utf-8'
+        self.versoes = {'identity': conteudo}
+        if nome.endswith(COMPRIMIVEIS) and len(conteudo) >= TAMANHO_MINIMO_COMPRESSAO:
+            comprimido = gzip.compress(conteudo, compresslevel=9, mtime=0)
+            if len(comprimido) < len(conteudo):
+                self.versoes['gzip'] = comprimido
+            if brotli is not None:
+                comprimido = brotli.compress(conteudo, quality=11)
+                if len(comprimido) < len(conteudo):
+                    self.versoes['br'] = comprimido
+
+    def etag(self, codificacao):
+        return self.hash if codificacao == 'identity' else f'{self.hash}-{codificacao}'
+
+
+def aceitas(cabecalho):
+    """Codificações aceitas pelo cliente (q > 0) a partir do Accept-Encoding"""
+    resultado = set()
+    for parte in (cabecalho or '').split(','):
+        nome, _, parametros = parte.strip().partition(';')
+        nome = nome.strip().lower()
+        if not nome:
+            continue
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            resultado.add(nome)
+    return resultado
+
+
+class Estaticos:
+    """Extensão Flask: carrega, comprime e serve os arquivos públicos da memória"""
+
+    def __init__(self, app=None):
+        self._arquivos = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ESTATICOS_DIR', os.path.join(app.root_path, 'public'))
+        app.config.setdefault('ESTATICOS_EXTENSOES', EXTENSOES_PADRAO)
+        app.config.setdefault('ESTATICOS_RECARREGAR', app.debug)
+        self.carregar(app.config['ESTATICOS_DIR'], app.config['ESTATICOS_EXTENSOES'])
+        app.extensions['estaticos'] = self
+
+    # ========== CARGA ==========
+    def carregar(self, diretorio, extensoes=EXTENSOES_PADRAO):
+        brutos = {}
+        for raiz, dirs, nomes in os.walk(diretorio):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in IGNORAR_DIRS]
+            for nome in nomes:
+                if nome.startswith('.') or not nome.endswith(tuple(extensoes)):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                relativo = os.path.relpath(caminho, diretorio).replace(os.sep, '/')
+                with open(caminho, 'rb') as arquivo:
+                    brutos[relativo] = (caminho, arquivo.read(), os.path.getmtime(caminho))
+
+        arquivos = {}
+        urls = {}
+        for nome, (caminho, conteudo, mtime) in brutos.items():
+            if nome.endswith(COM_HASH):
+                arquivo = Arquivo(nome, caminho, conteudo, mtime)
+                base, extensao = os.path.splitext(nome)
+                versionado = f'{base}.{arquivo.hash[:8]}{extensao}'
+                arquivos[nome] = arquivo
+                arquivos[versionado] = Arquivo(versionado, caminho, conteudo, mtime, imutavel=True)
+                urls[nome] = versionado
+
+        for nome, (caminho, conteudo, mtime) in brutos.items():
+            if nome.endswith('.html'):
+                conteudo = self._reescrever(conteudo, nome, urls)
+                arquivos[nome] = Arquivo(nome, caminho, conteudo, mtime)
+            elif nome not in arquivos:
+                arquivos[nome] = Arquivo(nome, caminho, conteudo, mtime)
+
+        with self._lock:
+            self._arquivos = arquivos
+            self._diretorio = diretorio
+            self._extensoes = tuple(extensoes)
+            self._urls = urls
+
+    @staticmethod
+    def _reescrever(conteudo, nome, urls):
+        """Troca referências a .js/.css locais pela URL com hash"""
+        pasta = os.path.dirname(nome)
+
+        def trocar(m):
+            referencia = m.group(2)
+            alvo = os.path.normpath(os.path.join(pasta, referencia.lstrip('/'))).replace(os.sep, '/')
+            if alvo not in urls:
+                return m.group(0)
+            base = referencia.rpartition('/')[2]
+            versionado = referencia[:len(referencia) - len(base)] + os.path.basename(urls[alvo])
+            return m.group(1) + versionado + m.group(3)
+
+        return _REFERENCIA.sub(trocar, conteudo.decode('utf-8')).encode('utf-8')
+
+    def _desatualizado(self):
+        for arquivo in self._arquivos.values():
+            try:
+                if os.path.getmtime(arquivo.caminho) != arquivo.mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    # ========== ENTREGA ==========
+    def url(self, nome):
+        """URL versionada (com hash) de um .js/.css, ou o próprio nome"""
+        return self._urls.get(nome, nome)
+
+    def servir(self, nome, vary_cookie=False):
+        if current_app.config['ESTATICOS_RECARREGAR'] and self._desatualizado():
+            self.carregar(self._diretorio, self._extensoes)
+        arquivo = self._arquivos.get(nome)
+        if arquivo is None:
+            abort(404)
+
+        codificacoes = aceitas(request.headers.get('Accept-Encoding'))
+        codificacao = 'identity'
+        for opcao in ('br', 'gzip'):
+            if opcao in arquivo.versoes and opcao in codificacoes:
+                codificacao = opcao
+                break
+        etag = arquivo.etag(codificacao)
+
+        resposta = current_app.response_class(content_type=arquivo.mimetype)
+        resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = CACHE_IMUTAVEL if arquivo.imutavel else CACHE_REVALIDAR
+        if len(arquivo.versoes) > 1:
+            resposta.vary.add('Accept-Encoding')
+        if vary_cookie:
+            resposta.vary.add('Cookie')
+
+        if etag in request.if_none_match:
+            resposta.status_code = 304
+            return resposta
+        if codificacao != 'identity':
+            resposta.headers['Content-Encoding'] = codificacao
+        resposta.set_data(arquivo.versoes[codificacao])
+        return resposta
+
+    def metricas(self):
+        arquivos = self._arquivos.values()
+        return {
+            'arquivos': len(self._arquivos),
+            'bytes': sum(len(a.versoes['identity']) for a in arquivos),
+            'bytes_gzip': sum(len(a.versoes.get('gzip', a.versoes['identity'])) for a in arquivos),
+            'brotli': brotli is not None,
+        }
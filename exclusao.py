@@ -0,0 +1,256 @@
+"""
+Exclusões em massa em segundo plano (limpar notificações, limpar contratos, reset).
+
+O endpoint só registra o job na tabela exclusao_job e responde 202. Uma thread
+do processo apaga em lotes de até EXCLUSAO_LOTE linhas, cada lote numa tarefa
+própria do escritor: o lock de escrita é liberado entre um lote e outro, e as
+escritas dos outros usuários entram no meio. O progresso é gravado na mesma
+transação do lote, então GET /api/exclusoes/<id> responde em qualquer worker.
+
+O job roda no banco do usuário que o criou (o fragmento dele, ver
+armazenamento.py). Um job cujo processo morreu (atualizado_em parado há EXCLUSAO_ORFAO segundos)
+é retomado por quem consultar o status; apagar de novo o que já foi apagado
+não tem efeito.
+"""
+import calendar
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from armazenamento import usando
+from retencao import excluir_arquivadas
+
+logger = logging.getLogger('contrato.exclusao')
+
+
+def _lote_arquivadas(conn, usuario_id, limite):
+    return excluir_arquivadas(conn, usuario_id, limite=limite)
+
+
+def _lote_notificacoes(conn, usuario_id, limite):
+    # Destinatários saem junto (ON DELETE CASCADE)
+    return conn.execute('''
+        DELETE FROM notificacao WHERE id IN (
+            SELECT n.id FROM contrato c
+            JOIN notificacao n ON n.contrato_id = c.id
+            WHERE c.usuario_id = ?
+            LIMIT ?
+        )
+    ''', (usuario_id, limite)).rowcount
+
+
+def _lote_contratos(conn, usuario_id, limite):
+    return conn.execute('''
+        DELETE FROM contrato WHERE id IN (
+            SELECT id FROM contrato WHERE usuario_id = ? LIMIT ?
+        )
+    ''', (usuario_id, limite)).rowcount
+
+
+def _contar_arquivadas(conn, usuario_id):
+    if not conn.execute("SELECT 1 FROM pragma_database_list WHERE name = 'arquivo'").fetchone():
+        return 0
+    return conn.execute(
+        'SELECT COUNT(*) FROM arquivo.notificacao WHERE usuario_id = ?', (usuario_id,)
+    ).fetchone()[0]
+
+
+def _contar_notificacoes(conn, usuario_id):
+    return conn.execute('''
+        SELECT COUNT(*) FROM contrato c
+        JOIN notificacao n ON n.contrato_id = c.id
+        WHERE c.usuario_id = ?
+    ''', (usuario_id,)).fetchone()[0]
+
+
+def _contar_contratos(conn, usuario_id):
+    return conn.execute('SELECT COUNT(*) FROM contrato WHERE usuario_id = ?', (usuario_id,)).fetchone()[0]
+
+
+# Etapas de cada tipo de job, em ordem: (contagem inicial, lote). Notificações
+# saem antes dos contratos para que a cascata de um lote de contratos seja pequena.
+ETAPAS = {
+    'notificacoes': (
+        (_contar_arquivadas, _lote_arquivadas),
+        (_contar_notificacoes, _lote_notificacoes),
+    ),
+    'contratos': (
+        (_contar_arquivadas, _lote_arquivadas),
+        (_contar_notificacoes, _lote_notificacoes),
+        (_contar_contratos, _lote_contratos),
+    ),
+}
+
+COLUNAS_JOB = 'id, tipo, status, total, removidos, erro, criado_em, atualizado_em, concluido_em'
+
+
+def criar_job(conn, usuario_id, tipo):
+    """Tarefa do escritor: registra o job (ou devolve o que já está em andamento) e devolve o id"""
+    existente = conn.execute('''
+        SELECT id FROM exclusao_job
+        WHERE usuario_id = ? AND tipo = ? AND status IN ('pendente', 'executando')
+    ''', (usuario_id, tipo)).fetchone()
+    if existente:
+        return existente[0]
+    total = sum(contar(conn, usuario_id) for contar, _ in ETAPAS[tipo])
+    return conn.execute(
+        'INSERT INTO exclusao_job (usuario_id, tipo, total) VALUES (?, ?, ?)',
+        (usuario_id, tipo, total)
+    ).lastrowid
+
+
+def apagar_lote(conn, job_id, limite):
+    """Tarefa do escritor: apaga um lote da primeira etapa com linhas; 0 quando o job acabou"""
+    job = conn.execute(
+        'SELECT usuario_id, tipo, status FROM exclusao_job WHERE id = ?', (job_id,)
+    ).fetchone()
+    if job is None or job[2] not in ('pendente', 'executando'):
+        return 0
+    usuario_id, tipo, _ = job
+    for _, lote in ETAPAS[tipo]:
+        removidos = lote(conn, usuario_id, limite)
+        if removidos:
+            conn.execute('''
+                UPDATE exclusao_job
+                SET status = 'executando', removidos = removidos + ?, atualizado_em = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (removidos, job_id))
+            return removidos
+    conn.execute('''
+        UPDATE exclusao_job
+        SET status = 'concluido', total = MAX(total, removidos),
+            atualizado_em = CURRENT_TIMESTAMP, concluido_em = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (job_id,))
+    return 0
+
+
+def _falhar(conn, job_id, erro):
+    conn.execute('''
+        UPDATE exclusao_job
+        SET status = 'erro', erro = ?, atualizado_em = CURRENT_TIMESTAMP, concluido_em = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (erro, job_id))
+
+
+def _reivindicar(conn, job_id, orfao):
+    """Tarefa do escritor: assume um job parado há mais de `orfao` segundos; True se conseguiu"""
+    return conn.execute('''
+        UPDATE exclusao_job SET atualizado_em = CURRENT_TIMESTAMP
+        WHERE id = ? AND status IN ('pendente', 'executando')
+          AND atualizado_em < datetime('now', ?)
+    ''', (job_id, f'-{int(orfao)} seconds')).rowcount == 1
+
+
+class Exclusoes:
+    """Extensão Flask: executa os jobs de exclusão em lotes numa thread do processo"""
+
+    def __init__(self, escrever, app=None):
+        self.escrever = escrever
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._em_execucao = set()
+        self._contadores = {'jobs': 0, 'concluidos': 0, 'erros': 0, 'retomados': 0, 'lotes': 0, 'removidos': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EXCLUSAO_LOTE', 500)
+        app.config.setdefault('EXCLUSAO_PAUSA_MS', 5)
+        app.config.setdefault('EXCLUSAO_ORFAO', 300)
+        app.extensions['exclusoes'] = self
+
+    # ========== API ==========
+    def iniciar(self, usuario_id, tipo):
+        """Registra o job e agenda a execução; devolve o id (precisa do app context)"""
+        job_id = self.escrever(criar_job, usuario_id, tipo)
+        with self._lock:
+            self._contadores['jobs'] += 1
+        self._agendar(job_id)
+        return job_id
+
+    @staticmethod
+    def _banco():
+        return current_app.extensions['armazenamento'].caminho_atual()
+
+    def status(self, conn, usuario_id, job_id):
+        """Linha do job do usuário (ou None); retoma o job se o processo dono morreu"""
+        job = conn.execute(
+            f'SELECT {COLUNAS_JOB} FROM exclusao_job WHERE id = ? AND usuario_id = ?',
+            (job_id, usuario_id)
+        ).fetchone()
+        if job is None:
+            return None
+        job = dict(job)
+        if job['status'] in ('pendente', 'executando') and (self._banco(), job_id) not in self._em_execucao:
+            if self._atrasado(job['atualizado_em']) and self.escrever(_reivindicar, job_id, current_app.config['EXCLUSAO_ORFAO']):
+                with self._lock:
+                    self._contadores['retomados'] += 1
+                self._agendar(job_id)
+        job['progresso'] = round(100 * job['removidos'] / job['total'], 1) if job['total'] else 100.0
+        return job
+
+    def _atrasado(self, atualizado_em):
+        try:
+            momento = calendar.timegm(time.strptime(atualizado_em, '%Y-%m-%d %H:%M:%S'))  # CURRENT_TIMESTAMP é UTC
+        except (TypeError, ValueError):
+            return True
+        return time.time() - momento > current_app.config['EXCLUSAO_ORFAO']
+
+    # ========== EXECUÇÃO ==========
+    def _agendar(self, job_id):
+        app = current_app._get_current_object()
+        # Ids de job se repetem entre bancos: a chave inclui o banco
+        chave = (self._banco(), job_id)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads não sobrevivem ao fork: o processo filho cria o seu executor
+                self._executor = None
+                self._em_execucao = set()
+                self._pid = os.getpid()
+            if chave in self._em_execucao:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='exclusao')
+            self._em_execucao.add(chave)
+        self._executor.submit(self._executar, app, chave)
+
+    def _executar(self, app, chave):
+        caminho, job_id = chave
+        try:
+            with app.app_context(), usando(caminho):
+                config = app.config
+                while True:
+                    removidos = self.escrever(apagar_lote, job_id, config['EXCLUSAO_LOTE'])
+                    if not removidos:
+                        break
+                    with self._lock:
+                        self._contadores['lotes'] += 1
+                        self._contadores['removidos'] += removidos
+                    # Pausa curta: a fila do escritor atende as outras escritas entre os lotes
+                    time.sleep(config['EXCLUSAO_PAUSA_MS'] / 1000)
+                with self._lock:
+                    self._contadores['concluidos'] += 1
+        except Exception as e:
+            logger.error(f'Erro no job de exclusão {job_id}: {e}')
+            with self._lock:
+                self._contadores['erros'] += 1
+            try:
+                with app.app_context(), usando(caminho):
+                    self.escrever(_falhar, job_id, str(e))
+            except Exception as e2:
+                logger.error(f'Erro ao registrar falha do job {job_id}: {e2}')
+        finally:
+            with self._lock:
+                self._em_execucao.discard(chave)
+
+    def metricas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados['em_execucao'] = len(self._em_execucao) if self._pid == os.getpid() else 0
+        return dados
@@ -0,0 +1,290 @@
+"""
+Chaves de idempotência (header Idempotency-Key) para POSTs com efeito colateral.
+
+A primeira requisição com uma chave executa a view e guarda a resposta na
+tabela idempotencia, por (usuário, chave), durante IDEMPOTENCIA_TTL segundos.
+Repetições recebem a resposta guardada, com o header Idempotent-Replayed, sem
+executar a view de novo (nada de contrato duplicado nem email reenviado).
+
+A chave é reivindicada numa tarefa do escritor antes da view rodar, então
+vale entre workers. Uma repetição que chega com a original ainda em execução
+espera o resultado: no mesmo processo por um Event, em outro processo
+consultando a tabela, até IDEMPOTENCIA_ESPERA segundos (depois, 409).
+
+A mesma chave com outro corpo ou outra rota responde 422. Respostas 5xx não
+são guardadas: a chave é liberada e a repetição executa de novo. As respostas
+mais recentes ficam também num cache em memória (LRU com TTL, no máximo
+IDEMPOTENCIA_MEMORIA entradas), que poupa a ida ao banco nas repetições.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request, session
+
+from escritor import EscritorOcupado
+from metricas import cache as metrica_cache
+
+logger = logging.getLogger('contrato.idempotencia')
+
+HEADER = 'Idempotency-Key'
+TAMANHO_MAXIMO_CHAVE = 255
+
+# Headers que não fazem parte da resposta guardada
+HEADERS_IGNORADOS = {'content-length', 'set-cookie', 'vary'}
+
+
+def reivindicar(conn, usuario_id, chave, impressao, ttl, orfao):
+    """
+    Tarefa do escritor: registra a chave como em andamento e devolve None, ou
+    devolve a linha existente (impressao, status, codigo, headers, corpo, expira_em)
+    """
+    # Expiradas saem aos poucos, a cada reivindicação
+    conn.execute('''
+        DELETE FROM idempotencia WHERE rowid IN (
+            SELECT rowid FROM idempotencia WHERE expira_em < strftime('%s', 'now') LIMIT 100
+        )
+    ''')
+    agora = int(time.time())
+    # Uma chave parada em andamento há mais de `orfao` segundos é de um processo que morreu
+    conn.execute('''
+        DELETE FROM idempotencia
+        WHERE usuario_id = ? AND chave = ? AND status = 'em_andamento' AND criado_em < ?
+    ''', (usuario_id, chave, agora - orfao))
+    inserida = conn.execute('''
+        INSERT OR IGNORE INTO idempotencia (usuario_id, chave, impressao, status, criado_em, expira_em)
+        VALUES (?, ?, ?, 'em_andamento', ?, ?)
+    ''', (usuario_id, chave, impressao, agora, agora + ttl)).rowcount
+    if inserida:
+        return None
+    return _ler(conn, usuario_id, chave)
+
+
+def gravar(conn, usuario_id, chave, codigo, headers, corpo):
+    """Tarefa do escritor: guarda a resposta da primeira execução"""
+    conn.execute('''
+        UPDATE idempotencia SET status = 'concluido', codigo = ?, headers = ?, corpo = ?
+        WHERE usuario_id = ? AND chave = ?
+    ''', (codigo, headers, corpo, usuario_id, chave))
+
+
+def liberar(conn, usuario_id, chave):
+    """Tarefa do escritor: esquece a chave (a view falhou; a repetição executa de novo)"""
+    conn.execute(
+        "DELETE FROM idempotencia WHERE usuario_id = ? AND chave = ? AND status = 'em_andamento'",
+        (usuario_id, chave)
+    )
+
+
+def _ler(conn, usuario_id, chave):
+    return conn.execute('''
+        SELECT impressao, status, codigo, headers, corpo, expira_em FROM idempotencia
+        WHERE usuario_id = ? AND chave = ? AND expira_em >= strftime('%s', 'now')
+    ''', (usuario_id, chave)).fetchone()
+
+
+class _Guardada:
+    __slots__ = ('impressao', 'codigo', 'headers', 'corpo', 'expira_em')
+
+    def __init__(self, impressao, codigo, headers, corpo, expira_em):
+        self.impressao = impressao
+        self.codigo = codigo
+        self.headers = headers
+        self.corpo = corpo
+        self.expira_em = expira_em
+
+
+class Idempotencia:
+    """Extensão Flask: decorador `rota` que respeita o header Idempotency-Key"""
+
+    def __init__(self, escrever, ler, app=None):
+        self.escrever = escrever
+        self.ler = ler
+        self._lock = threading.Lock()
+        self._memoria = OrderedDict()
+        self._em_voo = {}
+        self._contadores = {'executadas': 0, 'repetidas': 0, 'aguardadas': 0,
+                            'conflitos': 0, 'em_andamento': 0, 'liberadas': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IDEMPOTENCIA_ATIVA', True)
+        app.config.setdefault('IDEMPOTENCIA_TTL', 86400)
+        app.config.setdefault('IDEMPOTENCIA_MEMORIA', 1024)
+        app.config.setdefault('IDEMPOTENCIA_ESPERA', 10.0)
+        app.config.setdefault('IDEMPOTENCIA_ORFAO', 120)
+        app.extensions['idempotencia'] = self
+
+    # ========== CACHE EM MEMÓRIA ==========
+    def _da_memoria(self, chave):
+        with self._lock:
+            guardada = self._memoria.get(chave)
+            if guardada is None:
+                return None
+            if guardada.expira_em < time.time():
+                del self._memoria[chave]
+                return None
+            self._memoria.move_to_end(chave)
+            return guardada
+
+    def _para_memoria(self, chave, guardada):
+        with self._lock:
+            self._memoria[chave] = guardada
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > current_app.config['IDEMPOTENCIA_MEMORIA']:
+                self._memoria.popitem(last=False)
+
+    # ========== DECORADOR ==========
+    def rota(self, view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            chave = request.headers.get(HEADER)
+            if chave is None or not current_app.config['IDEMPOTENCIA_ATIVA']:
+                return view(*args, **kwargs)
+            chave = chave.strip()
+            if not chave or len(chave) > TAMANHO_MAXIMO_CHAVE:
+                return jsonify({'success': False, 'message': f'{HEADER} inválida'}), 400
+
+            usuario_id = session.get('usuario_id')
+            impressao = hashlib.sha256(
+                b'\n'.join((request.method.encode(), request.path.encode(), request.get_data()))
+            ).hexdigest()
+            # O banco entra na chave do cache: aplicações com bancos diferentes repetem ids de usuário
+            banco = current_app.extensions['armazenamento'].caminho_atual()
+            try:
+                return self._executar((banco, usuario_id, chave), impressao, lambda: view(*args, **kwargs))
+            except EscritorOcupado:
+                return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente'}), 503, {'Retry-After': '1'}
+
+        return decorated_function
+
+    def _executar(self, id_chave, impressao, executar):
+        _, usuario_id, chave = id_chave
+        config = current_app.config
+        prazo = time.monotonic() + config['IDEMPOTENCIA_ESPERA']
+        while True:
+            guardada = self._da_memoria(id_chave)
+            if guardada is not None:
+                return self._repetir(guardada, impressao)
+
+            # Só uma thread do processo reivindica a chave; as outras esperam por ela
+            with self._lock:
+                evento = self._em_voo.get(id_chave)
+                lider = evento is None
+                if lider:
+                    evento = self._em_voo[id_chave] = threading.Event()
+            if not lider:
+                with self._lock:
+                    self._contadores['aguardadas'] += 1
+                if not evento.wait(max(0, prazo - time.monotonic())):
+                    return self._em_andamento()
+                continue
+
+            try:
+                linha = self.escrever(
+                    reivindicar, usuario_id, chave, impressao,
+                    config['IDEMPOTENCIA_TTL'], config['IDEMPOTENCIA_ORFAO']
+                )
+                if linha is None:
+                    return self._primeira(id_chave, impressao, executar)
+                if linha['status'] == 'concluido':
+                    return self._repetir(self._guardar_linha(id_chave, linha), impressao)
+                if linha['impressao'] != impressao:
+                    return self._conflito()
+                # Em execução em outro worker: consulta a tabela até terminar
+                with self._lock:
+                    self._contadores['aguardadas'] += 1
+                while time.monotonic() < prazo:
+                    time.sleep(0.05)
+                    conn = self.ler()
+                    try:
+                        linha = _ler(conn, usuario_id, chave)
+                    finally:
+                        conn.close()
+                    if linha is None:
+                        break  # a original falhou e liberou a chave: reivindica de novo
+                    if linha['status'] == 'concluido':
+                        return self._repetir(self._guardar_linha(id_chave, linha), impressao)
+                else:
+                    return self._em_andamento()
+            finally:
+                with self._lock:
+                    self._em_voo.pop(id_chave, None)
+                evento.set()
+
+    def _primeira(self, id_chave, impressao, executar):
+        _, usuario_id, chave = id_chave
+        with self._lock:
+            self._contadores['executadas'] += 1
+        metrica_cache.inc('idempotencia', 'miss')
+        try:
+            resposta = make_response(executar())
+        except Exception:
+            self._liberar(usuario_id, chave)
+            raise
+        if resposta.is_streamed or resposta.status_code >= 500:
+            self._liberar(usuario_id, chave)
+            return resposta
+        headers = [(k, v) for k, v in resposta.headers.items() if k.lower() not in HEADERS_IGNORADOS]
+        corpo = resposta.get_data()
+        try:
+            self.escrever(gravar, usuario_id, chave, resposta.status_code, json.dumps(headers), corpo)
+        except Exception as e:
+            # A view já rodou: a resposta vale mesmo sem ficar guardada no banco
+            logger.warning(f'Resposta idempotente não gravada: {e}')
+        self._para_memoria(id_chave, _Guardada(
+            impressao, resposta.status_code, headers, corpo,
+            time.time() + current_app.config['IDEMPOTENCIA_TTL']
+        ))
+        return resposta
+
+    def _liberar(self, usuario_id, chave):
+        with self._lock:
+            self._contadores['liberadas'] += 1
+        try:
+            self.escrever(liberar, usuario_id, chave)
+        except Exception as e:
+            logger.warning(f'Chave de idempotência não liberada: {e}')
+
+    def _guardar_linha(self, id_chave, linha):
+        guardada = _Guardada(
+            linha['impressao'], linha['codigo'], json.loads(linha['headers'] or '[]'),
+            linha['corpo'], linha['expira_em']
+        )
+        self._para_memoria(id_chave, guardada)
+        return guardada
+
+    def _repetir(self, guardada, impressao):
+        if guardada.impressao != impressao:
+            return self._conflito()
+        with self._lock:
+            self._contadores['repetidas'] += 1
+        metrica_cache.inc('idempotencia', 'hit')
+        resposta = current_app.response_class(guardada.corpo, status=guardada.codigo, headers=guardada.headers)
+        resposta.headers['Idempotent-Replayed'] = 'true'
+        return resposta
+
+    def _conflito(self):
+        with self._lock:
+            self._contadores['conflitos'] += 1
+        return jsonify({
+            'success': False,
+            'message': f'{HEADER} já usada em outra requisição'
+        }), 422
+
+    def _em_andamento(self):
+        with self._lock:
+            self._contadores['em_andamento'] += 1
+        return jsonify({
+            'success': False,
+            'message': 'Requisição com a mesma chave ainda em andamento'
+        }), 409, {'Retry-After': '1'}
+
+    def metricas(self):
+        with self._lock:
+            return {**self._contadores, 'em_memoria': len(self._memoria), 'em_voo': len(self._em_voo)}
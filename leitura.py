@@ -0,0 +1,144 @@
+"""
+Pool de conexões somente leitura para os endpoints GET.
+
+Com o banco em WAL, leitores não bloqueiam o escritor (escritor.py) nem são
+bloqueados por ele. Cada conexão do pool é aberta com a URI `mode=ro` e
+`PRAGMA query_only`, então uma escrita por engano falha em vez de disputar o
+lock. `close()` devolve a conexão ao pool, o que deixa os handlers com o
+padrão de sempre (conn = ...; ...; conn.close()).
+
+Com snapshot=True a conexão já sai com BEGIN: todas as consultas enxergam o
+mesmo estado do banco até o close(), útil em endpoints de várias consultas
+como o dashboard. LEITURA_ATIVA e LEITURA_POOL vêm da aplicação atual
+(current_app); o pool de cada banco guarda o tamanho da que o criou.
+"""
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+from flask import current_app
+
+import metricas
+
+
+class ConexaoLeitura(metricas.ConexaoInstrumentada):
+    """Conexão do pool: close() devolve ao pool; fechar() fecha de verdade"""
+
+    _dono = None
+    _pool = None
+    _emprestada = False
+
+    def close(self):
+        if self._emprestada:
+            self._emprestada = False
+            self._dono.devolver(self)
+
+    def fechar(self):
+        super().close()
+
+
+class _Pool:
+    def __init__(self, caminho, tamanho):
+        self.caminho = caminho
+        self.tamanho = tamanho  # LEITURA_POOL da aplicação que criou o pool
+        # Caminhos que já são URI (armazenamento em memória) valem como estão; query_only protege
+        self.uri = caminho if caminho.startswith('file:') else f'file:{quote(os.path.abspath(caminho))}?mode=ro'
+        self.livres = []
+        self.lock = threading.Lock()
+
+    def conectar(self):
+        conn = sqlite3.connect(self.uri, uri=True, factory=ConexaoLeitura, check_same_thread=False)
+        conn.isolation_level = None  # BEGIN só quando pedido (snapshot)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA query_only = 1')
+        if 'mode=memory' in self.uri:
+            # Cache compartilhado trava por tabela: sem isso a leitura falha enquanto o escritor grava
+            conn.execute('PRAGMA read_uncommitted = 1')
+        return conn
+
+
+class PoolLeitura:
+    """Extensão Flask: conexões mode=ro reaproveitadas entre requisições"""
+
+    def __init__(self, app=None):
+        self._pools = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._contadores = {'emprestimos': 0, 'criadas': 0, 'descartadas': 0, 'snapshots': 0, 'em_uso': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LEITURA_ATIVA', True)
+        app.config.setdefault('LEITURA_POOL', 8)
+        app.extensions['leitura'] = self
+
+    def _pool(self, caminho):
+        pool = self._pools.get(caminho)
+        if pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Conexões abertas antes do fork não podem ser usadas no filho
+                    self._pools = {}
+                    self._pid = os.getpid()
+                pool = self._pools.get(caminho)
+                if pool is None:
+                    pool = self._pools[caminho] = _Pool(caminho, current_app.config['LEITURA_POOL'])
+        return pool
+
+    def obter(self, caminho, snapshot=False):
+        pool = self._pool(caminho)
+        with pool.lock:
+            conn = pool.livres.pop() if pool.livres else None
+        if conn is None:
+            conn = pool.conectar()
+            conn._dono = self
+            conn._pool = pool
+            with self._lock:
+                self._contadores['criadas'] += 1
+        conn._emprestada = True
+        if snapshot:
+            conn.execute('BEGIN')
+        with self._lock:
+            self._contadores['emprestimos'] += 1
+            self._contadores['snapshots'] += snapshot
+            self._contadores['em_uso'] += 1
+        return conn
+
+    def devolver(self, conn):
+        with self._lock:
+            self._contadores['em_uso'] -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.fechar()
+            return
+        pool = conn._pool
+        if self._pools.get(pool.caminho) is pool:
+            with pool.lock:
+                if len(pool.livres) < pool.tamanho:
+                    pool.livres.append(conn)
+                    return
+        with self._lock:
+            self._contadores['descartadas'] += 1
+        conn.fechar()
+
+    def metricas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            pools = list(self._pools.values())
+        dados['livres'] = sum(len(p.livres) for p in pools)
+        dados['reaproveitadas'] = dados['emprestimos'] - dados['criadas']
+        return dados
+
+    def encerrar(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            with pool.lock:
+                livres, pool.livres = pool.livres, []
+            for conn in livres:
+                conn.fechar()
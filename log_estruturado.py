@@ -0,0 +1,167 @@
+"""
+Logging estruturado e assíncrono.
+
+As threads de requisição só colocam o registro numa fila (QueueHandler); uma
+thread de fundo (QueueListener) formata em JSON e escreve em stderr. Se a
+fila encher, o registro é descartado e contado em vez de bloquear a requisição.
+
+O resumo de cada requisição (id, usuário, rota, status, duração, tempo de
+banco) é amostrado: erros (status >= 500) e requisições lentas são sempre
+registrados; as bem-sucedidas seguem LOG_AMOSTRAGEM.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import current_app, g, has_request_context, request, session
+
+logger_requisicoes = logging.getLogger('contrato.requisicao')
+
+_CAMPOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'campos'}
+
+
+class FormatadorJSON(logging.Formatter):
+    def format(self, record):
+        dados = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            dados['request_id'] = request_id
+        campos = getattr(record, 'campos', None)
+        if campos:
+            dados.update(campos)
+        for chave, valor in vars(record).items():
+            if chave not in _CAMPOS_PADRAO and chave != 'request_id':
+                dados[chave] = valor
+        if record.exc_text:
+            dados['exc'] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class HandlerFilaLimitada(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (e conta) em vez de bloquear quando a fila está cheia"""
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record):
+        # Só o necessário na thread da requisição: mensagem final, traceback e request id
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if not hasattr(record, 'request_id') and has_request_context():
+            record.request_id = g.get('request_id')
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+_listener = None
+_handler = None
+
+
+def configurar_logging(nivel='INFO', tamanho_fila=10000):
+    """Liga a fila de logging no logger raiz (uma vez por processo)"""
+    global _listener, _handler
+    if _listener is not None:
+        return _handler
+
+    saida = logging.StreamHandler(sys.stderr)
+    saida.setFormatter(FormatadorJSON())
+    fila = queue.Queue(maxsize=tamanho_fila)
+    _handler = HandlerFilaLimitada(fila)
+    _listener = logging.handlers.QueueListener(fila, saida, respect_handler_level=False)
+
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(_handler)
+    raiz.setLevel(nivel)
+
+    _listener.start()
+    atexit.register(encerrar_logging)
+    return _handler
+
+
+def encerrar_logging():
+    """Esvazia a fila e para a thread de escrita"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def metricas():
+    return {
+        'na_fila': _handler.queue.qsize() if _handler else 0,
+        'descartados': _handler.descartados if _handler else 0,
+    }
+
+
+class LogRequisicoes:
+    """Extensão Flask: request id e resumo amostrado de cada requisição /api/"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_ASSINCRONO', True)
+        app.config.setdefault('LOG_NIVEL', 'INFO')
+        app.config.setdefault('LOG_FILA', 10000)
+        app.config.setdefault('LOG_AMOSTRAGEM', 0.1)
+        app.config.setdefault('LOG_LENTA_MS', 500)
+
+        if app.config['LOG_ASSINCRONO']:
+            configurar_logging(app.config['LOG_NIVEL'], app.config['LOG_FILA'])
+
+        app.before_request_funcs.setdefault(None, []).insert(0, self._inicio)
+        app.after_request(self._fim)
+        app.extensions['log_requisicoes'] = self
+
+    def _inicio(self):
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g._inicio_log = time.perf_counter()
+
+    def _fim(self, resposta):
+        resposta.headers['X-Request-ID'] = g.get('request_id', '')
+        if not request.path.startswith('/api/') or '_inicio_log' not in g:
+            return resposta
+
+        duracao_ms = (time.perf_counter() - g._inicio_log) * 1000
+        config = current_app.config
+        status = resposta.status_code
+        if status < 500 and duracao_ms < config['LOG_LENTA_MS'] and random.random() >= config['LOG_AMOSTRAGEM']:
+            return resposta
+
+        nivel = logging.ERROR if status >= 500 else logging.WARNING if duracao_ms >= config['LOG_LENTA_MS'] else logging.INFO
+        logger_requisicoes.log(nivel, 'requisicao', extra={'campos': {
+            'request_id': g.request_id,
+            'usuario_id': session.get('usuario_id'),
+            'metodo': request.method,
+            'rota': request.path,
+            'endpoint': request.endpoint,
+            'status': status,
+            'duracao_ms': round(duracao_ms, 3),
+            'db_ms': round(g.get('_db_tempo', 0.0) * 1000, 3),
+            'db_queries': g.get('_db_queries', 0),
+        }})
+        return resposta
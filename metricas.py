@@ -0,0 +1,327 @@
+"""
+Métricas no formato de exposição de texto do Prometheus (/metrics).
+
+Contadores e histogramas ficam pré-agregados em memória: cada observação
+só incrementa números já alocados (buckets fixos por série), então o custo
+no caminho da requisição é um bisect e alguns incrementos sob um lock.
+"""
+import contextlib
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_QUERIES = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_labels(nomes, valores):
+    if not nomes:
+        return ''
+    return '{' + ','.join(f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)) + '}'
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, labels=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores_labels, valor=1):
+        with self._lock:
+            self._valores[valores_labels] = self._valores.get(valores_labels, 0) + valor
+
+    def exportar(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        for chave, valor in itens:
+            yield f'{self.nome}{_formatar_labels(self.labels, chave)} {valor}'
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, labels=(), buckets=BUCKETS_LATENCIA):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [contagens por bucket..., +Inf, soma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_labels):
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores_labels)
+            if serie is None:
+                serie = self._series[valores_labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[indice] += 1
+            serie[-1] += valor
+
+    def exportar(self):
+        with self._lock:
+            itens = [(chave, list(serie)) for chave, serie in self._series.items()]
+        nomes_le = self.labels + ('le',)
+        for chave, serie in itens:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, serie):
+                acumulado += contagem
+                yield f'{self.nome}_bucket{_formatar_labels(nomes_le, chave + (limite,))} {acumulado}'
+            acumulado += serie[len(self.buckets)]
+            yield f'{self.nome}_bucket{_formatar_labels(nomes_le, chave + ("+Inf",))} {acumulado}'
+            yield f'{self.nome}_sum{_formatar_labels(self.labels, chave)} {serie[-1]}'
+            yield f'{self.nome}_count{_formatar_labels(self.labels, chave)} {acumulado}'
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+
+    def contador(self, *args, **kwargs):
+        metrica = Contador(*args, **kwargs)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, *args, **kwargs):
+        metrica = Histograma(*args, **kwargs)
+        self._metricas.append(metrica)
+        return metrica
+
+    def exportar(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f'# HELP {metrica.nome} {metrica.ajuda}')
+            linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+            linhas.extend(metrica.exportar())
+        return linhas
+
+
+def exportar_subsistemas(dados):
+    """
+    Converte o dict de métricas dos subsistemas em gauges:
+    {'senhas': {'na_fila': 0}} vira contrato_senhas_na_fila 0 e
+    {'admissao': {'pesada': {'na_fila': 2}}} vira contrato_admissao_na_fila{grupo="pesada"} 2
+    """
+    series = {}
+    for subsistema, valores in dados.items():
+        for chave, valor in valores.items():
+            if isinstance(valor, dict):
+                for campo, v in valor.items():
+                    if isinstance(v, (int, float)) and not isinstance(v, bool):
+                        series.setdefault(f'contrato_{subsistema}_{campo}', []).append(
+                            (_formatar_labels(('grupo',), (chave,)), v))
+            elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                series.setdefault(f'contrato_{subsistema}_{chave}', []).append(('', valor))
+    linhas = []
+    for nome, amostras in series.items():
+        linhas.append(f'# TYPE {nome} gauge')
+        linhas.extend(f'{nome}{labels} {valor}' for labels, valor in amostras)
+    return linhas
+
+
+REGISTRO = Registro()
+
+requisicoes = REGISTRO.contador(
+    'contrato_http_requisicoes_total', 'Requisições HTTP por endpoint, método e status',
+    ('endpoint', 'metodo', 'status'))
+latencia = REGISTRO.histograma(
+    'contrato_http_latencia_segundos', 'Latência das requisições HTTP por endpoint e status',
+    ('endpoint', 'status'))
+db_queries = REGISTRO.histograma(
+    'contrato_db_queries_por_requisicao', 'Quantidade de comandos SQL por requisição',
+    ('endpoint',), buckets=BUCKETS_QUERIES)
+db_tempo = REGISTRO.histograma(
+    'contrato_db_tempo_por_requisicao_segundos', 'Tempo gasto no SQLite por requisição',
+    ('endpoint',))
+smtp_latencia = REGISTRO.histograma(
+    'contrato_smtp_envio_segundos', 'Latência dos envios SMTP por resultado',
+    ('resultado',), buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0))
+cache = REGISTRO.contador(
+    'contrato_cache_total', 'Consultas a caches por cache e resultado (hit/miss)',
+    ('cache', 'resultado'))
+
+
+# ========== SQL ==========
+# Coleta ativa na thread (a do escritor, enquanto roda a tarefa de uma requisição)
+_coleta_local = threading.local()
+
+
+class ColetaSQL:
+    """Comandos de uma tarefa que roda fora da requisição; somados a ela depois, por somar_coleta()"""
+    __slots__ = ('queries', 'tempo', 'rastro')
+
+    def __init__(self, rastrear=False):
+        self.queries = 0
+        self.tempo = 0.0
+        self.rastro = [] if rastrear else None
+
+
+def nova_coleta():
+    """Coleta para uma tarefa submetida pela requisição atual (None fora de requisição)"""
+    if not has_request_context():
+        return None
+    return ColetaSQL(rastrear=g.get('_rastro_sql') is not None)
+
+
+@contextlib.contextmanager
+def coletando(coleta):
+    """Dentro do bloco, os comandos desta thread vão para `coleta`"""
+    _coleta_local.atual = coleta
+    try:
+        yield coleta
+    finally:
+        _coleta_local.atual = None
+
+
+def somar_coleta(coleta):
+    """Soma à requisição atual os comandos que uma tarefa dela rodou em outra thread"""
+    if coleta is None or not has_request_context():
+        return
+    g._db_queries = g.get('_db_queries', 0) + coleta.queries
+    g._db_tempo = g.get('_db_tempo', 0.0) + coleta.tempo
+    rastro = g.get('_rastro_sql')
+    if rastro is not None and coleta.rastro:
+        rastro.extend(coleta.rastro)
+
+
+def registrar_query(sql, parametros, duracao, linhas):
+    """
+    Acumula uma query no contexto da requisição atual (se houver), ou na
+    coleta ativa da thread. Quando o rastreamento de SQL está ligado
+    (g._rastro_sql, ver rastreador_sql.py), guarda também o comando e
+    retorna a entrada para o cursor completar.
+    """
+    coleta = getattr(_coleta_local, 'atual', None)
+    if coleta is not None:
+        coleta.queries += 1
+        coleta.tempo += duracao
+        if coleta.rastro is None:
+            return None
+        entrada = {'sql': sql, 'parametros': parametros, 'duracao': duracao, 'linhas': linhas}
+        coleta.rastro.append(entrada)
+        return entrada
+    if not has_request_context():
+        return None
+    g._db_queries = g.get('_db_queries', 0) + 1
+    g._db_tempo = g.get('_db_tempo', 0.0) + duracao
+    rastro = g.get('_rastro_sql')
+    if rastro is None:
+        return None
+    entrada = {'sql': sql, 'parametros': parametros, 'duracao': duracao, 'linhas': linhas}
+    rastro.append(entrada)
+    return entrada
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    _entrada = None
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._entrada = registrar_query(sql, parametros, time.perf_counter() - inicio,
+                                            max(self.rowcount, 0))
+
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            self._entrada = registrar_query(sql, None, time.perf_counter() - inicio,
+                                            max(self.rowcount, 0))
+
+    # Leituras só contam linhas/tempo quando o rastreamento está ativo
+    def _buscar(self, metodo, *args):
+        if self._entrada is None:
+            return metodo(*args)
+        inicio = time.perf_counter()
+        resultado = metodo(*args)
+        decorrido = time.perf_counter() - inicio
+        self._entrada['duracao'] += decorrido
+        coleta = getattr(_coleta_local, 'atual', None)
+        if coleta is not None:
+            coleta.tempo += decorrido
+        else:
+            g._db_tempo += decorrido
+        if isinstance(resultado, list):
+            self._entrada['linhas'] += len(resultado)
+        elif resultado is not None:
+            self._entrada['linhas'] += 1
+        return resultado
+
+    def fetchone(self):
+        return self._buscar(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._buscar(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._buscar(super().fetchall)
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão que mede cada comando (use com sqlite3.connect(..., factory=ConexaoInstrumentada))"""
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+
+# ========== FLASK ==========
+class Metricas:
+    """Extensão Flask: mede cada requisição e expõe /metrics"""
+
+    def __init__(self, app=None, registro=REGISTRO):
+        self.registro = registro
+        self._subsistemas = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request_funcs.setdefault(None, []).insert(0, self._inicio)
+        app.after_request(self._fim)
+        app.add_url_rule('/metrics', 'metrics', self.exportar, methods=['GET'])
+        app.extensions['metricas'] = self
+
+    def subsistemas(self, funcao):
+        """Decorador: `funcao()` retorna {subsistema: métricas}, exportadas como gauges a cada coleta"""
+        self._subsistemas = funcao
+        return funcao
+
+    def _inicio(self):
+        g._inicio_requisicao = time.perf_counter()
+
+    def _fim(self, resposta):
+        inicio = g.get('_inicio_requisicao')
+        if inicio is None:
+            return resposta
+        endpoint = request.endpoint or 'nao_encontrado'
+        status = resposta.status_code
+        requisicoes.inc(endpoint, request.method, status)
+        latencia.observar(time.perf_counter() - inicio, endpoint, status)
+        db_queries.observar(g.get('_db_queries', 0), endpoint)
+        if '_db_tempo' in g:
+            db_tempo.observar(g._db_tempo, endpoint)
+        return resposta
+
+    def exportar(self):
+        linhas = self.registro.exportar()
+        if self._subsistemas is not None:
+            linhas.extend(exportar_subsistemas(self._subsistemas()))
+        return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,188 @@
+"""
+Profiler sob demanda para requisições.
+
+Uma requisição é perfilada quando:
+    - um admin envia o header X-Profile: 1 (ou X-Profile: amostragem);
+    - o endpoint está em PERFIL_ROTAS;
+    - cai na amostragem aleatória PERFIL_AMOSTRAGEM (0.0 a 1.0).
+
+Modo determinístico (cProfile) grava .pstats; modo amostragem lê a pilha da
+thread da requisição a cada PERFIL_INTERVALO_MS e grava pilhas colapsadas
+(.folded, formato do flamegraph.pl/speedscope). Os arquivos ficam num
+diretório rotativo com no máximo PERFIL_MAX_ARQUIVOS e são listados e
+baixados por admins em /api/system/perfis. Admin é quem entrou com a coluna
+usuario.admin ligada (session['usuario_admin'], gravado no login).
+"""
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, jsonify, request, send_from_directory, session
+
+EXTENSOES = ('.pstats', '.folded')
+
+
+class AmostradorPilha:
+    """Amostra a pilha de uma thread em intervalos fixos e acumula pilhas colapsadas"""
+
+    def __init__(self, thread_id, intervalo):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, name='perfil-amostrador', daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def colapsado(self):
+        return ''.join(f'{pilha} {total}\n' for pilha, total in self.pilhas.most_common())
+
+
+class Perfilador:
+    """Extensão Flask do profiler"""
+
+    def __init__(self, app=None):
+        self._deterministico = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PERFIL_DIR', os.path.join(app.root_path, 'data', 'perfis'))
+        app.config.setdefault('PERFIL_MAX_ARQUIVOS', 50)
+        app.config.setdefault('PERFIL_ROTAS', ())
+        app.config.setdefault('PERFIL_AMOSTRAGEM', 0.0)
+        app.config.setdefault('PERFIL_MODO', 'deterministico')
+        app.config.setdefault('PERFIL_INTERVALO_MS', 5)
+
+        app.before_request(self._iniciar)
+        app.after_request(self._finalizar)
+        app.teardown_request(self._descartar)
+        app.add_url_rule('/api/system/perfis', 'perfis_listar', self.listar, methods=['GET'])
+        app.add_url_rule('/api/system/perfis/<nome>', 'perfis_baixar', self.baixar, methods=['GET'])
+        app.extensions['perfilador'] = self
+
+    @staticmethod
+    def eh_admin():
+        return bool(session.get('usuario_admin'))
+
+    def _modo_requisicao(self):
+        """Retorna o modo de profiling desta requisição, ou None"""
+        config = current_app.config
+        cabecalho = request.headers.get('X-Profile')
+        if cabecalho and self.eh_admin():
+            return 'amostragem' if cabecalho == 'amostragem' else 'deterministico'
+        endpoint = (request.endpoint or '').rpartition('.')[2]
+        if endpoint and endpoint in config['PERFIL_ROTAS']:
+            return config['PERFIL_MODO']
+        if config['PERFIL_AMOSTRAGEM'] and random.random() < config['PERFIL_AMOSTRAGEM']:
+            return config['PERFIL_MODO']
+        return None
+
+    def _iniciar(self):
+        modo = self._modo_requisicao()
+        if modo is None:
+            return
+        if modo == 'amostragem':
+            perfil = AmostradorPilha(threading.get_ident(), current_app.config['PERFIL_INTERVALO_MS'] / 1000)
+            perfil.iniciar()
+        else:
+            # Um cProfile por vez: em versões novas do Python o hook de profiling é global
+            if not self._deterministico.acquire(blocking=False):
+                return
+            perfil = cProfile.Profile()
+            perfil.enable()
+        g._perfil = (modo, perfil, time.perf_counter())
+
+    def _finalizar(self, resposta):
+        dados = g.pop('_perfil', None)
+        if dados is None:
+            return resposta
+        modo, perfil, inicio = dados
+        duracao_ms = int((time.perf_counter() - inicio) * 1000)
+        if modo == 'amostragem':
+            perfil.parar()
+        else:
+            perfil.disable()
+            self._deterministico.release()
+
+        diretorio = current_app.config['PERFIL_DIR']
+        os.makedirs(diretorio, exist_ok=True)
+        endpoint = (request.endpoint or 'nao_encontrado').rpartition('.')[2]
+        base = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{endpoint}_{duracao_ms}ms"
+        if modo == 'amostragem':
+            nome = base + '.folded'
+            with open(os.path.join(diretorio, nome), 'w', encoding='utf-8') as arquivo:
+                arquivo.write(perfil.colapsado())
+        else:
+            nome = base + '.pstats'
+            perfil.dump_stats(os.path.join(diretorio, nome))
+
+        self._rotacionar(diretorio)
+        resposta.headers['X-Profile-Id'] = nome
+        return resposta
+
+    def _descartar(self, exc=None):
+        # Requisição que terminou sem passar pelo after_request: só desliga o profiler
+        dados = g.pop('_perfil', None)
+        if dados is None:
+            return
+        modo, perfil, _ = dados
+        if modo == 'amostragem':
+            perfil.parar()
+        else:
+            perfil.disable()
+            self._deterministico.release()
+
+    def _rotacionar(self, diretorio):
+        arquivos = sorted(f for f in os.listdir(diretorio) if f.endswith(EXTENSOES))
+        for antigo in arquivos[:-current_app.config['PERFIL_MAX_ARQUIVOS']]:
+            try:
+                os.remove(os.path.join(diretorio, antigo))
+            except OSError:
+                pass
+
+    # ========== ENDPOINTS ==========
+    def listar(self):
+        if not self.eh_admin():
+            return jsonify({'success': False, 'message': 'Acesso restrito a administradores'}), 403
+        diretorio = current_app.config['PERFIL_DIR']
+        perfis = []
+        if os.path.isdir(diretorio):
+            for nome in sorted(os.listdir(diretorio), reverse=True):
+                if nome.endswith(EXTENSOES):
+                    info = os.stat(os.path.join(diretorio, nome))
+                    perfis.append({
+                        'nome': nome,
+                        'tamanho': info.st_size,
+                        'criado_em': datetime.fromtimestamp(info.st_mtime).isoformat(),
+                    })
+        return jsonify({'success': True, 'perfis': perfis})
+
+    def baixar(self, nome):
+        if not self.eh_admin():
+            return jsonify({'success': False, 'message': 'Acesso restrito a administradores'}), 403
+        if not nome.endswith(EXTENSOES):
+            return jsonify({'success': False, 'message': 'Perfil não encontrado'}), 404
+        return send_from_directory(current_app.config['PERFIL_DIR'], nome, as_attachment=True)
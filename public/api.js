@@ -21,6 +21,33 @@ class ContratoMaisAPI {
         return headers;
     }
 
+    // POST com Idempotency-Key: a mesma chave vai em todas as tentativas, então
+    // repetir depois de uma falha de rede não duplica contrato nem email
+    async postIdempotente(url, dados, tentativas = 3) {
+        const chave = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        for (let tentativa = 1; ; tentativa++) {
+            try {
+                const response = await fetch(url, {
+                    method: 'POST',
+                    headers: { ...this.getHeaders(), 'Idempotency-Key': chave },
+                    body: JSON.stringify(dados),
+                    credentials: 'include'
+                });
+                // 409: a primeira tentativa ainda está em andamento; 503: servidor ocupado
+                if ((response.status === 409 || response.status === 503) && tentativa < tentativas) {
+                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    continue;
+                }
+                return response;
+            } catch (error) {
+                if (tentativa >= tentativas) throw error;
+                await new Promise(resolve => setTimeout(resolve, 500 * tentativa));
+            }
+        }
+    }
+
     // ========== AUTENTICAÇÃO ==========
     async login(email, senha) {
         try {
@@ -132,6 +159,76 @@ class ContratoMaisAPI {
         }
     }
 
+    // ========== SINCRONIZAÇÃO INCREMENTAL ==========
+    // Cache local dos contratos atualizado por /contratos/changes?since=<cursor>.
+    // dias_restantes muda com a data, então a virada do dia força carga completa.
+    carregarCacheContratos(usuarioId) {
+        if (this.cacheContratos === undefined) {
+            try {
+                const salvo = JSON.parse(sessionStorage.getItem('contratos_sync') || 'null');
+                this.cacheContratos = salvo ? { ...salvo, itens: new Map(salvo.itens) } : null;
+            } catch (error) {
+                this.cacheContratos = null;
+            }
+        }
+        
+        const hoje = new Date().toISOString().slice(0, 10);
+        const cache = this.cacheContratos;
+        if (!cache || cache.usuario !== usuarioId || cache.dia !== hoje) {
+            this.cacheContratos = { usuario: usuarioId, dia: hoje, cursor: 0, itens: new Map() };
+        }
+        return this.cacheContratos;
+    }
+
+    salvarCacheContratos() {
+        const cache = this.cacheContratos;
+        try {
+            sessionStorage.setItem('contratos_sync', JSON.stringify({ ...cache, itens: [...cache.itens] }));
+        } catch (error) {
+            // Sem espaço no sessionStorage: o cache continua só em memória
+        }
+    }
+
+    async sincronizarContratos(usuarioId = null) {
+        const cache = this.carregarCacheContratos(usuarioId ?? this.getUser()?.id ?? null);
+        try {
+            const response = await fetch(`${API_BASE_URL}/contratos/changes?since=${cache.cursor}`, {
+                method: 'GET',
+                headers: this.getHeaders(),
+                credentials: 'include'
+            });
+            
+            if (response.status === 401) {
+                return { success: false, authenticated: false };
+            }
+            
+            const data = await response.json();
+            if (!data.success) {
+                return data;
+            }
+            
+            if (data.resync) {
+                cache.itens.clear();
+            }
+            for (const contrato of data.contratos || []) {
+                cache.itens.set(contrato.id, contrato);
+            }
+            for (const id of data.removidos || []) {
+                cache.itens.delete(id);
+            }
+            cache.cursor = data.cursor;
+            this.salvarCacheContratos();
+            
+            const contratos = [...cache.itens.values()].sort((a, b) =>
+                a.data_fim < b.data_fim ? -1 : a.data_fim > b.data_fim ? 1 : a.id - b.id
+            );
+            return { success: true, contratos };
+        } catch (error) {
+            console.error('Erro ao sincronizar contratos:', error);
+            return { success: false, message: 'Erro de conexão com o servidor' };
+        }
+    }
+
     async getContrato(id) {
         try {
             const response = await fetch(`${API_BASE_URL}/contratos/${id}`, {
@@ -149,12 +246,7 @@ class ContratoMaisAPI {
 
     async criarContrato(contrato) {
         try {
-            const response = await fetch(`${API_BASE_URL}/contratos`, {
-                method: 'POST',
-                headers: this.getHeaders(),
-                body: JSON.stringify(contrato),
-                credentials: 'include'
-            });
+            const response = await this.postIdempotente(`${API_BASE_URL}/contratos`, contrato);
             
             return await response.json();
         } catch (error) {
@@ -212,12 +304,7 @@ class ContratoMaisAPI {
 
     async enviarNotificacao(contratoId, dados) {
         try {
-            const response = await fetch(`${API_BASE_URL}/contratos/${contratoId}/notificar`, {
-                method: 'POST',
-                headers: this.getHeaders(),
-                body: JSON.stringify(dados),
-                credentials: 'include'
-            });
+            const response = await this.postIdempotente(`${API_BASE_URL}/contratos/${contratoId}/notificar`, dados);
             
             return await response.json();
         } catch (error) {
@@ -400,6 +487,8 @@ class ContratoMaisAPI {
         localStorage.removeItem('user');
         localStorage.removeItem('authenticated');
         localStorage.removeItem('token');
+        sessionStorage.removeItem('contratos_sync');
+        this.cacheContratos = null;
     }
 
     // ========== INTERCEPTOR DE REQUISIÇÕES ==========
@@ -486,7 +575,7 @@ style.textContent = `
         to { transform: translateX(100%); opacity: 0; }
     }
     
-    .loading-overlay {
+    #loading.loading-overlay {
         position: fixed;
         top: 0;
         left: 0;
@@ -0,0 +1,129 @@
+"""
+Rastreamento de SQL por requisição: detecção de N+1 e de queries lentas.
+
+Com o rastreamento ligado (SQL_TRACE no config, ou o header X-Debug-SQL
+quando SQL_TRACE_HEADER_ATIVO permite), cada comando executado pelas
+conexões de get_db_connection() é registrado com duração e linhas, inclusive
+os das tarefas de escrita da requisição (rodam no escritor e voltam com o
+resultado, ver metricas.ColetaSQL). No fim
+da requisição o relatório vai como registro estruturado para o log
+`contrato.sql` e um resumo para o header X-SQL-Trace.
+"""
+import logging
+import re
+import sqlite3
+
+from flask import current_app, g, request
+
+logger = logging.getLogger('contrato.sql')
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_ESPACOS = re.compile(r'\s+')
+
+
+def formato_query(sql):
+    """Normaliza o comando para agrupar execuções do mesmo formato"""
+    return _ESPACOS.sub(' ', _LITERAIS.sub('?', sql)).strip()
+
+
+class RastreadorSQL:
+    """Extensão Flask que liga o rastreamento e produz o relatório"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_TRACE', False)
+        app.config.setdefault('SQL_TRACE_HEADER_ATIVO', False)
+        app.config.setdefault('SQL_TRACE_LENTA_MS', 50.0)
+        app.config.setdefault('SQL_TRACE_REPETICOES', 3)
+        app.config.setdefault('SQL_TRACE_EXPLAIN', False)
+        app.before_request(self._iniciar)
+        app.after_request(self._finalizar)
+        app.extensions['rastreador_sql'] = self
+
+    def _ativo(self):
+        config = current_app.config
+        if config['SQL_TRACE']:
+            return True
+        return config['SQL_TRACE_HEADER_ATIVO'] and request.headers.get('X-Debug-SQL') == '1'
+
+    def _iniciar(self):
+        if self._ativo():
+            g._rastro_sql = []
+
+    def _finalizar(self, resposta):
+        rastro = g.pop('_rastro_sql', None)
+        if rastro is None:
+            return resposta
+
+        relatorio = self.analisar(rastro)
+        relatorio.update({
+            'metodo': request.method,
+            'rota': request.path,
+            'endpoint': request.endpoint,
+            'status': resposta.status_code,
+        })
+        logger.info('sql_trace', extra={'campos': relatorio})
+
+        resposta.headers['X-SQL-Trace'] = (
+            f"queries={relatorio['total_queries']}; tempo_ms={relatorio['tempo_total_ms']}; "
+            f"repetidas={len(relatorio['repetidas'])}; lentas={len(relatorio['lentas'])}"
+        )
+        return resposta
+
+    def analisar(self, rastro):
+        config = current_app.config
+        limite_lenta = config['SQL_TRACE_LENTA_MS'] / 1000
+
+        formatos = {}
+        for entrada in rastro:
+            formato = formato_query(entrada['sql'])
+            info = formatos.setdefault(formato, {'formato': formato, 'execucoes': 0, 'tempo_ms': 0.0})
+            info['execucoes'] += 1
+            info['tempo_ms'] += entrada['duracao'] * 1000
+
+        repetidas = [
+            {**info, 'tempo_ms': round(info['tempo_ms'], 3)}
+            for info in formatos.values()
+            if info['execucoes'] >= config['SQL_TRACE_REPETICOES']
+        ]
+
+        lentas = []
+        for entrada in rastro:
+            if entrada['duracao'] < limite_lenta:
+                continue
+            lenta = {
+                'sql': formato_query(entrada['sql']),
+                'tempo_ms': round(entrada['duracao'] * 1000, 3),
+                'linhas': entrada['linhas'],
+            }
+            if config['SQL_TRACE_EXPLAIN'] and entrada['parametros'] is not None:
+                lenta['plano'] = self.explicar(entrada['sql'], entrada['parametros'])
+            lentas.append(lenta)
+
+        return {
+            'total_queries': len(rastro),
+            'tempo_total_ms': round(sum(e['duracao'] for e in rastro) * 1000, 3),
+            'queries': [
+                {'sql': formato_query(e['sql']), 'tempo_ms': round(e['duracao'] * 1000, 3), 'linhas': e['linhas']}
+                for e in rastro
+            ],
+            'repetidas': repetidas,
+            'lentas': lentas,
+        }
+
+    def explicar(self, sql, parametros):
+        """EXPLAIN QUERY PLAN numa conexão separada, só leitura"""
+        try:
+            caminho = current_app.extensions['armazenamento'].caminho_atual()
+            uri = caminho if caminho.startswith('file:') else f'file:{caminho}?mode=ro'
+            conn = sqlite3.connect(uri, uri=True)
+            try:
+                linhas = conn.execute(f'EXPLAIN QUERY PLAN {sql}', parametros).fetchall()
+            finally:
+                conn.close()
+            return [linha[-1] for linha in linhas]
+        except sqlite3.Error as e:
+            return [f'indisponível: {e}']
@@ -0,0 +1,281 @@
+"""
+Retenção do histórico de notificações.
+
+Notificações mais antigas que a política do usuário (retencao_politica.dias;
+0 = guardar tudo) ou, sem política, que RETENCAO_DIAS saem do banco principal
+para um banco de arquivo (<banco>-arquivo.db), anexado às conexões do escritor
+como `arquivo`. Cada lote de até RETENCAO_LOTE linhas é uma tarefa do escritor:
+copia notificações e destinatários com INSERT OR IGNORE (o id original é a
+chave) e apaga do banco principal. Em WAL a transação não é atômica entre os
+dois arquivos; repetir um lote interrompido não duplica nada.
+
+O banco principal usa auto_vacuum=INCREMENTAL: ao fim de cada ciclo até
+RETENCAO_VACUUM_PAGINAS páginas livres voltam para o sistema de arquivos.
+Bancos criados antes disso ficam sem o passo (contado em `sem_auto_vacuum`)
+até `python app.py vacuum` convertê-los.
+
+Cada processo roda o ciclo numa thread, a cada RETENCAO_INTERVALO segundos, em
+cada banco do armazenamento (cada fragmento tem o seu arquivo).
+O histórico arquivado é lido por /api/notificacoes/arquivo.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+import metricas
+
+logger = logging.getLogger('contrato.retencao')
+
+notificacoes_arquivadas = metricas.REGISTRO.contador(
+    'contrato_retencao_notificacoes_total', 'Notificações movidas para o banco de arquivo', ())
+paginas_liberadas = metricas.REGISTRO.contador(
+    'contrato_retencao_paginas_liberadas_total', 'Páginas devolvidas pelo incremental_vacuum', ())
+
+ESQUEMA_ARQUIVO = '''
+    CREATE TABLE IF NOT EXISTS arquivo.notificacao (
+        id INTEGER PRIMARY KEY,
+        contrato_id INTEGER NOT NULL,
+        usuario_id INTEGER NOT NULL,
+        contrato_nome TEXT,
+        tipo TEXT NOT NULL,
+        assunto TEXT NOT NULL,
+        mensagem TEXT,
+        email_destino TEXT NOT NULL,
+        status TEXT,
+        data_envio TIMESTAMP,
+        criado_em TIMESTAMP,
+        arquivado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS arquivo.idx_notificacao_usuario
+        ON notificacao (usuario_id, id);
+
+    CREATE TABLE IF NOT EXISTS arquivo.notificacao_destinatario (
+        id INTEGER PRIMARY KEY,
+        notificacao_id INTEGER NOT NULL,
+        usuario_id INTEGER NOT NULL,
+        email TEXT NOT NULL,
+        status TEXT
+    );
+    CREATE INDEX IF NOT EXISTS arquivo.idx_notificacao_destinatario_usuario_email
+        ON notificacao_destinatario (usuario_id, email, notificacao_id);
+    CREATE INDEX IF NOT EXISTS arquivo.idx_notificacao_destinatario_notificacao
+        ON notificacao_destinatario (notificacao_id);
+'''
+
+
+def caminho_arquivo(caminho):
+    """Banco de arquivo ao lado do principal: data/contratos.db -> data/contratos-arquivo.db"""
+    if caminho.startswith('file:'):
+        # URI (armazenamento em memória): o sufixo vai no nome, antes dos parâmetros
+        nome, _, parametros = caminho.partition('?')
+        return f'{nome}-arquivo?{parametros}'
+    base, extensao = os.path.splitext(caminho)
+    return f'{base}-arquivo{extensao or ".db"}'
+
+
+def mover_lote(conn, dias_padrao, lote):
+    """Tarefa do escritor: arquiva até `lote` notificações vencidas e devolve quantas"""
+    dias = [d for (d,) in conn.execute('SELECT DISTINCT dias FROM retencao_politica WHERE dias > 0')]
+    if dias_padrao > 0:
+        dias.append(dias_padrao)
+    if not dias:
+        return 0
+
+    # O menor prazo limita a busca pelo índice de criado_em; o prazo de cada usuário filtra depois
+    ids = [r[0] for r in conn.execute('''
+        SELECT n.id
+        FROM main.notificacao n
+        JOIN main.contrato c ON c.id = n.contrato_id
+        LEFT JOIN main.retencao_politica p ON p.usuario_id = c.usuario_id
+        WHERE n.criado_em < datetime('now', ?)
+          AND COALESCE(p.dias, ?) > 0
+          AND n.criado_em < datetime('now', '-' || COALESCE(p.dias, ?) || ' days')
+        ORDER BY n.criado_em
+        LIMIT ?
+    ''', (f'-{min(dias)} days', dias_padrao, dias_padrao, lote))]
+    if not ids:
+        return 0
+
+    lista = json.dumps(ids)
+    conn.execute('''
+        INSERT OR IGNORE INTO arquivo.notificacao
+            (id, contrato_id, usuario_id, contrato_nome, tipo, assunto, mensagem,
+             email_destino, status, data_envio, criado_em)
+        SELECT n.id, n.contrato_id, c.usuario_id, c.nome, n.tipo, n.assunto, n.mensagem,
+               n.email_destino, n.status, n.data_envio, n.criado_em
+        FROM main.notificacao n
+        JOIN main.contrato c ON c.id = n.contrato_id
+        WHERE n.id IN (SELECT value FROM json_each(?))
+    ''', (lista,))
+    conn.execute('''
+        INSERT OR IGNORE INTO arquivo.notificacao_destinatario (id, notificacao_id, usuario_id, email, status)
+        SELECT id, notificacao_id, usuario_id, email, status
+        FROM main.notificacao_destinatario
+        WHERE notificacao_id IN (SELECT value FROM json_each(?))
+    ''', (lista,))
+    # Os destinatários do banco principal saem junto (ON DELETE CASCADE)
+    return conn.execute(
+        'DELETE FROM main.notificacao WHERE id IN (SELECT value FROM json_each(?))', (lista,)
+    ).rowcount
+
+
+def excluir_arquivadas(conn, usuario_id, contrato_id=None, limite=None):
+    """
+    Tarefa do escritor: apaga o histórico arquivado do usuário (ou de um contrato
+    dele), no máximo `limite` notificações por chamada; devolve quantas apagou
+    """
+    if not conn.execute("SELECT 1 FROM pragma_database_list WHERE name = 'arquivo'").fetchone():
+        return 0
+    filtro, parametros = 'usuario_id = ?', [usuario_id]
+    if contrato_id is not None:
+        filtro += ' AND contrato_id = ?'
+        parametros.append(contrato_id)
+    ids = f'SELECT id FROM arquivo.notificacao WHERE {filtro}'
+    if limite is not None:
+        ids += ' ORDER BY id LIMIT ?'
+        parametros.append(limite)
+    conn.execute(f'''
+        DELETE FROM arquivo.notificacao_destinatario
+        WHERE notificacao_id IN ({ids})
+    ''', parametros)
+    return conn.execute(f'DELETE FROM arquivo.notificacao WHERE id IN ({ids})', parametros).rowcount
+
+
+def passo_vacuum(conn, paginas):
+    """
+    Tarefa do escritor: devolve até `paginas` páginas livres do banco principal;
+    None se ele não está em auto_vacuum=INCREMENTAL (o PRAGMA não faria nada)
+    """
+    if conn.execute('PRAGMA main.auto_vacuum').fetchone()[0] != 2:
+        return None
+    livres = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+    if not livres:
+        return 0
+    # O módulo sqlite3 dá um único step no PRAGMA, e cada step libera uma página
+    for _ in range(min(livres, int(paginas))):
+        conn.execute('PRAGMA main.incremental_vacuum(1)')
+    return livres - conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+
+
+class Retencao:
+    """Extensão Flask: arquiva notificações antigas e compacta o banco principal"""
+
+    def __init__(self, escrever, app=None):
+        self.escrever = escrever
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._preparados = set()
+        self._contadores = {'ciclos': 0, 'lotes': 0, 'arquivadas': 0, 'paginas_liberadas': 0,
+                            'sem_auto_vacuum': 0, 'erros': 0}
+        self._ultimo_ciclo = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RETENCAO_ATIVA', True)
+        app.config.setdefault('RETENCAO_DIAS', 180)
+        app.config.setdefault('RETENCAO_LOTE', 500)
+        app.config.setdefault('RETENCAO_MAX_LOTES', 100)
+        app.config.setdefault('RETENCAO_INTERVALO', 3600)
+        app.config.setdefault('RETENCAO_VACUUM_PAGINAS', 256)
+        app.before_request(self._agendar)
+        app.extensions['retencao'] = self
+
+    # ========== CONEXÕES ==========
+    def anexar(self, conn, caminho):
+        """ATTACH do banco de arquivo (criado na primeira vez) numa conexão de escrita; precisa do app context"""
+        if not current_app.config['RETENCAO_ATIVA']:
+            return conn
+        arquivo = caminho_arquivo(caminho)
+        conn.execute('ATTACH DATABASE ? AS arquivo', (arquivo,))
+        if arquivo not in self._preparados:
+            try:
+                if conn.execute('PRAGMA arquivo.journal_mode').fetchone()[0] != 'wal':
+                    conn.execute('PRAGMA arquivo.journal_mode = WAL')
+            except sqlite3.OperationalError:
+                pass  # outro processo está trocando o modo ao mesmo tempo
+            conn.executescript(ESQUEMA_ARQUIVO)
+            self._preparados.add(arquivo)
+        return conn
+
+    # ========== CICLO ==========
+    def ciclo(self):
+        """Arquiva as notificações vencidas (em lotes) e roda um passo de vacuum; precisa do app context"""
+        config = current_app.config
+        arquivadas = lotes = 0
+        try:
+            while lotes < config['RETENCAO_MAX_LOTES']:
+                movidas = self.escrever(mover_lote, config['RETENCAO_DIAS'], config['RETENCAO_LOTE'])
+                if not movidas:
+                    break
+                lotes += 1
+                arquivadas += movidas
+                notificacoes_arquivadas.inc(valor=movidas)
+            liberadas = self.escrever(passo_vacuum, config['RETENCAO_VACUUM_PAGINAS'])
+            if liberadas is None:
+                with self._lock:
+                    self._contadores['sem_auto_vacuum'] += 1
+                liberadas = 0
+            else:
+                paginas_liberadas.inc(valor=liberadas)
+                with self._lock:
+                    self._contadores['paginas_liberadas'] += liberadas
+        except Exception:
+            with self._lock:
+                self._contadores['erros'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._contadores['ciclos'] += 1
+                self._contadores['lotes'] += lotes
+                self._contadores['arquivadas'] += arquivadas
+                self._ultimo_ciclo = time.time()
+        return {'arquivadas': arquivadas, 'lotes': lotes, 'paginas_liberadas': liberadas}
+
+    def _agendar(self):
+        if not current_app.config['RETENCAO_ATIVA']:
+            return
+        caminho = current_app.config['DATABASE']
+        if caminho in self._threads and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads não sobrevivem ao fork: cada worker agenda a sua
+                self._threads = {}
+                self._pid = os.getpid()
+            if caminho in self._threads:
+                return
+            thread = threading.Thread(target=self._rodar, args=(current_app._get_current_object(),),
+                                      name='retencao', daemon=True)
+            self._threads[caminho] = thread
+        thread.start()
+
+    def _rodar(self, app):
+        # Espera inicial aleatória: os workers não disputam o escritor ao mesmo tempo
+        intervalo = app.config['RETENCAO_INTERVALO']
+        time.sleep(random.uniform(1, max(1, min(60, intervalo))))
+        while True:
+            with app.app_context():
+                for caminho in app.extensions['armazenamento'].em_cada_banco():
+                    try:
+                        resultado = self.ciclo()
+                        if resultado['arquivadas']:
+                            logger.info(
+                                'Retenção em %(banco)s: %(arquivadas)d notificações arquivadas em %(lotes)d lotes, '
+                                '%(paginas_liberadas)d páginas liberadas', {**resultado, 'banco': caminho})
+                    except Exception as e:
+                        logger.error(f'Erro no ciclo de retenção em {caminho}: {e}')
+            time.sleep(intervalo)
+
+    def metricas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados['ultimo_ciclo'] = self._ultimo_ciclo
+        return dados
@@ -0,0 +1,224 @@
+"""
+Hash de senhas do CONTRATO+.
+
+Formatos versionados (o prefixo identifica o algoritmo e o custo usado):
+
+    <64 hex>                                   sha256 legado (sem sal)
+    $pbkdf2-sha256$<iteracoes>$<sal>$<hash>    PBKDF2-HMAC-SHA256
+    $scrypt$<n>,<r>,<p>$<sal>$<hash>           scrypt
+
+O cálculo caro roda num pool de threads limitado (hashlib libera o GIL
+durante o KDF), com teto de concorrência e fila, para que rajadas de login
+não tomem os workers das outras rotas.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolSaturado(Exception):
+    """A fila do pool de hash está cheia, ou o hash não saiu dentro do timeout"""
+
+
+def _b64(dados):
+    return base64.b64encode(dados).decode('ascii').rstrip('=')
+
+
+def _unb64(texto):
+    return base64.b64decode(texto + '=' * (-len(texto) % 4))
+
+
+# ========== ALGORITMOS ==========
+class HasherSha256Legado:
+    """SHA-256 puro, usado pelas versões antigas. Só serve para verificar."""
+    nome = 'sha256'
+
+    def reconhece(self, senha_hash):
+        return len(senha_hash) == 64 and not senha_hash.startswith('$')
+
+    def gerar(self, senha, custo=None):
+        return hashlib.sha256(senha.encode()).hexdigest()
+
+    def verificar(self, senha, senha_hash):
+        return hmac.compare_digest(self.gerar(senha), senha_hash)
+
+    def custo(self, senha_hash):
+        return 0
+
+
+class HasherPbkdf2:
+    nome = 'pbkdf2-sha256'
+    custo_padrao = 260000
+
+    def reconhece(self, senha_hash):
+        return senha_hash.startswith('$pbkdf2-sha256$')
+
+    def gerar(self, senha, custo=None):
+        iteracoes = int(custo or self.custo_padrao)
+        sal = os.urandom(16)
+        dk = hashlib.pbkdf2_hmac('sha256', senha.encode(), sal, iteracoes)
+        return f'$pbkdf2-sha256${iteracoes}${_b64(sal)}${_b64(dk)}'
+
+    def verificar(self, senha, senha_hash):
+        _, _, iteracoes, sal, esperado = senha_hash.split('$')
+        dk = hashlib.pbkdf2_hmac('sha256', senha.encode(), _unb64(sal), int(iteracoes))
+        return hmac.compare_digest(_b64(dk), esperado)
+
+    def custo(self, senha_hash):
+        return int(senha_hash.split('$')[2])
+
+
+class HasherScrypt:
+    """scrypt; o custo é o expoente de N (N = 2 ** custo), com r=8 e p=1"""
+    nome = 'scrypt'
+    custo_padrao = 14
+
+    def reconhece(self, senha_hash):
+        return senha_hash.startswith('$scrypt$')
+
+    def _derivar(self, senha, sal, n, r, p):
+        return hashlib.scrypt(senha.encode(), salt=sal, n=n, r=r, p=p,
+                              maxmem=256 * n * r, dklen=32)
+
+    def gerar(self, senha, custo=None):
+        n = 2 ** int(custo or self.custo_padrao)
+        sal = os.urandom(16)
+        dk = self._derivar(senha, sal, n, 8, 1)
+        return f'$scrypt${n},8,1${_b64(sal)}${_b64(dk)}'
+
+    def verificar(self, senha, senha_hash):
+        _, _, params, sal, esperado = senha_hash.split('$')
+        n, r, p = (int(x) for x in params.split(','))
+        dk = self._derivar(senha, _unb64(sal), n, r, p)
+        return hmac.compare_digest(_b64(dk), esperado)
+
+    def custo(self, senha_hash):
+        n = int(senha_hash.split('$')[2].split(',')[0])
+        return n.bit_length() - 1
+
+
+HASHERS = {h.nome: h for h in (HasherPbkdf2(), HasherSha256Legado())}
+if hasattr(hashlib, 'scrypt'):
+    HASHERS[HasherScrypt.nome] = HasherScrypt()
+
+
+def identificar(senha_hash):
+    """Retorna o hasher que gerou o hash (ou None se o formato é desconhecido)"""
+    for hasher in HASHERS.values():
+        if hasher.reconhece(senha_hash or ''):
+            return hasher
+    return None
+
+
+def _verificar(hasher, senha, senha_hash):
+    """Hash corrompido (campos faltando, base64 ou parâmetros inválidos) é senha errada, não erro"""
+    try:
+        return hasher.verificar(senha, senha_hash)
+    except (ValueError, TypeError):
+        return False
+
+
+# ========== POOL DE TRABALHO ==========
+class PoolHash:
+    """Executor limitado: no máximo `workers` hashes simultâneos e `max_fila` esperando"""
+
+    def __init__(self, workers=2, max_fila=32, timeout=10.0):
+        self.workers = workers
+        self.max_fila = max_fila
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hash-senha')
+        self._vagas = threading.BoundedSemaphore(workers + max_fila)
+        self._lock = threading.Lock()
+        self._em_execucao = 0
+        self._na_fila = 0
+        self._contadores = {'executados': 0, 'rejeitados': 0, 'timeouts': 0}
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._execucao_total = 0.0
+
+    def executar(self, funcao, *args):
+        """Roda `funcao(*args)` no pool e espera o resultado"""
+        if not self._vagas.acquire(blocking=False):
+            with self._lock:
+                self._contadores['rejeitados'] += 1
+            raise PoolSaturado('Pool de hash de senhas saturado')
+
+        enfileirado_em = time.perf_counter()
+        with self._lock:
+            self._na_fila += 1
+
+        def tarefa():
+            inicio = time.perf_counter()
+            espera = inicio - enfileirado_em
+            with self._lock:
+                self._na_fila -= 1
+                self._em_execucao += 1
+                self._espera_total += espera
+                self._espera_max = max(self._espera_max, espera)
+            try:
+                return funcao(*args)
+            finally:
+                with self._lock:
+                    self._em_execucao -= 1
+                    self._contadores['executados'] += 1
+                    self._execucao_total += time.perf_counter() - inicio
+                self._vagas.release()
+
+        futuro = self._executor.submit(tarefa)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self._contadores['timeouts'] += 1
+                if futuro.cancel():
+                    # Nem começou: a tarefa não vai rodar, então a vaga volta aqui
+                    self._na_fila -= 1
+                    self._vagas.release()
+            raise PoolSaturado('Hash de senha não terminou no prazo') from None
+
+    def metricas(self):
+        with self._lock:
+            executados = self._contadores['executados']
+            return {
+                'workers': self.workers,
+                'max_fila': self.max_fila,
+                'em_execucao': self._em_execucao,
+                'na_fila': self._na_fila,
+                **self._contadores,
+                'espera_media_ms': round(self._espera_total / executados * 1000, 3) if executados else 0.0,
+                'espera_max_ms': round(self._espera_max * 1000, 3),
+                'execucao_media_ms': round(self._execucao_total / executados * 1000, 3) if executados else 0.0,
+            }
+
+    def encerrar(self):
+        self._executor.shutdown(wait=False)
+
+
+# ========== API DO MÓDULO ==========
+class GerenciadorSenhas:
+    """Gera hashes no algoritmo padrão e verifica qualquer formato conhecido"""
+
+    def __init__(self, algoritmo='pbkdf2-sha256', custo=None, pool=None):
+        if algoritmo not in HASHERS or algoritmo == HasherSha256Legado.nome:
+            raise ValueError(f'Algoritmo de senha inválido: {algoritmo}')
+        self.hasher = HASHERS[algoritmo]
+        self.custo = int(custo or self.hasher.custo_padrao)
+        self.pool = pool or PoolHash()
+
+    def gerar_hash(self, senha):
+        return self.pool.executar(self.hasher.gerar, senha, self.custo)
+
+    def verificar(self, senha, senha_hash):
+        hasher = identificar(senha_hash)
+        if hasher is None:
+            return False
+        return self.pool.executar(_verificar, hasher, senha, senha_hash)
+
+    def precisa_rehash(self, senha_hash):
+        """True se o hash foi gerado com outro algoritmo ou com custo menor que o atual"""
+        hasher = identificar(senha_hash)
+        return hasher is not self.hasher or hasher.custo(senha_hash) < self.custo
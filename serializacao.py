@@ -0,0 +1,232 @@
+"""
+Serialização de linhas do SQLite direto para JSON.
+
+Cada formato de consulta (Formato) declara as colunas que expõe, a expressão
+SQL de cada uma e os campos calculados. Para cada combinação de campos
+pedida é compilado, uma única vez, um codificador especializado que lê a
+tupla crua do cursor por índice, sem passar por sqlite3.Row nem por um dict
+intermediário:
+
+    - com orjson instalado, o codificador monta o dict e o orjson serializa a lista;
+    - sem orjson, o codificador gera o texto JSON da linha com uma f-string.
+
+O parâmetro ?fields=id,nome,data_fim restringe as colunas (e o SELECT), para
+que textos longos como descricao/mensagem não saiam quando a lista não precisa.
+
+Listas grandes saem em streaming (Codificador.responder_lista): o cursor é lido
+em lotes de STREAMING_LOTE linhas e cada lote vira um pedaço do array JSON,
+então a memória fica limitada a um lote independentemente do total de linhas.
+"""
+import json
+import threading
+from json.encoder import encode_basestring
+
+from flask import current_app, request, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # opcional: sem ele a saída é gerada com o json da biblioteca padrão
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+STREAMING_LOTE_PADRAO = 500
+
+# Marca onde a lista entra no envelope; NUL nunca aparece cru num JSON serializado
+_MARCA_LISTA = b'\x00lista\x00'
+
+
+class CampoInvalido(ValueError):
+    """Campo pedido em ?fields= que o formato não expõe"""
+
+
+def _valor_json(valor):
+    if valor is None:
+        return 'null'
+    tipo = type(valor)
+    if tipo is str:
+        return encode_basestring(valor)
+    if tipo is int:
+        return int.__repr__(valor)
+    if tipo is bool:
+        return 'true' if valor else 'false'
+    return json.dumps(valor, ensure_ascii=False, default=str)
+
+
+def dumps(dados):
+    """Serializa para bytes UTF-8 com o backend disponível"""
+    if orjson is not None:
+        return orjson.dumps(dados, default=str)
+    return json.dumps(dados, ensure_ascii=False, separators=(',', ':'), default=str).encode()
+
+
+class Bruto:
+    """Fragmento JSON já serializado, embutido como está por `responder`"""
+    __slots__ = ('dados',)
+
+    def __init__(self, dados):
+        self.dados = dados
+
+
+def _montar(objeto, partes):
+    if isinstance(objeto, Bruto):
+        partes.append(objeto.dados)
+    elif isinstance(objeto, dict):
+        partes.append(b'{')
+        for i, (chave, valor) in enumerate(objeto.items()):
+            if i:
+                partes.append(b',')
+            partes.append(encode_basestring(str(chave)).encode())
+            partes.append(b':')
+            _montar(valor, partes)
+        partes.append(b'}')
+    elif isinstance(objeto, (list, tuple)) and any(isinstance(v, (Bruto, dict, list)) for v in objeto):
+        partes.append(b'[')
+        for i, valor in enumerate(objeto):
+            if i:
+                partes.append(b',')
+            _montar(valor, partes)
+        partes.append(b']')
+    else:
+        partes.append(dumps(objeto))
+
+
+def serializar(dados):
+    """Como `dumps`, mas aceitando fragmentos Bruto em qualquer ponto do envelope"""
+    partes = []
+    _montar(dados, partes)
+    return b''.join(partes)
+
+
+def responder(dados, status=200):
+    """Resposta application/json para um envelope que pode conter listas já codificadas"""
+    return current_app.response_class(serializar(dados), status=status, mimetype='application/json')
+
+
+class Formato:
+    """Formato de uma consulta: colunas expostas, expressão SQL de cada uma e campos calculados"""
+
+    def __init__(self, nome, colunas, calculados=None, obrigatorios=('id',)):
+        self.nome = nome
+        self.colunas = dict(colunas)                    # campo -> expressão SQL
+        self.calculados = dict(calculados or {})        # campo -> (coluna de origem, funcao)
+        self.obrigatorios = tuple(c for c in obrigatorios if c in self.colunas)
+        self.campos = tuple(self.colunas) + tuple(self.calculados)
+        self._codificadores = {}
+        self._lock = threading.Lock()
+
+    def campos_pedidos(self, texto=None, padrao=None):
+        """Campos do ?fields= (`padrao` ou todos se ausente); CampoInvalido para nomes desconhecidos"""
+        if texto is None:
+            texto = request.args.get('fields')
+        if not texto:
+            return self.campos if padrao is None else tuple(padrao)
+        pedidos = [c.strip() for c in texto.split(',') if c.strip()]
+        invalidos = [c for c in pedidos if c not in self.campos]
+        if invalidos:
+            raise CampoInvalido(f"Campos desconhecidos em fields: {', '.join(invalidos)}")
+        return tuple(c for c in self.campos if c in self.obrigatorios or c in pedidos)
+
+    def para_requisicao(self, padrao=None):
+        """Codificador com os campos pedidos na requisição atual"""
+        return self.codificador(self.campos_pedidos(padrao=padrao))
+
+    def codificador(self, campos=None):
+        campos = self.campos if campos is None else tuple(campos)
+        codificador = self._codificadores.get(campos)
+        if codificador is None:
+            with self._lock:
+                codificador = self._codificadores.get(campos)
+                if codificador is None:
+                    codificador = self._codificadores[campos] = Codificador(self, campos)
+        return codificador
+
+
+class Codificador:
+    """Codificador compilado para um Formato e uma lista de campos"""
+
+    def __init__(self, formato, campos):
+        self.campos = campos
+        colunas = [c for c in campos if c in formato.colunas]
+        for campo in campos:
+            origem = formato.calculados.get(campo, (None,))[0]
+            if origem is not None and origem not in colunas:
+                colunas.append(origem)
+        indices = {c: i for i, c in enumerate(colunas)}
+        self.select = ', '.join(f'{formato.colunas[c]} AS {c}' for c in colunas)
+
+        ambiente = {'_v': _valor_json}
+        expressoes = []
+        for campo in campos:
+            if campo in formato.calculados:
+                origem, funcao = formato.calculados[campo]
+                ambiente[f'_f_{campo}'] = funcao
+                expressoes.append((campo, f'_f_{campo}(r[{indices[origem]}])'))
+            else:
+                expressoes.append((campo, f'r[{indices[campo]}]'))
+
+        if orjson is not None:
+            corpo = '{' + ', '.join(f'{campo!r}: {expr}' for campo, expr in expressoes) + '}'
+        else:
+            # f'{{"id":{_v(r[0])},"nome":{_v(r[1])}}}'
+            pares = ','.join(
+                encode_basestring(campo).replace('{', '{{').replace('}', '}}') + ':{_v(' + expr + ')}'
+                for campo, expr in expressoes
+            )
+            corpo = "f'{{" + pares.replace("'", "\\'") + "}}'"
+        self.linha = eval(compile(f'lambda r: {corpo}', f'<codificador {formato.nome}>', 'eval'), ambiente)
+
+    def _itens(self, linhas):
+        """Itens do array JSON, separados por vírgula e sem os colchetes"""
+        linha = self.linha
+        if orjson is not None:
+            return orjson.dumps([linha(r) for r in linhas], default=str)[1:-1]
+        return ','.join([linha(r) for r in linhas]).encode()
+
+    def lista(self, linhas):
+        """Codifica as tuplas do cursor como um fragmento JSON (array)"""
+        return Bruto(b'[' + self._itens(linhas) + b']')
+
+    def responder_lista(self, cursor, envelope, chave, fechar=None):
+        """
+        Resposta com `envelope` + {chave: linhas do cursor}. Se o cursor tiver até
+        STREAMING_LOTE linhas a resposta é normal; acima disso o array é gerado em
+        streaming, um lote por vez. `fechar` (ex.: conn.close) roda ao terminar.
+        """
+        lote = current_app.config.get('STREAMING_LOTE', STREAMING_LOTE_PADRAO)
+        primeiras = cursor.fetchmany(lote)
+        if len(primeiras) < lote:
+            if fechar:
+                fechar()
+            return responder({**envelope, chave: self.lista(primeiras)})
+
+        prefixo, _, sufixo = serializar({**envelope, chave: Bruto(_MARCA_LISTA)}).partition(_MARCA_LISTA)
+
+        def gerar():
+            try:
+                yield prefixo + b'[' + self._itens(primeiras)
+                while True:
+                    linhas = cursor.fetchmany(lote)
+                    if not linhas:
+                        break
+                    yield b',' + self._itens(linhas)
+                yield b']' + sufixo
+            finally:
+                if fechar:
+                    fechar()
+
+        return current_app.response_class(stream_with_context(gerar()), mimetype='application/json')
+
+    def objeto(self, r):
+        """Codifica uma única tupla como fragmento JSON (objeto)"""
+        if orjson is not None:
+            return Bruto(orjson.dumps(self.linha(r), default=str))
+        return Bruto(self.linha(r).encode())
+
+    def consultar(self, conn, sql, parametros=()):
+        """
+        Executa `sql` trocando {campos} pela lista de colunas deste codificador e
+        devolve as tuplas cruas (sem row factory)
+        """
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return cursor.execute(sql.format(campos=self.select), parametros)
@@ -0,0 +1,255 @@
+"""
+Servidor de produção do CONTRATO+ (waitress, multi-processo).
+
+O processo mestre abre o socket e faz fork de N workers; cada worker
+importa o app depois do fork, aquece conexões e templates e atende com
+um pool de threads do waitress (HTTP/1.1 com keep-alive).
+
+Sinais no mestre:
+    SIGHUP          recarrega: sobe workers novos (código relido do disco)
+                    e encerra os antigos com drenagem graciosa. O mestre
+                    não importa o app (`python app.py serve` despacha antes
+                    dos imports dele), então os módulos do app também são
+                    relidos; só servidor.py fica o do mestre
+    SIGTERM/SIGINT  encerra todos os workers com drenagem graciosa
+
+Uso:
+    python app.py serve --workers 4 --threads 8
+    python servidor.py --port 8000 --graceful-timeout 20
+"""
+import argparse
+import atexit
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+logger = logging.getLogger('contrato.servidor')
+
+
+def _env_int(nome, padrao):
+    return int(os.environ.get(nome, padrao))
+
+
+def _env_float(nome, padrao):
+    return float(os.environ.get(nome, padrao))
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='serve', description='Servidor WSGI de produção do CONTRATO+'
+    )
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=_env_int('PORT', 5000))
+    parser.add_argument('--app', default=os.environ.get('WEB_APP', 'app:create_app'),
+                        help='modulo:atributo do app WSGI ou da fábrica (padrão: app:create_app)')
+    parser.add_argument('--workers', type=int, default=_env_int('WEB_WORKERS', 2),
+                        help='processos worker (padrão: WEB_WORKERS ou 2)')
+    parser.add_argument('--threads', type=int, default=_env_int('WEB_THREADS', 8),
+                        help='threads por worker (padrão: WEB_THREADS ou 8)')
+    parser.add_argument('--keepalive', type=float, default=_env_float('WEB_KEEPALIVE', 30),
+                        help='segundos até fechar conexão keep-alive ociosa')
+    parser.add_argument('--graceful-timeout', type=float, default=_env_float('WEB_GRACEFUL_TIMEOUT', 30),
+                        help='tempo máximo de drenagem ao encerrar/recarregar um worker')
+    parser.add_argument('--connection-limit', type=int, default=_env_int('WEB_CONNECTION_LIMIT', 200),
+                        help='conexões simultâneas por worker')
+    parser.add_argument('--backlog', type=int, default=_env_int('WEB_BACKLOG', 1024))
+    return parser
+
+
+def carregar_app(spec):
+    """'modulo:atributo'; o atributo pode ser o app WSGI ou uma fábrica (ex.: app:create_app)"""
+    modulo_nome, _, atributo = spec.partition(':')
+    modulo = importlib.import_module(modulo_nome)
+    app = getattr(modulo, atributo or 'app')
+    if not hasattr(app, 'wsgi_app') and callable(app):
+        app = app()
+    return modulo, app
+
+
+def aquecer(modulo, app):
+    """Prepara o worker antes de aceitar conexões"""
+    inicio = time.perf_counter()
+
+    with app.app_context():
+        # Conexão e cache de páginas do SQLite (também inicializa o esquema, se preciso)
+        if hasattr(modulo, 'get_db_connection'):
+            conn = modulo.get_db_connection()
+            conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            conn.close()
+        # Primeira conexão do pool somente leitura
+        if hasattr(modulo, 'get_db_leitura'):
+            conn = modulo.get_db_leitura()
+            conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            conn.close()
+
+        # Roteador do werkzeug compila as regras no primeiro match
+        app.url_map.bind('localhost').match('/api/system/health')
+
+        # Ambiente Jinja e template de email (f-string grande, gera o código na primeira chamada)
+        app.jinja_env
+        if hasattr(modulo, 'criar_template_email'):
+            modulo.criar_template_email('aquecimento', 'aquecimento', '')
+
+    logger.info('Worker %s aquecido em %.1f ms', os.getpid(), (time.perf_counter() - inicio) * 1000)
+
+
+def _sair(codigo):
+    # os._exit pula o atexit; roda-o antes para esvaziar filas (ex.: logging assíncrono)
+    atexit._run_exitfuncs()
+    os._exit(codigo)
+
+
+def _drenar(servidor, prazo):
+    """Fecha conexões ociosas e sai quando não houver mais requisições em andamento"""
+    while time.monotonic() < prazo:
+        for canal in list(servidor.active_channels.values()):
+            if not canal.requests:
+                canal.will_close = True
+        servidor.pull_trigger()
+        if not servidor.active_channels:
+            break
+        time.sleep(0.05)
+    _sair(0)
+
+
+def rodar_worker(sock, opcoes):
+    from waitress import create_server
+
+    modulo, app = carregar_app(opcoes.app)
+    aquecer(modulo, app)
+
+    servidor = create_server(
+        app,
+        sockets=[sock],
+        threads=opcoes.threads,
+        channel_timeout=opcoes.keepalive,
+        connection_limit=opcoes.connection_limit,
+        backlog=opcoes.backlog,
+        ident='contrato-mais',
+    )
+
+    def encerrar(signum, frame):
+        # Para de aceitar conexões (o socket é compartilhado com os outros
+        # workers, então não é fechado aqui) e drena as existentes numa thread à parte
+        if servidor.accepting:
+            servidor.accepting = False
+            prazo = time.monotonic() + opcoes.graceful_timeout
+            threading.Thread(target=_drenar, args=(servidor, prazo), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, encerrar)
+    signal.signal(signal.SIGINT, encerrar)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    servidor.run()
+    _sair(0)
+
+
+class Mestre:
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+        self.workers = {}  # pid -> geração
+        self.geracao = 0
+        self.parando = False
+        self.recarregar = False
+
+    def abrir_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.opcoes.host, self.opcoes.port))
+        sock.listen(self.opcoes.backlog)
+        sock.setblocking(False)
+        return sock
+
+    def iniciar_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                rodar_worker(self.sock, self.opcoes)
+            except Exception:
+                logger.exception('Worker %s falhou', os.getpid())
+            finally:
+                os._exit(1)
+        self.workers[pid] = self.geracao
+        return pid
+
+    def sinalizar(self, pids, sinal):
+        for pid in pids:
+            try:
+                os.kill(pid, sinal)
+            except ProcessLookupError:
+                pass
+
+    def colher(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            geracao = self.workers.pop(pid, None)
+            if geracao == self.geracao and not self.parando:
+                logger.warning('Worker %s saiu (status %s), iniciando outro', pid, status)
+                time.sleep(0.5)
+                self.iniciar_worker()
+
+    def executar(self):
+        modulo_app = self.opcoes.app.partition(':')[0]
+        if modulo_app in sys.modules:
+            logger.warning('Módulo %s já importado no mestre: o SIGHUP não vai relê-lo do disco', modulo_app)
+        self.sock = self.abrir_socket()
+
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'recarregar', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'parando', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'parando', True))
+
+        logger.info('Mestre %s ouvindo em %s:%s com %s workers x %s threads',
+                    os.getpid(), self.opcoes.host, self.opcoes.port,
+                    self.opcoes.workers, self.opcoes.threads)
+        for _ in range(self.opcoes.workers):
+            self.iniciar_worker()
+
+        while not self.parando:
+            if self.recarregar:
+                self.recarregar = False
+                antigos = list(self.workers)
+                self.geracao += 1
+                logger.info('Recarregando: geração %s', self.geracao)
+                for _ in range(self.opcoes.workers):
+                    self.iniciar_worker()
+                self.sinalizar(antigos, signal.SIGTERM)
+            self.colher()
+            time.sleep(0.2)
+
+        logger.info('Encerrando workers')
+        self.sinalizar(list(self.workers), signal.SIGTERM)
+        prazo = time.monotonic() + self.opcoes.graceful_timeout + 5
+        while self.workers and time.monotonic() < prazo:
+            self.colher()
+            time.sleep(0.1)
+        self.sinalizar(list(self.workers), signal.SIGKILL)
+        self.sock.close()
+
+
+def main(argv=None):
+    opcoes = criar_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if not hasattr(os, 'fork'):
+        # Sem fork (Windows): um único processo waitress
+        from waitress import serve
+        modulo, app = carregar_app(opcoes.app)
+        aquecer(modulo, app)
+        serve(app, host=opcoes.host, port=opcoes.port, threads=opcoes.threads,
+              channel_timeout=opcoes.keepalive, connection_limit=opcoes.connection_limit)
+        return
+
+    Mestre(opcoes).executar()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,141 @@
+"""
+Vencimento dos contratos em segundo plano.
+
+Contratos 'ativo' com data_fim anterior a hoje passam a 'vencido' num único
+UPDATE por ciclo, pelo índice (status, data_fim). O UPDATE só pega contratos
+ainda ativos, então repetir o ciclo não muda nada. O trigger de UPDATE
+registra cada transição no log de mudanças (contrato_mudanca), e a
+sincronização incremental entrega os contratos vencidos aos clientes. Um
+contrato vencido cuja data_fim é renovada volta a 'ativo' na mesma escrita.
+
+Cada processo roda o ciclo, em cada banco do armazenamento, numa thread a cada
+VENCIMENTO_INTERVALO segundos e logo depois da meia-noite (hora local, a mesma
+do `hoje` do dashboard). Com isso as leituras filtram só por status.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+import metricas
+
+logger = logging.getLogger('contrato.vencimento')
+
+contratos_vencidos = metricas.REGISTRO.contador(
+    'contrato_vencimentos_total', 'Contratos que passaram de ativo para vencido', ())
+
+
+def vencer_contratos(conn, hoje):
+    """Tarefa do escritor: marca como vencidos os ativos com data_fim < hoje; devolve {usuario_id: n}"""
+    linhas = conn.execute('''
+        UPDATE contrato SET status = 'vencido', atualizado_em = CURRENT_TIMESTAMP
+        WHERE status = 'ativo' AND data_fim < ?
+        RETURNING usuario_id
+    ''', (hoje,)).fetchall()
+    return dict(Counter(usuario_id for (usuario_id,) in linhas))
+
+
+def vencer_contrato(conn, contrato_id, hoje):
+    """Dentro de outra tarefa de escrita: contrato criado ou alterado já vencido não espera o ciclo"""
+    return conn.execute('''
+        UPDATE contrato SET status = 'vencido'
+        WHERE id = ? AND status = 'ativo' AND data_fim < ?
+    ''', (contrato_id, hoje)).rowcount
+
+
+def reativar_contrato(conn, contrato_id, hoje):
+    """Dentro de outra tarefa de escrita: contrato vencido renovado (data_fim >= hoje) volta a ativo"""
+    return conn.execute('''
+        UPDATE contrato SET status = 'ativo'
+        WHERE id = ? AND status = 'vencido' AND data_fim >= ?
+    ''', (contrato_id, hoje)).rowcount
+
+
+class Vencimentos:
+    """Extensão Flask: mantém o status dos contratos vencidos em dia"""
+
+    def __init__(self, escrever, app=None):
+        self.escrever = escrever
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._contadores = {'ciclos': 0, 'vencidos': 0, 'usuarios': 0, 'erros': 0}
+        self._ultimo_ciclo = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('VENCIMENTO_ATIVO', True)
+        app.config.setdefault('VENCIMENTO_INTERVALO', 3600)
+        app.before_request(self._agendar)
+        app.extensions['vencimentos'] = self
+
+    # ========== CICLO ==========
+    def ciclo(self, hoje=None):
+        """Vence os contratos de uma vez e devolve as contagens; precisa do app context"""
+        hoje = hoje or datetime.now().strftime('%Y-%m-%d')
+        try:
+            por_usuario = self.escrever(vencer_contratos, hoje)
+        except Exception:
+            with self._lock:
+                self._contadores['erros'] += 1
+            raise
+        total = sum(por_usuario.values())
+        contratos_vencidos.inc(valor=total)
+        with self._lock:
+            self._contadores['ciclos'] += 1
+            self._contadores['vencidos'] += total
+            self._contadores['usuarios'] += len(por_usuario)
+            self._ultimo_ciclo = time.time()
+        return {'vencidos': total, 'usuarios': len(por_usuario)}
+
+    def _agendar(self):
+        if not current_app.config['VENCIMENTO_ATIVO']:
+            return
+        caminho = current_app.config['DATABASE']
+        if caminho in self._threads and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads não sobrevivem ao fork: cada worker agenda a sua
+                self._threads = {}
+                self._pid = os.getpid()
+            if caminho in self._threads:
+                return
+            thread = threading.Thread(target=self._rodar, args=(current_app._get_current_object(),),
+                                      name='vencimento', daemon=True)
+            self._threads[caminho] = thread
+        thread.start()
+
+    def _rodar(self, app):
+        # Espera inicial curta e aleatória: os workers não disputam o escritor ao mesmo tempo
+        time.sleep(random.uniform(0, 5))
+        while True:
+            with app.app_context():
+                for caminho in app.extensions['armazenamento'].em_cada_banco():
+                    try:
+                        resultado = self.ciclo()
+                        if resultado['vencidos']:
+                            logger.info('Vencimento em %(banco)s: %(vencidos)d contratos vencidos de %(usuarios)d usuários',
+                                        {**resultado, 'banco': caminho})
+                    except Exception as e:
+                        logger.error(f'Erro no ciclo de vencimento em {caminho}: {e}')
+            time.sleep(self._espera(app.config['VENCIMENTO_INTERVALO']))
+
+    @staticmethod
+    def _espera(intervalo):
+        """Segundos até o próximo ciclo: o intervalo ou a virada do dia, o que vier antes"""
+        agora = datetime.now()
+        meia_noite = datetime.combine(agora.date() + timedelta(days=1), datetime.min.time())
+        return max(1, min(intervalo, (meia_noite - agora).total_seconds() + random.uniform(1, 30)))
+
+    def metricas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados['ultimo_ciclo'] = self._ultimo_ciclo
+        return dados